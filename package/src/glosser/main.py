@@ -1,10 +1,17 @@
 import re
 import time
 import json
+import asyncio
 import pymupdf
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePath
-from typing import Callable, Optional, Union
+from typing import Callable, Optional, Tuple, Union
 from .services import parser, pdf_transform, definitions
+from .services.layout import DocumentLayout, MUPDF_LOCK, register_layout
+from .services.cache import get_cache, stats_delta
+from .services.context import get_document_prefix, get_token_index, occurrence_context
+from .services.scheduling import AdaptiveLimiter, BatchController, gather_limited
+from .services.structured import parse_stats, parse_stats_delta
 from .services.visual_design import ConfidenceVisualizer
 
 
@@ -17,6 +24,546 @@ def _source_to_confidence(source: str) -> str:
     return "LOW"
 
 
+async def _resolve_symbol(sym_text: str, context: str, pdf_path: str, groq_api_key: Optional[str], use_local_llm: bool,
+                          limiter: Optional[AdaptiveLimiter] = None, use_cache: Optional[bool] = None,
+                          stream: Optional[bool] = None) -> Optional[dict]:
+    """Meaning of one unique symbol, or None when it should not be annotated."""
+    # One model call for this symbol; batch_lookups uses _resolve_symbols_batched instead
+    res = await definitions.afind_symbol_meaning(
+        sym_text,
+        context,
+        pdf_path=pdf_path,
+        groq_api_key=groq_api_key,
+        use_local_llm=use_local_llm,
+        limiter=limiter,
+        use_cache=use_cache,
+        stream=stream,
+    )
+    return _symbol_result(res)
+
+
+def _symbol_result(res: Optional[dict]) -> Optional[dict]:
+    if res and res.get("meaning") not in ["NOT_FOUND", None, ""]:
+        source = res.get("source", "inferred")
+        # Bypass critique — map source directly to confidence
+        res["confidence"] = _source_to_confidence(source)
+        return res
+    return None
+
+
+async def _resolve_symbols_batched(contexts: dict, pdf_path: str, groq_api_key: Optional[str], use_local_llm: bool,
+                                   limiter: AdaptiveLimiter, controller: BatchController,
+                                   use_cache: Optional[bool] = None, stream: Optional[bool] = None,
+                                   on_done: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Meanings of many unique symbols through adaptive batched calls, keyed by symbol."""
+    # Local context only, as in _resolve_symbol; pdf_path only selects the document session
+    results = await definitions.afind_symbol_meaning_batch(
+        list(contexts.items()),
+        groq_api_key=groq_api_key,
+        use_local_llm=use_local_llm,
+        limiter=limiter,
+        controller=controller,
+        on_done=on_done,
+        session_path=pdf_path,
+        use_cache=use_cache,
+        stream=stream,
+    )
+    return {sym_text: _symbol_result(results.get(sym_text)) for sym_text in contexts}
+
+
+def _symbol_contexts(symbols: list, layout: DocumentLayout, mode: str) -> dict:
+    """
+    Prompt context per unique symbol, in first-seen order. "block" uses the
+    text around the first occurrence; "occurrences" packs token windows around
+    the first few occurrences (see services.context).
+    """
+    if mode == "occurrences":
+        by_symbol: dict = {}
+        for sym in symbols:
+            by_symbol.setdefault(sym["text"], []).append(sym)
+        index = get_token_index(layout)
+        return {sym_text: occurrence_context(index, sym_text, occs) for sym_text, occs in by_symbol.items()}
+    if mode != "block":
+        raise ValueError(f"Unknown symbol context mode '{mode}' (expected 'block' or 'occurrences')")
+    # First occurrence wins
+    contexts: dict = {}
+    for sym in symbols:
+        if sym["text"] not in contexts:
+            contexts[sym["text"]] = sym.get("context", "")
+    return contexts
+
+
+async def _resolve_abbreviation(abbr_text: str, pdf_path: str, groq_api_key: Optional[str], use_local_llm: bool,
+                                limiter: Optional[AdaptiveLimiter] = None, use_cache: Optional[bool] = None,
+                                stream: Optional[bool] = None) -> Optional[dict]:
+    """Full form of one unique abbreviation, or None when it should not be annotated."""
+    res = await definitions.afind_full_form(
+        abbr_text,
+        pdf_path=pdf_path,
+        groq_api_key=groq_api_key,
+        use_local_llm=use_local_llm,
+        limiter=limiter,
+        use_cache=use_cache,
+        stream=stream,
+    )
+    return _abbreviation_result(res)
+
+
+def _abbreviation_result(res: Optional[dict]) -> Optional[dict]:
+    if res and res.get("ans") not in ["NOT_FOUND", None, ""]:
+        source = "extracted" if not res.get("using_llm") else "inferred"
+        res["confidence"] = "HIGH" if source == "extracted" else "MEDIUM"
+        return res
+    return None
+
+
+async def _resolve_abbreviations_batched(abbrs: list, pdf_path: str, groq_api_key: Optional[str], use_local_llm: bool,
+                                         limiter: AdaptiveLimiter, controller: BatchController,
+                                         use_cache: Optional[bool] = None, stream: Optional[bool] = None,
+                                         on_done: Optional[Callable[[int, int], None]] = None) -> dict:
+    """Full forms of many unique abbreviations through adaptive batched calls, keyed by abbreviation."""
+    results = await definitions.afind_full_form_batch(
+        abbrs,
+        pdf_path,
+        groq_api_key=groq_api_key,
+        use_local_llm=use_local_llm,
+        limiter=limiter,
+        controller=controller,
+        on_done=on_done,
+        use_cache=use_cache,
+        stream=stream,
+    )
+    return {abbr_text: _abbreviation_result(results.get(abbr_text)) for abbr_text in abbrs}
+
+
+def _reference_key(ref: dict) -> Tuple[str, Optional[Union[int, str]]]:
+    """(references DB section, key) a citation is looked up under."""
+    if ref.get("format_type", "NUMERIC_BRACKET") == "NUMERIC_BRACKET":
+        return "numeric", ref.get("number")
+    author_key = ref.get("author_key")
+    year = ref.get("year")
+    return "author_year", f"{author_key}_{year}" if author_key and year else None
+
+
+def _lookup_reference(refs_db, section: str, key) -> Optional[dict]:
+    if section == "author_year" and not key:
+        return None
+    return refs_db.get(section, {}).get(key)
+
+
+def _reference_info(ref: dict, section: str, looked_up: Optional[dict]) -> Optional[dict]:
+    if not looked_up and section == "author_year" and ref.get("year"):
+        return {"title": None, "year": ref.get("year")}
+    return looked_up
+
+
+def _count_confidence(log: dict, confidence: str) -> None:
+    if confidence == "HIGH":
+        log["annotated_green"] += 1
+    elif confidence == "MEDIUM":
+        log["annotated_orange"] += 1
+    else:
+        log["annotated_red"] += 1
+
+
+class _MarginRenderer:
+    """
+    Writes margin notes into the scaled document, one candidate at a time.
+
+    Candidates must be fed in detection order (symbols, then abbreviations,
+    then citations); placement depends on what is already in the margin, so
+    both the sequential and the pipelined modes go through this single writer.
+    """
+
+    def __init__(self, doc: pymupdf.Document, scaling: float, original_bboxes, ann_data: dict,
+                 syms_log: dict, abbs_log: dict, refs_log: dict):
+        self.doc = doc
+        self.scaling = scaling
+        self.original_bboxes = original_bboxes
+        self.ann_data = ann_data
+        self.syms_log = syms_log
+        self.abbs_log = abbs_log
+        self.refs_log = refs_log
+        self.processed = 0
+        self._sym_added_pages: dict = {}
+        self._abbr_last_annotated_page: dict = {}
+        self._cited_refs: set = set()
+
+    def symbol(self, sym: dict, res: Optional[dict]) -> None:
+        sym_text = sym["text"]
+        page = sym.get("page")
+        added_pages = self._sym_added_pages.setdefault(sym_text, set())
+        if res is None:
+            return
+
+        meaning = res.get("meaning")
+        desc = res.get("description")
+        confidence = res.get("confidence", "MEDIUM")
+        if not meaning or meaning == "NOT_FOUND" or page in added_pages:
+            return
+
+        location_data = {
+            "page": page,
+            "column": sym.get("column"),
+            "bbox": sym.get("bbox"),
+        }
+        placed = pdf_transform.add_symbol_definition_to_margin(
+            doc=self.doc,
+            scaling_factor=self.scaling,
+            symbol=sym_text,
+            meaning=meaning,
+            description=desc,
+            original_location=location_data,
+            original_content_bboxes=self.original_bboxes,
+            confidence=confidence,
+        )
+        if placed:
+            self.processed += 1
+            added_pages.add(page)
+            self.syms_log["annotated_count"] += 1
+            _count_confidence(self.syms_log, confidence)
+            self.ann_data["symbols"].append({
+                "text": sym_text,
+                "meaning": meaning,
+                "definition": f"{meaning}: {desc}" if desc and desc not in ("NOT_FOUND", "none") else meaning,
+                "page": page,
+                "confidence": confidence,
+            })
+
+    def abbreviation(self, abbr: dict, res: Optional[dict]) -> None:
+        abbr_text = abbr["text"]
+        page = abbr.get("page")
+        if res is None:
+            return
+
+        last_page = self._abbr_last_annotated_page.get(abbr_text)
+        if last_page is not None and (page - last_page) <= 5:
+            return
+
+        definition = res.get("ans")
+        confidence = res.get("confidence", "MEDIUM")
+        if not definition or definition == "NOT_FOUND":
+            return
+
+        if last_page is None:
+            context = abbr.get("context", "")
+            if re.search(rf'\({re.escape(abbr_text)}\)', context):
+                self._abbr_last_annotated_page[abbr_text] = page
+                return
+
+        location_data = {
+            "page": page,
+            "column": abbr.get("column"),
+            "bbox": abbr.get("bbox"),
+        }
+        placed = pdf_transform.add_definition_to_margin(
+            doc=self.doc,
+            scaling_factor=self.scaling,
+            main_word=abbr_text,
+            definition=definition,
+            original_location=location_data,
+            original_content_bboxes=self.original_bboxes,
+            confidence=confidence,
+        )
+        if placed:
+            self.processed += 1
+            self._abbr_last_annotated_page[abbr_text] = page
+            self.abbs_log["annotated_count"] += 1
+            _count_confidence(self.abbs_log, confidence)
+            self.ann_data["abbreviations"].append({
+                "text": abbr_text,
+                "definition": definition,
+                "page": page,
+                "confidence": confidence,
+            })
+
+    def reference(self, ref: dict, ref_key, ref_info: Optional[dict]) -> None:
+        if ref_key in self._cited_refs:
+            return
+
+        definition = None
+        if ref_info:
+            title = ref_info.get("title")
+            year = ref_info.get("year")
+            if title and title != "NOT_FOUND" and year and year != "NOT_FOUND":
+                definition = f"{title} ({year})".strip()
+        if not definition:
+            return
+
+        location_data = {"page": ref["page"], "column": ref["column"], "bbox": ref["bbox"]}
+        placed = pdf_transform.add_definition_to_margin(
+            doc=self.doc,
+            scaling_factor=self.scaling,
+            main_word=f"{ref['text']}",
+            definition=definition,
+            original_location=location_data,
+            original_content_bboxes=self.original_bboxes,
+        )
+        if placed:
+            self._cited_refs.add(ref_key)
+            self.processed += 1
+            self.refs_log["annotated_count"] += 1
+            self.ann_data["citations"].append({
+                "text": ref["text"],
+                "definition": definition,
+                "page": ref["page"],
+                "confidence": "HIGH",
+            })
+
+
+def _locked(fn, *args, **kwargs):
+    with MUPDF_LOCK:
+        return fn(*args, **kwargs)
+
+
+async def _run_pipeline(
+    original_doc: pymupdf.Document,
+    layout: DocumentLayout,
+    renderer: _MarginRenderer,
+    pdf_path: str,
+    groq_api_key: Optional[str],
+    use_local_llm: bool,
+    find_symbols: bool,
+    find_abbreviation: bool,
+    find_references: bool,
+    lazy_references: bool,
+    symbol_context: str,
+    resolve_workers: int,
+    limiter: AdaptiveLimiter,
+    symbol_batches: Optional[BatchController],
+    abbreviation_batches: Optional[BatchController],
+    progress: Callable[[str, int, int], None],
+    use_cache: Optional[bool] = None,
+    stream: Optional[bool] = None,
+) -> dict:
+    """
+    page scanner -> candidate dedupe -> resolver workers -> margin renderer.
+
+    The scanner walks the document page by page (`parser.iter_page_candidates`)
+    and submits each unique term for resolution as soon as it is known: a
+    symbol the first time it is seen, an abbreviation on its second
+    occurrence. With "occurrences" symbol contexts, which need the whole
+    document's token index, symbols are submitted once the scan finishes.
+    `resolve_workers` resolver tasks run the lookups (model calls through
+    `limiter`, reference lookups on their own threads) while the single
+    renderer awaits each candidate's result in detection order, so the margin
+    ends up exactly as in the sequential mode. With a batch controller, new
+    symbols (or abbreviations) are held back until a batch's worth has
+    accumulated and then go to the resolvers as one group. A candidate whose
+    lookup or rendering fails is skipped and counted as a render failure.
+    Returns the references DB (or None) for logging.
+    """
+    loop = asyncio.get_running_loop()
+    resolve_queue: asyncio.Queue = asyncio.Queue()
+    render_queue: asyncio.Queue = asyncio.Queue()
+    resolved: dict = {}
+    requested: set = set()
+    submitted: dict = {}
+    completed: dict = {}
+    queued: dict = {}
+    pending: dict = {"symbol": [], "abbreviation": []}
+    contexts: dict = {}
+    state: dict = {"refs_db": None}
+    executor = ThreadPoolExecutor(max_workers=resolve_workers, thread_name_prefix="glosser-resolve")
+    logs = {"symbol": renderer.syms_log, "abbreviation": renderer.abbs_log, "reference": renderer.refs_log}
+
+    resolve_steps = {
+        "symbol": "Extracting symbol meanings",
+        "abbreviation": "Looking up full forms",
+        "reference": "Resolving references",
+    }
+    render_steps = {
+        "symbol": "Annotating symbols",
+        "abbreviation": "Annotating abbreviations",
+        "reference": "Annotating references",
+    }
+
+    def _future(kind: str, key) -> asyncio.Future:
+        # Created by whichever comes first: the lookup or the candidate's render
+        if (kind, key) not in resolved:
+            resolved[(kind, key)] = loop.create_future()
+        return resolved[(kind, key)]
+
+    def _submit(kind: str, key, fn, *args) -> None:
+        if (kind, key) in requested:
+            return
+        requested.add((kind, key))
+        _future(kind, key)
+        submitted[kind] = submitted.get(kind, 0) + 1
+        resolve_queue.put_nowait((kind, [key], fn, args, False))
+
+    def _submit_group(kind: str, keys: list, fn, *args) -> None:
+        # `fn` resolves every key in one go and returns {key: result}
+        for key in keys:
+            requested.add((kind, key))
+            _future(kind, key)
+        submitted[kind] = submitted.get(kind, 0) + len(keys)
+        resolve_queue.put_nowait((kind, keys, fn, args, True))
+
+    def _queue_render(kind: str, key, candidate: dict) -> None:
+        _future(kind, key)
+        queued[kind] = queued.get(kind, 0) + 1
+        render_queue.put_nowait((kind, (kind, key), candidate))
+
+    async def _flush(kind: str, final: bool = False) -> None:
+        # Submit the terms held in `pending`; batched kinds wait for a full batch until `final`
+        keys = pending[kind]
+        controller = symbol_batches if kind == "symbol" else abbreviation_batches
+        if not keys or (controller is not None and not final and len(keys) < controller.next_size()):
+            return
+        pending[kind] = []
+        if kind == "symbol":
+            if controller is not None:
+                _submit_group(kind, keys, _resolve_symbols_batched, {key: contexts[key] for key in keys},
+                              pdf_path, groq_api_key, use_local_llm, limiter, controller, use_cache, stream)
+                return
+            for key in keys:
+                _submit(kind, key, _resolve_symbol,
+                        key, contexts[key], pdf_path, groq_api_key, use_local_llm, limiter, use_cache, stream)
+            return
+        await asyncio.to_thread(definitions.prefetch_full_form_contexts, keys, pdf_path, groq_api_key)
+        if controller is not None:
+            _submit_group(kind, keys, _resolve_abbreviations_batched,
+                          keys, pdf_path, groq_api_key, use_local_llm, limiter, controller, use_cache, stream)
+            return
+        for key in keys:
+            _submit(kind, key, _resolve_abbreviation,
+                    key, pdf_path, groq_api_key, use_local_llm, limiter, use_cache, stream)
+
+    async def _scan():
+        try:
+            if find_symbols and symbol_context not in ("block", "occurrences"):
+                raise ValueError(f"Unknown symbol context mode '{symbol_context}' (expected 'block' or 'occurrences')")
+            symbols: list = []
+            abbs: list = []
+            abbr_counts: dict = {}
+            if find_symbols or find_abbreviation:
+                ocr_cache = get_cache("latex_ocr")
+                ocr_cache_before = ocr_cache.stats()
+                num_pages = len(original_doc)
+                pages = parser.iter_page_candidates(original_doc, layout=layout, symbols=find_symbols)
+                while True:
+                    page = await asyncio.to_thread(_locked, next, pages, None)
+                    if page is None:
+                        break
+                    page_idx, found = page
+                    progress("Scanning pages", page_idx + 1, num_pages)
+                    if find_symbols:
+                        for sym in found["symbols"]:
+                            symbols.append(sym)
+                            if symbol_context == "block" and sym["text"] not in contexts:
+                                # First occurrence wins, as in _symbol_contexts
+                                contexts[sym["text"]] = sym.get("context", "")
+                                pending["symbol"].append(sym["text"])
+                            _queue_render("symbol", sym["text"], sym)
+                        await _flush("symbol")
+                    if find_abbreviation:
+                        for abbr in found["abbreviations"]:
+                            abbs.append(abbr)
+                            abbr_counts[abbr["text"]] = abbr_counts.get(abbr["text"], 0) + 1
+                            # Only abbreviations seen at least twice are worth a lookup
+                            if abbr_counts[abbr["text"]] == 2:
+                                pending["abbreviation"].append(abbr["text"])
+                        await _flush("abbreviation")
+
+                if find_symbols:
+                    ocr_cache_run = stats_delta(ocr_cache_before, ocr_cache.stats())
+                    renderer.syms_log["ocr_cache_hits"] = ocr_cache_run["hits"]
+                    renderer.syms_log["ocr_cache_misses"] = ocr_cache_run["misses"]
+                    renderer.syms_log["found_total"] = len(symbols)
+                    if symbol_context == "occurrences":
+                        contexts.update(await asyncio.to_thread(_locked, _symbol_contexts, symbols, layout, symbol_context))
+                        pending["symbol"] = list(contexts)
+                    await _flush("symbol", final=True)
+
+                if find_abbreviation:
+                    renderer.abbs_log["found_total"] = len(abbs)
+                    await _flush("abbreviation", final=True)
+                    # Rendered after every symbol, like the sequential mode
+                    for abbr in abbs:
+                        if abbr_counts[abbr["text"]] >= 2:
+                            _queue_render("abbreviation", abbr["text"], abbr)
+
+            if find_references:
+                # Takes MUPDF_LOCK itself, only while reading the document
+                refs_db = await asyncio.to_thread(
+                    parser.build_references_db, original_doc, groq_api_key,
+                    use_local_llm=use_local_llm,
+                    progress_callback=lambda d, t: progress("Building references database", d, t),
+                    layout=layout,
+                    lazy=lazy_references,
+                    use_cache=use_cache,
+                    stream=stream,
+                )
+                state["refs_db"] = refs_db
+                refs = await asyncio.to_thread(_locked, parser.find_references, original_doc, layout=layout)
+                renderer.refs_log["found_total"] = len(refs)
+                for ref in refs:
+                    section, key = _reference_key(ref)
+                    _submit("reference", (section, key), _lookup_reference, refs_db, section, key)
+                    _queue_render("reference", (section, key), ref)
+        finally:
+            render_queue.put_nowait(None)
+            for _ in range(resolve_workers):
+                resolve_queue.put_nowait(None)
+
+    async def _resolve():
+        while True:
+            item = await resolve_queue.get()
+            if item is None:
+                return
+            kind, keys, fn, args, grouped = item
+            try:
+                if grouped:
+                    results = await fn(*args)
+                elif asyncio.iscoroutinefunction(fn):
+                    results = {keys[0]: await fn(*args)}
+                else:
+                    results = {keys[0]: await loop.run_in_executor(executor, fn, *args)}
+                for key in keys:
+                    resolved[(kind, key)].set_result(results.get(key))
+            except Exception as e:
+                for key in keys:
+                    if not resolved[(kind, key)].done():
+                        resolved[(kind, key)].set_exception(e)
+            completed[kind] = completed.get(kind, 0) + len(keys)
+            progress(resolve_steps[kind], completed[kind], submitted[kind])
+
+    async def _render():
+        rendered: dict = {}
+        while True:
+            item = await render_queue.get()
+            if item is None:
+                return
+            kind, resolve_key, candidate = item
+            try:
+                res = await resolved[resolve_key]
+                if kind == "symbol":
+                    await asyncio.to_thread(_locked, renderer.symbol, candidate, res)
+                elif kind == "abbreviation":
+                    await asyncio.to_thread(_locked, renderer.abbreviation, candidate, res)
+                else:
+                    section, ref_key = resolve_key[1]
+                    ref_info = _reference_info(candidate, section, res)
+                    await asyncio.to_thread(_locked, renderer.reference, candidate, ref_key, ref_info)
+            except Exception as e:
+                # One bad candidate must not cost the rest of the document its annotations
+                print(f"Skipping {kind} '{candidate.get('text')}' on page {candidate.get('page')}: {e}")
+                logs[kind]["render_failures"] = logs[kind].get("render_failures", 0) + 1
+            rendered[kind] = rendered.get(kind, 0) + 1
+            progress(render_steps[kind], rendered[kind], queued[kind])
+
+    tasks = [asyncio.create_task(_scan()), asyncio.create_task(_render())]
+    tasks += [asyncio.create_task(_resolve()) for _ in range(resolve_workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False)
+    return state["refs_db"]
+
+
 async def annotate(
     path,
     out_path: Optional[Union[Path, str]] = None,
@@ -27,10 +574,40 @@ async def annotate(
     find_abbreviation: bool = True,
     find_symbols: bool = True,
     progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    parse_workers: int = 1,
+    lazy_references: bool = False,
+    symbol_context: str = "block",
+    llm_cache: Optional[bool] = None,
+    pipeline: bool = False,
+    resolve_workers: int = 4,
+    llm_concurrency: int = 4,
+    batch_lookups: bool = False,
+    llm_stream: Optional[bool] = None,
+    document_session: bool = False,
 ):
     """
     Annotate a PDF with citation titles and abbreviation/symbol full-forms.
 
+    `parse_workers` > 1 scans page ranges in that many worker processes.
+    `lazy_references` resolves only cited bibliography entries, on first use,
+    instead of every entry up front.
+    `symbol_context` is "block" (text around the first occurrence) or
+    "occurrences" (windows around the first few occurrences, token-budgeted).
+    `llm_cache` False bypasses the on-disk LLM response cache for this run
+    (None keeps the GLOSSER_LLM_CACHE setting).
+    `pipeline` overlaps scanning, lookups (`resolve_workers` at a time) and
+    margin rendering; the output is identical to the default phased mode.
+    `llm_concurrency` caps concurrent model calls for symbol/abbreviation
+    lookups; the cap shrinks while response latency climbs and recovers after.
+    `batch_lookups` resolves several terms per model call, with batch sizes
+    adapted to latency, prompt size and parse failures.
+    `llm_stream` False makes the local model finish each response instead of
+    stopping at the end of its JSON answer (None keeps GLOSSER_LLM_STREAM).
+    `document_session` starts every local symbol/abbreviation prompt with the
+    same document prefix (title, abstract, notation) and keeps the model
+    loaded, so Ollama can reuse the evaluated prefix between lookups; those
+    lookups are not streamed, so their prompt tokens can be counted.
+
     Returns [out_path, processed_count, log] where log contains detailed
     timing metrics and annotation counts per category.
     """
@@ -40,7 +617,6 @@ async def annotate(
             progress_callback(step, done, total)
 
     dest = PurePath(path)
-    processed = 0
     _ann_data: dict = {"citations": [], "abbreviations": [], "symbols": []}
 
     # ── Timing accumulators ──────────────────────────────────────────────────
@@ -60,8 +636,32 @@ async def annotate(
     syms_log = {"found_total": 0, "annotated_count": 0, "annotated_green": 0,
                 "annotated_orange": 0, "annotated_red": 0}
 
+    llm_cache_before = definitions.llm_cache_stats()
+    parse_before = parse_stats()
+    tokens_before = definitions.llm_token_stats()
+    # One Ollama connection pool for every async lookup of this run
+    ollama_client = definitions.open_async_client() if use_local_llm else None
+
     try:
         original_doc = pymupdf.open(str(dest))
+        # One text extraction per page, shared by every detector below.
+        layout = DocumentLayout(original_doc)
+        register_layout(str(dest), layout)
+        session = None
+        if document_session and use_local_llm:
+            with MUPDF_LOCK:
+                prefix = get_document_prefix(layout)
+            if prefix:
+                session = definitions.open_session(str(dest), prefix)
+
+        if parse_workers > 1 and (find_symbols or find_abbreviation or find_references):
+            parser.scan_candidates(
+                original_doc,
+                progress_callback=lambda d, t: _progress("Scanning pages", d, t),
+                layout=layout,
+                workers=parse_workers,
+            )
+            _progress("Scanning pages", 1, 1)
 
         # ── Scale ────────────────────────────────────────────────────────────
         t0 = time.perf_counter()
@@ -69,128 +669,98 @@ async def annotate(
             original_doc,
             scaling,
             progress_callback=lambda d, t: _progress("Scaling PDF pages", d, t),
+            layout=layout,
         )
         _progress("Scaling PDF pages", 1, 1)
         step_times["scaling_seconds"] = round(time.perf_counter() - t0, 3)
 
+        renderer = _MarginRenderer(scaled_doc, scaling, original_bboxes, _ann_data, syms_log, abbs_log, refs_log)
+        limiter = AdaptiveLimiter(max_limit=max(1, llm_concurrency))
+        symbol_batches = BatchController(initial=8, max_size=16) if batch_lookups else None
+        abbreviation_batches = BatchController(initial=10, max_size=20) if batch_lookups else None
+        refs_db = None
+        bib_cache = get_cache("bibliography")
+        bib_cache_before = bib_cache.stats()
+
+        if pipeline:
+            # ── Symbols, abbreviations and references, overlapped ──────────────
+            t0 = time.perf_counter()
+            refs_db = await _run_pipeline(
+                original_doc,
+                layout,
+                renderer,
+                str(dest),
+                GROQ_API_KEY,
+                use_local_llm,
+                find_symbols,
+                find_abbreviation,
+                find_references,
+                lazy_references,
+                symbol_context,
+                max(1, resolve_workers),
+                limiter,
+                symbol_batches,
+                abbreviation_batches,
+                _progress,
+                use_cache=llm_cache,
+                stream=llm_stream,
+            )
+            step_times["pipeline_seconds"] = round(time.perf_counter() - t0, 3)
+
         # ── Symbols ───────────────────────────────────────────────────────────
-        if find_symbols:
+        if find_symbols and not pipeline:
             t0 = time.perf_counter()
+            ocr_cache = get_cache("latex_ocr")
+            ocr_cache_before = ocr_cache.stats()
 
             symbols = parser.find_symbols(
                 original_doc,
                 progress_callback=lambda d, t: _progress("Scanning for symbols", d, t),
+                layout=layout,
             )
+            ocr_cache_run = stats_delta(ocr_cache_before, ocr_cache.stats())
+            syms_log["ocr_cache_hits"] = ocr_cache_run["hits"]
+            syms_log["ocr_cache_misses"] = ocr_cache_run["misses"]
             _progress("Scanning for symbols", 1, 1)
             syms_log["found_total"] = len(symbols)
 
-            initial_sym_counts: dict = {}
-            for sym in symbols:
-                sym_text = sym["text"]
-                initial_sym_counts[sym_text] = initial_sym_counts.get(sym_text, 0) + 1
-
-            # Build per-symbol context lookup (first occurrence wins)
-            sym_context_map: dict = {}
-            for sym in symbols:
-                sym_text = sym["text"]
-                if sym_text not in sym_context_map:
-                    sym_context_map[sym_text] = sym.get("context", "")
+            sym_context_map = _symbol_contexts(symbols, layout, symbol_context)
 
-            unique_syms = list(initial_sym_counts.keys())
-            sym_meaning_map: dict = {}
+            unique_syms = list(sym_context_map.keys())
             _progress("Extracting symbol meanings", 0, len(unique_syms))
 
-            for i, sym_text in enumerate(unique_syms):
-                context = sym_context_map.get(sym_text, "")
-                # Strictly individual inference — no batch calls
-                res = definitions.find_symbol_meaning(
-                    sym_text,
-                    context,
-                    pdf_path=str(dest),
-                    groq_api_key=GROQ_API_KEY,
-                    use_local_llm=use_local_llm,
+            if symbol_batches is not None:
+                sym_meaning_map = await _resolve_symbols_batched(
+                    sym_context_map, str(dest), GROQ_API_KEY, use_local_llm, limiter, symbol_batches,
+                    use_cache=llm_cache, stream=llm_stream,
+                    on_done=lambda d, t: _progress("Extracting symbol meanings", d, t),
                 )
-                if res and res.get("meaning") not in ["NOT_FOUND", None, ""]:
-                    source = res.get("source", "inferred")
-                    # Bypass critique — map source directly to confidence
-                    confidence = _source_to_confidence(source)
-                    res["confidence"] = confidence
-                    sym_meaning_map[sym_text] = res
-
-                _progress("Extracting symbol meanings", i + 1, len(unique_syms))
+            else:
+                meanings = await gather_limited(
+                    lambda sym_text: _resolve_symbol(
+                        sym_text, sym_context_map[sym_text], str(dest), GROQ_API_KEY, use_local_llm, limiter,
+                        use_cache=llm_cache, stream=llm_stream,
+                    ),
+                    unique_syms,
+                    on_done=lambda d, t: _progress("Extracting symbol meanings", d, t),
+                )
+                sym_meaning_map = dict(zip(unique_syms, meanings))
 
-            sym_occurrence_count: dict = {}
-            sym_added_pages: dict = {}
             total_symbols = len(symbols)
-
             for i, sym in enumerate(symbols):
-                sym_text = sym["text"]
-                page = sym.get("page")
-                sym_occurrence_count[sym_text] = sym_occurrence_count.get(sym_text, 0) + 1
-
-                if sym_text not in sym_added_pages:
-                    sym_added_pages[sym_text] = set()
-
-                if sym_text not in sym_meaning_map:
-                    _progress("Annotating symbols", i + 1, total_symbols or 1)
-                    continue
-
-                meaning = sym_meaning_map[sym_text].get("meaning")
-                desc = sym_meaning_map[sym_text].get("description")
-                confidence = sym_meaning_map[sym_text].get("confidence", "MEDIUM")
-
-                if not meaning or meaning == "NOT_FOUND":
-                    _progress("Annotating symbols", i + 1, total_symbols or 1)
-                    continue
-
-                if page in sym_added_pages[sym_text]:
-                    _progress("Annotating symbols", i + 1, total_symbols or 1)
-                    continue
-
-                location_data = {
-                    "page": page,
-                    "column": sym.get("column"),
-                    "bbox": sym.get("bbox"),
-                }
-                placed = pdf_transform.add_symbol_definition_to_margin(
-                    doc=scaled_doc,
-                    scaling_factor=scaling,
-                    symbol=sym_text,
-                    meaning=meaning,
-                    description=desc,
-                    original_location=location_data,
-                    original_content_bboxes=original_bboxes,
-                    confidence=confidence,
-                )
-                if placed:
-                    processed += 1
-                    sym_added_pages[sym_text].add(page)
-                    syms_log["annotated_count"] += 1
-                    if confidence == "HIGH":
-                        syms_log["annotated_green"] += 1
-                    elif confidence == "MEDIUM":
-                        syms_log["annotated_orange"] += 1
-                    else:
-                        syms_log["annotated_red"] += 1
-                    _ann_data["symbols"].append({
-                        "text": sym_text,
-                        "meaning": meaning,
-                        "definition": f"{meaning}: {desc}" if desc and desc not in ("NOT_FOUND", "none") else meaning,
-                        "page": page,
-                        "confidence": confidence,
-                    })
-
+                renderer.symbol(sym, sym_meaning_map.get(sym["text"]))
                 _progress("Annotating symbols", i + 1, total_symbols or 1)
 
             step_times["symbols_seconds"] = round(time.perf_counter() - t0, 3)
 
         # ── Abbreviations ─────────────────────────────────────────────────────
-        if find_abbreviation:
+        if find_abbreviation and not pipeline:
             t0 = time.perf_counter()
 
             abbs = parser.find_abbreviations(
                 original_doc,
                 progress_callback=lambda d, t: _progress("Scanning for abbreviations", d, t),
+                layout=layout,
             )
             _progress("Scanning for abbreviations", 1, 1)
             abbs_log["found_total"] = len(abbs)
@@ -201,95 +771,33 @@ async def annotate(
                 initial_abbr_counts[abbr_text] = initial_abbr_counts.get(abbr_text, 0) + 1
 
             unique_list = [t for t, c in initial_abbr_counts.items() if c >= 2]
-            to_process_abbs = [{"id": abbr, "abbr": abbr} for abbr in unique_list]
-
-            full_form_map: dict = {}
-            _progress("Looking up full forms", 0, len(to_process_abbs))
-
-            for i, item in enumerate(to_process_abbs):
-                res = definitions.find_full_form(
-                    item["abbr"],
-                    pdf_path=str(dest),
-                    groq_api_key=GROQ_API_KEY,
-                    use_local_llm=use_local_llm,
+            _progress("Looking up full forms", 0, len(unique_list))
+            definitions.prefetch_full_form_contexts(unique_list, str(dest), GROQ_API_KEY)
+
+            if abbreviation_batches is not None:
+                full_form_map = await _resolve_abbreviations_batched(
+                    unique_list, str(dest), GROQ_API_KEY, use_local_llm, limiter, abbreviation_batches,
+                    use_cache=llm_cache, stream=llm_stream,
+                    on_done=lambda d, t: _progress("Looking up full forms", d, t),
                 )
-                if res and res.get("ans") not in ["NOT_FOUND", None, ""]:
-                    source = "extracted" if not res.get("using_llm") else "inferred"
-                    confidence = "HIGH" if source == "extracted" else "MEDIUM"
-                    res["confidence"] = confidence
-                    full_form_map[item["id"]] = res
-
-                _progress("Looking up full forms", i + 1, len(to_process_abbs))
+            else:
+                full_forms = await gather_limited(
+                    lambda abbr_text: _resolve_abbreviation(abbr_text, str(dest), GROQ_API_KEY, use_local_llm, limiter,
+                                                            use_cache=llm_cache, stream=llm_stream),
+                    unique_list,
+                    on_done=lambda d, t: _progress("Looking up full forms", d, t),
+                )
+                full_form_map = dict(zip(unique_list, full_forms))
 
-            abbr_occurrence_count: dict = {}
-            abbr_last_annotated_page: dict = {}
             total_abbs = len(abbs)
-
             for i, abbr in enumerate(abbs):
-                abbr_text = abbr["text"]
-                page = abbr.get("page")
-                abbr_occurrence_count[abbr_text] = abbr_occurrence_count.get(abbr_text, 0) + 1
-
-                if abbr_text not in full_form_map:
-                    _progress("Annotating abbreviations", i + 1, total_abbs or 1)
-                    continue
-
-                last_page = abbr_last_annotated_page.get(abbr_text)
-                if last_page is not None and (page - last_page) <= 5:
-                    _progress("Annotating abbreviations", i + 1, total_abbs or 1)
-                    continue
-
-                definition = full_form_map[abbr_text].get("ans")
-                confidence = full_form_map[abbr_text].get("confidence", "MEDIUM")
-
-                if not definition or definition == "NOT_FOUND":
-                    _progress("Annotating abbreviations", i + 1, total_abbs or 1)
-                    continue
-
-                if last_page is None:
-                    context = abbr.get("context", "")
-                    if re.search(rf'\({re.escape(abbr_text)}\)', context):
-                        abbr_last_annotated_page[abbr_text] = page
-                        _progress("Annotating abbreviations", i + 1, total_abbs or 1)
-                        continue
-
-                location_data = {
-                    "page": page,
-                    "column": abbr.get("column"),
-                    "bbox": abbr.get("bbox"),
-                }
-                placed = pdf_transform.add_definition_to_margin(
-                    doc=scaled_doc,
-                    scaling_factor=scaling,
-                    main_word=abbr_text,
-                    definition=definition,
-                    original_location=location_data,
-                    original_content_bboxes=original_bboxes,
-                    confidence=confidence,
-                )
-                if placed:
-                    processed += 1
-                    abbr_last_annotated_page[abbr_text] = page
-                    abbs_log["annotated_count"] += 1
-                    if confidence == "HIGH":
-                        abbs_log["annotated_green"] += 1
-                    elif confidence == "MEDIUM":
-                        abbs_log["annotated_orange"] += 1
-                    else:
-                        abbs_log["annotated_red"] += 1
-                    _ann_data["abbreviations"].append({
-                        "text": abbr_text,
-                        "definition": definition,
-                        "page": page,
-                        "confidence": confidence,
-                    })
-
+                renderer.abbreviation(abbr, full_form_map.get(abbr["text"]))
                 _progress("Annotating abbreviations", i + 1, total_abbs or 1)
 
             step_times["abbreviations_seconds"] = round(time.perf_counter() - t0, 3)
 
         # ── References ───────────────────────────────────────────────────────
-        if find_references:
+        if find_references and not pipeline:
             t0 = time.perf_counter()
 
             refs_db = parser.build_references_db(
@@ -297,68 +805,39 @@ async def annotate(
                 GROQ_API_KEY,
                 use_local_llm=use_local_llm,
                 progress_callback=lambda d, t: _progress("Building references database", d, t),
+                layout=layout,
+                lazy=lazy_references,
+                use_cache=llm_cache,
+                stream=llm_stream,
             )
-            numeric_refs_db = refs_db.get("numeric", {})
-            author_year_refs_db = refs_db.get("author_year", {})
 
-            refs = parser.find_references(original_doc)
+            refs = parser.find_references(original_doc, layout=layout)
             total_refs = len(refs)
             refs_log["found_total"] = total_refs
-            cited_refs = set()
 
             for i, ref in enumerate(refs):
-                ref_format = ref.get("format_type", "NUMERIC_BRACKET")
-                if ref_format == "NUMERIC_BRACKET":
-                    ref_key = ref.get("number")
-                    ref_info = numeric_refs_db.get(ref_key)
-                else:
-                    author_key = ref.get("author_key")
-                    year = ref.get("year")
-                    ref_key = f"{author_key}_{year}" if author_key and year else None
-                    ref_info = author_year_refs_db.get(ref_key) if ref_key else None
-                    if not ref_info and year:
-                        ref_info = {"title": None, "year": year}
-
-                if ref_key in cited_refs:
-                    _progress("Annotating references", i + 1, total_refs or 1)
-                    continue
-
-                if ref_info:
-                    title = ref_info.get("title")
-                    year = ref_info.get("year")
-                    definition = (
-                        f"{title} ({year})".strip()
-                        if title and title != "NOT_FOUND" and year and year != "NOT_FOUND"
-                        else None
-                    )
-                else:
-                    definition = None
-
-                if definition:
-                    location_data = {"page": ref["page"], "column": ref["column"], "bbox": ref["bbox"]}
-                    placed = pdf_transform.add_definition_to_margin(
-                        doc=scaled_doc,
-                        scaling_factor=scaling,
-                        main_word=f"{ref['text']}",
-                        definition=definition,
-                        original_location=location_data,
-                        original_content_bboxes=original_bboxes,
-                    )
-                    if placed:
-                        cited_refs.add(ref_key)
-                        processed += 1
-                        refs_log["annotated_count"] += 1
-                        _ann_data["citations"].append({
-                            "text": ref["text"],
-                            "definition": definition,
-                            "page": ref["page"],
-                            "confidence": "HIGH",
-                        })
-
+                section, ref_key = _reference_key(ref)
+                ref_info = _reference_info(ref, section, _lookup_reference(refs_db, section, ref_key))
+                renderer.reference(ref, ref_key, ref_info)
                 _progress("Annotating references", i + 1, total_refs or 1)
 
             step_times["references_seconds"] = round(time.perf_counter() - t0, 3)
 
+        if find_references:
+            if isinstance(refs_db, parser.LazyReferencesDB):
+                refs_log["entries_total"] = refs_db.total_entries
+                refs_log["entries_resolved"] = refs_db.resolve_calls
+            bib_cache_run = stats_delta(bib_cache_before, bib_cache.stats())
+            refs_log["cache_hits"] = bib_cache_run["hits"]
+            refs_log["cache_misses"] = bib_cache_run["misses"]
+
+        if symbol_batches is not None:
+            syms_log["batching"] = symbol_batches.stats()
+        if abbreviation_batches is not None:
+            abbs_log["batching"] = abbreviation_batches.stats()
+
+        processed = renderer.processed
+
         # ── Save ──────────────────────────────────────────────────────────────
         t0 = time.perf_counter()
         _progress("Saving annotated PDF", 0, 1)
@@ -383,14 +862,36 @@ async def annotate(
         total_elapsed = round(time.perf_counter() - t_total_start, 3)
         step_times["total_seconds"] = total_elapsed
 
+        llm_cache_run = stats_delta(llm_cache_before, definitions.llm_cache_stats())
+        llm_cache_run["saved_seconds"] = round(llm_cache_run["saved_seconds"], 3)
+        llm_cache_run["enabled"] = definitions.LLM_CACHE_ENABLED if llm_cache is None else llm_cache
+
+        # Generated tokens per helper; tokens_after_object is what streaming saves
+        llm_tokens_run = {}
+        for helper, counts in definitions.llm_token_stats().items():
+            delta = stats_delta(tokens_before.get(helper, {}), counts)
+            if delta["calls"]:
+                llm_tokens_run[helper] = delta
+        llm_tokens_run["streaming"] = definitions.LLM_STREAMING if llm_stream is None else llm_stream
+        if session is not None:
+            llm_tokens_run["document_session"] = session.stats()
+
         log = {
             "references": refs_log,
             "abbreviations": abbs_log,
             "symbols": syms_log,
+            "llm_cache": llm_cache_run,
+            "llm_concurrency": limiter.stats(),
+            "llm_parse": parse_stats_delta(parse_before, parse_stats()),
+            "llm_tokens": llm_tokens_run,
             "timing": step_times,
         }
 
         return [out_path, processed, log]
 
     except Exception as e:
-        raise RuntimeError(f"Annotation failed: {e}") from e
\ No newline at end of file
+        raise RuntimeError(f"Annotation failed: {e}") from e
+    finally:
+        definitions.close_session(str(dest))
+        if ollama_client is not None:
+            await definitions.close_async_client(ollama_client)
@@ -0,0 +1,287 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+# Set GLOSSER_CACHE_DIR to relocate the on-disk caches, GLOSSER_DISABLE_CACHE=1 to bypass them.
+_DEFAULT_CACHE_DIR = Path.home() / ".glosser_cache"
+_BUSY_TIMEOUT_SECONDS = 30.0
+_MANIFEST_NAME = "manifest.json"
+# Half-written directory entries older than this are assumed abandoned.
+_STALE_TMP_SECONDS = 3600
+# SQLite caches enforce their size limits on the first write and then every
+# this many writes per process, not on every write (the byte limit needs a
+# scan of the whole table).
+_EVICT_EVERY = 64
+
+_caches: Dict[str, "SQLiteCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_dir() -> Path:
+    """Directory holding the on-disk caches."""
+    return Path(os.environ.get("GLOSSER_CACHE_DIR") or _DEFAULT_CACHE_DIR)
+
+
+def cache_disabled() -> bool:
+    return os.environ.get("GLOSSER_DISABLE_CACHE", "").lower() in ("1", "true", "yes")
+
+
+class SQLiteCache:
+    """
+    Small key -> JSON value store shared between glosser processes.
+
+    Every operation opens its own connection on a WAL-mode database with a busy
+    timeout, so concurrent readers and writers in other processes do not block
+    or corrupt each other. Entries are evicted least-recently-used once the
+    table grows past `max_entries` (or its values past `max_bytes`), checked
+    every `_EVICT_EVERY` writes, so a table may briefly overshoot its limits.
+    With `ttl_seconds` set, older entries are treated as misses. Hits and
+    misses are counted per process. Database errors are reported, never raised.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 50000, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=_BUSY_TIMEOUT_SECONDS)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.commit()
+            self._initialized = True
+        conn.execute(f"PRAGMA busy_timeout={int(_BUSY_TIMEOUT_SECONDS * 1000)}")
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        if cache_disabled():
+            return None
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    row = conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        row = None
+                    if row:
+                        conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            row = None
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        if cache_disabled():
+            return
+        now = time.time()
+        with self._lock:
+            evict = self._writes % _EVICT_EVERY == 0
+            self._writes += 1
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now, now),
+                    )
+                    if evict:
+                        self._evict(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Cache write failed ({self.path.name}): {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least-recently-used entries beyond `max_entries` / `max_bytes`."""
+        conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        if self.max_bytes is not None:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(LENGTH(value)) OVER "
+                "(ORDER BY accessed DESC, key) AS running FROM entries) WHERE running > ?)",
+                (self.max_bytes,),
+            )
+
+    def clear(self) -> None:
+        if cache_disabled():
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM entries")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Cache clear failed ({self.path.name}): {e}")
+
+    def __len__(self) -> int:
+        if cache_disabled():
+            return 0
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def get_cache(name: str, max_entries: int = 50000, ttl_seconds: Optional[float] = None,
+              max_bytes: Optional[int] = None) -> SQLiteCache:
+    """Process-wide cache instance stored as `<cache_dir>/<name>.sqlite`."""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = SQLiteCache(cache_dir() / f"{name}.sqlite", max_entries=max_entries, ttl_seconds=ttl_seconds,
+                                max_bytes=max_bytes)
+            _caches[name] = cache
+        return cache
+
+
+def stats_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    """Per-run counters from two `stats()` snapshots."""
+    return {k: after[k] - before.get(k, 0) for k in after}
+
+
+def load_entry(namespace: str, key: str, expect: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+    """
+    Directory of a cached entry written by `store_entry`, or None.
+
+    Entries without a manifest (or whose manifest disagrees with `expect`)
+    are misses. A hit refreshes the entry's LRU timestamp.
+    """
+    if cache_disabled():
+        return None
+    entry = cache_dir() / namespace / key
+    manifest_path = entry / _MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if expect and any(manifest.get(k) != v for k, v in expect.items()):
+        return None
+    try:
+        os.utime(manifest_path)
+    except OSError:
+        pass
+    return entry
+
+
+def store_entry(namespace: str, key: str, write: Callable[[Path], None], manifest: Dict[str, Any],
+                max_bytes: Optional[int] = None) -> Optional[Path]:
+    """
+    Write a directory entry atomically and return its final path.
+
+    `write` fills a private temporary directory; the manifest is written last
+    and the directory renamed into place, so readers never see a partial
+    entry. If a concurrent writer already published a valid entry, theirs is
+    kept. With `max_bytes`, least-recently-used entries are then evicted until
+    the namespace fits.
+    """
+    if cache_disabled():
+        return None
+    root = cache_dir() / namespace
+    entry = root / key
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=str(root)))
+        try:
+            write(tmp)
+            (tmp / _MANIFEST_NAME).write_text(
+                json.dumps({**manifest, "created": time.time()}, ensure_ascii=False), encoding="utf-8"
+            )
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                if load_entry(namespace, key, expect=manifest) is None:
+                    # A stale or broken entry is in the way: replace it.
+                    shutil.rmtree(entry, ignore_errors=True)
+                    os.rename(tmp, entry)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    except OSError as e:
+        print(f"Cache write failed ({namespace}/{key}): {e}")
+        return None
+    if max_bytes is not None:
+        _evict_entries(root, max_bytes, keep=entry)
+    return entry
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def _evict_entries(root: Path, max_bytes: int, keep: Optional[Path] = None) -> None:
+    now = time.time()
+    entries = []
+    for child in root.iterdir():
+        if not child.is_dir():
+            continue
+        if child.name.startswith("."):
+            try:
+                if now - child.stat().st_mtime > _STALE_TMP_SECONDS:
+                    shutil.rmtree(child, ignore_errors=True)
+            except OSError:
+                pass
+            continue
+        try:
+            accessed = (child / _MANIFEST_NAME).stat().st_mtime
+        except OSError:
+            accessed = 0.0
+        entries.append((accessed, child, _dir_size(child)))
+
+    total = sum(size for _, _, size in entries)
+    for _, child, size in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        if keep is not None and child == keep:
+            continue
+        shutil.rmtree(child, ignore_errors=True)
+        total -= size
@@ -0,0 +1,256 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .layout import DocumentLayout, text_chunks
+
+_EDGE_PUNCTUATION = "()[]{}.,;:!?\"'“”‘’"
+
+# Defaults: windows of 2 * 25 + 1 tokens around the first 3 occurrences,
+# packed into 160 tokens (whitespace tokens, roughly 1.3 LLM tokens each).
+DEFAULT_MAX_OCCURRENCES = 3
+DEFAULT_RADIUS = 25
+DEFAULT_TOKEN_BUDGET = 160
+
+# Document session prefix: title, abstract and notation sentences, in that
+# order, within this many whitespace tokens.
+DEFAULT_PREFIX_BUDGET = 480
+# Inside a session the per-term context is cut to the sentences that mention
+# the term, within this many whitespace tokens.
+DEFAULT_TERM_CONTEXT_BUDGET = 48
+_TITLE_MAX_TOKENS = 40
+_ABSTRACT_MAX_TOKENS = 240
+_NOTATION_MAX_SENTENCE_TOKENS = 60
+_ABSTRACT_HEADING = re.compile(r"\b(?:Abstract|ABSTRACT)\b[\s.:—–-]*")
+_SECTION_HEADING = re.compile(r"^(?:1\.?|I\.)?\s*(?:Introduction|INTRODUCTION)\b")
+# Sentences that introduce a symbol: "X denotes", "where X is", "let X be", ...
+# A symbol is a short token that does not start in lower case ("E", "θ", "W_q")
+# or one or two characters ("x", "αt"); "we" covers "we denote ... as X".
+_SYMBOL = r"(?:[^a-z\s]\S{0,5}|(?!(?:it|is|as|to|of|in|on|an|be|by|or)\b)\S{1,2})"
+_NOTATION_PATTERN = re.compile(
+    rf"(?:^|\s)(?:we|{_SYMBOL}) (?:denotes?|represents?|is defined as)\b"
+    rf"|\bwhere {_SYMBOL} (?:is|are|denotes?)\b"
+    rf"|\b[Ll]et {_SYMBOL} (?:be|denote)\b"
+    r"|\bdenoted (?:by|as)\b"
+    r"|\b[Nn]otations?\b"
+)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def _key(token: str) -> str:
+    return token.strip(_EDGE_PUNCTUATION)
+
+
+class TokenIndex:
+    """
+    The document as one whitespace-token stream, in page/block/line order.
+
+    Records the token offset at which every block and line starts, so parser
+    locations (page, block, line) map to stream positions, and an inverted
+    index from bare tokens (edge punctuation stripped) to their positions.
+    """
+
+    def __init__(self, layout: DocumentLayout):
+        self.tokens: List[str] = []
+        self.pages: List[int] = []
+        self.block_starts: Dict[Tuple[int, int], int] = {}
+        self.line_starts: Dict[Tuple[int, int, int], int] = {}
+        self.positions: Dict[str, List[int]] = {}
+
+        for page_idx in range(len(layout)):
+            for block_idx, block in enumerate(layout.blocks(page_idx)):
+                self.block_starts[(page_idx, block_idx)] = len(self.tokens)
+                block_start = len(self.tokens)
+                for line_idx, line in enumerate(block["lines"]):
+                    self.line_starts[(page_idx, block_idx, line_idx)] = len(self.tokens)
+                    text = "".join(span["text"] for span in line["spans"])
+                    words = text.split()
+                    if (words and len(self.tokens) > block_start and self.tokens[-1].endswith("-")
+                            and words[0][:1].islower()):
+                        # Rejoin a word hyphenated across the line break
+                        self._append_to_last(words.pop(0))
+                    for token in words:
+                        self.positions.setdefault(_key(token), []).append(len(self.tokens))
+                        self.tokens.append(token)
+                        self.pages.append(page_idx)
+
+    def _append_to_last(self, rest: str) -> None:
+        pos = len(self.tokens) - 1
+        old_key = _key(self.tokens[pos])
+        self.positions[old_key].pop()
+        if not self.positions[old_key]:
+            del self.positions[old_key]
+        self.tokens[pos] = self.tokens[pos][:-1] + rest
+        self.positions.setdefault(_key(self.tokens[pos]), []).append(pos)
+
+    def find(self, term: str) -> List[int]:
+        """Positions where `term` is a whole token."""
+        return self.positions.get(_key(term), [])
+
+    def locate(self, term: str, page: int, block: int, line: Optional[int] = None) -> Optional[int]:
+        """
+        Stream position of `term` at a parser location: the first token of the
+        line (or block) that contains it, else the start of that line/block.
+        """
+        start = self.line_starts.get((page, block, line)) if line is not None else None
+        if start is None:
+            start = self.block_starts.get((page, block))
+        if start is None:
+            return None
+        next_block = self.block_starts.get((page, block + 1), len(self.tokens))
+        for pos in range(start, min(next_block, len(self.tokens))):
+            if term in self.tokens[pos]:
+                return pos
+        return start
+
+
+def get_token_index(layout: DocumentLayout) -> TokenIndex:
+    return layout.memo("token_index", lambda: TokenIndex(layout))
+
+
+def _merge_windows(positions: Iterable[int], radius: int, size: int) -> List[Tuple[int, int]]:
+    windows: List[Tuple[int, int]] = []
+    for pos in sorted(set(positions)):
+        start, end = max(0, pos - radius), min(size, pos + radius + 1)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def occurrence_windows(
+    index: TokenIndex,
+    term: str,
+    occurrences: Optional[List[dict]] = None,
+    max_occurrences: int = DEFAULT_MAX_OCCURRENCES,
+    radius: int = DEFAULT_RADIUS,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> List[dict]:
+    """
+    Fixed token windows around the first `max_occurrences` occurrences of `term`.
+
+    Occurrences come from parser candidates (dicts with page/block[/line]) when
+    given, otherwise from whole-token matches in the stream. Overlapping windows
+    are merged, and windows are packed in document order until `token_budget`
+    tokens are used; the last one is trimmed to fit. Each window is
+    ``{"text", "page", "start", "end"}`` with stream offsets.
+    """
+    if occurrences:
+        positions: List[int] = []
+        for occ in occurrences:
+            pos = index.locate(term, occ["page"], occ["block"], occ.get("line"))
+            if pos is not None and pos not in positions:
+                positions.append(pos)
+            if len(positions) >= max_occurrences:
+                break
+    else:
+        positions = index.find(term)[:max_occurrences]
+
+    windows = []
+    remaining = token_budget
+    for start, end in _merge_windows(positions, radius, len(index.tokens)):
+        if remaining <= 0:
+            break
+        end = min(end, start + remaining)
+        remaining -= end - start
+        windows.append({
+            "text": " ".join(index.tokens[start:end]),
+            "page": index.pages[start],
+            "start": start,
+            "end": end,
+        })
+    return windows
+
+
+def occurrence_context(index: TokenIndex, term: str, occurrences: Optional[List[dict]] = None, **kwargs) -> str:
+    """`occurrence_windows` joined into a single prompt context."""
+    return " … ".join(w["text"] for w in occurrence_windows(index, term, occurrences, **kwargs))
+
+
+def term_sentences(text: str, term: str, token_budget: int = DEFAULT_TERM_CONTEXT_BUDGET) -> str:
+    """
+    The sentences of `text` that mention `term` as a whole token, in order and
+    within `token_budget` tokens; the start of `text` when none does.
+    """
+    sentences = _SENTENCE_SPLIT.split(" ".join(text.split()))
+    mentions = [s for s in sentences if any(_key(token) == term for token in s.split())]
+    return _truncate(" ".join(mentions) if mentions else " ".join(sentences), token_budget)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = text.split()
+    return text if len(words) <= max_tokens else " ".join(words[:max_tokens]) + " …"
+
+
+def _title(layout: DocumentLayout) -> str:
+    """Blocks set in the largest font on the first page (arXiv side stamps excluded)."""
+    if not len(layout):
+        return ""
+    blocks = []
+    for block in layout.blocks(0):
+        text = " ".join("".join(span["text"] for span in line["spans"]) for line in block["lines"])
+        text = " ".join(text.split())
+        sizes = [span["size"] for line in block["lines"] for span in line["spans"] if span["text"].strip()]
+        if sizes and text and not text.lower().startswith("arxiv:"):
+            blocks.append((max(sizes), text))
+    if not blocks:
+        return ""
+    # A long title wraps over several blocks of the same size
+    largest = max(size for size, _ in blocks)
+    return _truncate(" ".join(text for size, text in blocks if size >= largest - 0.5), _TITLE_MAX_TOKENS)
+
+
+def _abstract(chunks: List[dict]) -> str:
+    for i, chunk in enumerate(chunks):
+        if chunk["page"] > 1:
+            break
+        heading = _ABSTRACT_HEADING.search(chunk["text"])
+        if not heading:
+            continue
+        # The heading may be its own block: keep reading until the abstract is long enough
+        parts = [chunk["text"][heading.end():]]
+        for following in chunks[i + 1:]:
+            if len(" ".join(parts).split()) >= 80 or _SECTION_HEADING.match(following["text"]):
+                break
+            parts.append(following["text"])
+        return _truncate(" ".join(p for p in parts if p), _ABSTRACT_MAX_TOKENS)
+    return ""
+
+
+def document_prefix(layout: DocumentLayout, token_budget: int = DEFAULT_PREFIX_BUDGET) -> str:
+    """
+    Stable per-document context for a model session: the title, the abstract
+    and the sentences that introduce notation, always in that order.
+
+    Every prompt of a session starts with the same text, so a backend that
+    caches the processed prompt prefix only evaluates the per-term part.
+    Notation sentences are added in document order until `token_budget`
+    whitespace tokens are used.
+    """
+    chunks = text_chunks(layout)
+    sections = []
+    title = _title(layout)
+    if title:
+        sections.append(f"Title: {title}")
+    abstract = _abstract(chunks)
+    if abstract:
+        sections.append(f"Abstract: {abstract}")
+
+    remaining = token_budget - sum(len(section.split()) for section in sections) - 1
+    notation: List[str] = []
+    for chunk in chunks:
+        for sentence in _SENTENCE_SPLIT.split(chunk["text"]):
+            if remaining <= 0:
+                break
+            size = len(sentence.split())
+            if (size <= min(remaining, _NOTATION_MAX_SENTENCE_TOKENS) and _NOTATION_PATTERN.search(sentence)
+                    and sentence not in notation):
+                notation.append(sentence)
+                remaining -= size + 1
+    if notation:
+        sections.append("Notation:\n" + "\n".join(f"- {sentence}" for sentence in notation))
+    return "\n\n".join(sections)
+
+
+def get_document_prefix(layout: DocumentLayout) -> str:
+    return layout.memo("document_prefix", lambda: document_prefix(layout))
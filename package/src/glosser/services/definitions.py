@@ -9,11 +9,21 @@ os.environ["TQDM_DISABLE"] = "1"
 os.environ["TRANSFORMERS_VERBOSITY"] = "error"
 os.environ["VERBOSITY"] = "ERROR"
 
+import asyncio
+import contextvars
 import json
 import logging
 import traceback
 import warnings
 import re
+import unicodedata
+import hashlib
+import shutil
+import textwrap
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from typing import Optional, List, Dict
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -31,10 +41,11 @@ try:
 except ImportError:
     pass
 
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+import faiss
+import numpy as np
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, Runnable
@@ -43,24 +54,431 @@ import ollama
 from dotenv import load_dotenv
 load_dotenv()
 
+from .cache import get_cache, load_entry, store_entry
+from .layout import MUPDF_LOCK, DocumentLayout, layout_for_path, text_chunks
+from .retrieval import BM25Index, hybrid_rerank, resolve_backend
+from .context import TokenIndex, get_token_index, occurrence_windows, term_sentences
+from .scheduling import AdaptiveLimiter, BatchController, approx_tokens, run_batches, run_batches_sync
+from .structured import (
+    CRITIQUE_SCHEMA,
+    FULL_FORM_SCHEMA,
+    JSON_OBJECT,
+    REFERENCE_SCHEMA,
+    SYMBOL_MEANING_SCHEMA,
+    JsonObjectScanner,
+    extract_json_object,
+    parse_json,
+    parse_json_object,
+)
+
+# How long Ollama keeps the model (and its prompt cache) loaded after a
+# document-session call.
+_SESSION_KEEP_ALIVE = os.environ.get("GLOSSER_OLLAMA_KEEP_ALIVE", "30m")
+
+
+class DocumentSession:
+    """
+    Shared prompt prefix for every local model call about one document.
+
+    The prefix (see `context.document_prefix`) is sent as the first message
+    of each request, byte-identical every time, and the model is kept loaded
+    with `keep_alive`. Ollama reuses the evaluated tokens of a prompt prefix
+    it has just seen, so only the per-term part of later prompts is evaluated.
+    Single-term lookups also move their instructions into that system message
+    and send only the sentences about the term (`context.term_sentences`).
+    """
+
+    def __init__(self, prefix: str, keep_alive=None):
+        self.prefix = prefix
+        self.keep_alive = keep_alive if keep_alive is not None else _SESSION_KEEP_ALIVE
+        self.prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        self.calls = 0
+        self.prompt_eval_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, prompt_eval_tokens: Optional[int]) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_eval_tokens += prompt_eval_tokens or 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "prefix_tokens": approx_tokens(self.prefix),
+                "keep_alive": self.keep_alive,
+                "calls": self.calls,
+                "prompt_eval_tokens": self.prompt_eval_tokens,
+            }
+
+
+_sessions: Dict[str, DocumentSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def open_session(pdf_path: str, prefix: str, keep_alive=None) -> DocumentSession:
+    """Start the document session local lookups for `pdf_path` run in."""
+    session = DocumentSession(prefix, keep_alive)
+    with _sessions_lock:
+        _sessions[os.path.abspath(pdf_path)] = session
+    return session
+
+
+def close_session(pdf_path: str) -> Optional[DocumentSession]:
+    with _sessions_lock:
+        return _sessions.pop(os.path.abspath(pdf_path), None)
+
+
+def session_for_path(pdf_path: Optional[str]) -> Optional[DocumentSession]:
+    if not pdf_path:
+        return None
+    with _sessions_lock:
+        return _sessions.get(os.path.abspath(pdf_path))
+
+
+# (ollama.AsyncClient, event loop) shared by the async model calls of one
+# annotate() run, inherited by the tasks and threads it starts.
+_async_client: contextvars.ContextVar = contextvars.ContextVar("glosser_ollama_client", default=None)
+
+
+def open_async_client() -> tuple:
+    """
+    Share one ollama.AsyncClient, and its connection pool, among the async
+    local model calls made from the current context on. Must be called in a
+    running event loop; pass the returned handle to `close_async_client`.
+    """
+    client = ollama.AsyncClient()
+    return client, _async_client.set((client, asyncio.get_running_loop()))
+
+
+async def close_async_client(handle: tuple) -> None:
+    client, token = handle
+    _async_client.reset(token)
+    await client.close()
+
+
 class OllamaLLM(Runnable):
-    def __init__(self, model="gemma3:4b"):
+    def __init__(self, model="gemma3:4b", format=None, options=None, stream_json=False, helper=None, session=None):
         self.model = model
+        # "json" or a JSON schema: constrains decoding to a matching object
+        self.format = format
+        # Sampling options, e.g. {"num_predict": 64} caps the generated tokens
+        self.options = options
+        # Stream the response and stop generating once the first JSON object closes
+        self.stream_json = stream_json
+        # Calling helper, for the per-helper token counts
+        self.helper = helper or "other"
+        # DocumentSession whose prefix starts every prompt
+        self.session = session
+
+    def _request(self, input_data) -> dict:
+        messages = _prompt_messages(input_data)
+        request = {"model": self.model, "messages": messages, "format": self.format, "options": self.options}
+        if self.session is not None:
+            # The shared prefix goes first so consecutive prompts only differ at the end;
+            # the prompt's own instructions (its system messages) extend it
+            system = [m["content"] for m in messages if m["role"] == "system"]
+            request["messages"] = [{'role': 'system', 'content': "\n\n".join([self.session.prefix] + system)}] + [
+                m for m in messages if m["role"] != "system"]
+            request["keep_alive"] = self.session.keep_alive
+        return request
  
     def invoke(self, input_data, config=None):
-        if hasattr(input_data, 'to_messages'):
-            msg = input_data.to_messages()[0].content
-        elif hasattr(input_data, 'content'):
-            msg = input_data.content
+        if self.stream_json:
+            scanner = JsonObjectScanner()
+            stream = ollama.chat(**self._request(input_data), stream=True)
+            parts, last = [], None
+            try:
+                for last in stream:
+                    parts.append(last.message.content)
+                    if last.done or scanner.feed(last.message.content) is not None:
+                        break
+            finally:
+                # Closing the stream drops the connection, which makes Ollama stop generating
+                stream.close()
+            return self._streamed(parts, last, scanner)
+        return self._completed(ollama.chat(**self._request(input_data)))
+
+    async def ainvoke(self, input_data, config=None, **kwargs):
+        shared = _async_client.get()
+        if shared is not None and shared[1] is asyncio.get_running_loop():
+            return await self._achat(shared[0], input_data)
+        # No client opened for this run: one for this call only
+        async with ollama.AsyncClient() as client:
+            return await self._achat(client, input_data)
+
+    async def _achat(self, client, input_data) -> str:
+        if self.stream_json:
+            scanner = JsonObjectScanner()
+            stream = await client.chat(**self._request(input_data), stream=True)
+            parts, last = [], None
+            try:
+                async for last in stream:
+                    parts.append(last.message.content)
+                    if last.done or scanner.feed(last.message.content) is not None:
+                        break
+            finally:
+                await stream.aclose()
+            return self._streamed(parts, last, scanner)
+        return self._completed(await client.chat(**self._request(input_data)))
+
+    def _streamed(self, parts: List[str], last, scanner: "JsonObjectScanner") -> str:
+        text = "".join(parts)
+        if last is not None and last.done:
+            generated = last.eval_count or len(parts)
+            _record_tokens(self.helper, generated, last.prompt_eval_count, _tokens_after_object(text, generated),
+                           early_stop=False, estimated=not last.eval_count)
+            if self.session is not None:
+                self.session.record(last.prompt_eval_count)
         else:
-            msg = str(input_data)
-        return ollama.chat(model=self.model, messages=[{'role': 'user', 'content': msg}]).message.content
+            # Stopped early: eval_count only comes with the final chunk, so the chunk count stands in
+            # for the generated tokens (Ollama usually streams one token per chunk)
+            _record_tokens(self.helper, len(parts), None, 0, early_stop=scanner.result is not None, estimated=True)
+            if self.session is not None:
+                self.session.record(None)
+        return text
+
+    def _completed(self, response) -> str:
+        text = response.message.content
+        tokens = response.eval_count or approx_tokens(text)
+        _record_tokens(self.helper, tokens, response.prompt_eval_count, _tokens_after_object(text, tokens),
+                       early_stop=False, estimated=not response.eval_count)
+        if self.session is not None:
+            self.session.record(response.prompt_eval_count)
+        return text
  
     def chat(self, prompt_text: str) -> str:
-        return ollama.chat(model=self.model, messages=[{'role': 'user', 'content': prompt_text}]).message.content
+        return self.invoke(prompt_text)
+
+    async def achat(self, prompt_text: str) -> str:
+        return await self.ainvoke(prompt_text)
+
+
+# Generated-token accounting per calling helper (local backend only).
+_llm_token_counts: Dict[str, Dict[str, int]] = {}
+_llm_token_lock = threading.Lock()
+
+
+def _tokens_after_object(text: str, tokens: int) -> int:
+    """Estimated tokens the model spent after the first JSON object closed, pro rata by characters."""
+    scanner = JsonObjectScanner()
+    obj = scanner.feed(text)
+    if obj is None or not text:
+        return 0
+    tail = text[text.index(obj) + len(obj):]
+    return round(tokens * len(tail.strip()) / len(text))
+
+
+def _record_tokens(helper: str, generated: int, prompt: Optional[int], after_object: int, early_stop: bool,
+                   estimated: bool = False) -> None:
+    with _llm_token_lock:
+        counts = _llm_token_counts.setdefault(helper, {
+            "calls": 0, "generated_tokens": 0, "estimated_generated_tokens": 0, "prompt_tokens": 0,
+            "tokens_after_object": 0, "early_stops": 0,
+        })
+        counts["calls"] += 1
+        counts["generated_tokens"] += generated
+        if estimated:
+            counts["estimated_generated_tokens"] += generated
+        counts["prompt_tokens"] += prompt or 0
+        counts["tokens_after_object"] += after_object
+        counts["early_stops"] += early_stop
+
+
+def llm_token_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Process-wide generation counters per helper: calls, generated and prompt
+    tokens, tokens generated after the JSON answer closed (what early stopping
+    saves) and calls stopped early. `estimated_generated_tokens` is the part of
+    `generated_tokens` the server did not report (early-stopped streams are
+    counted in chunks), so only the rest is an exact eval_count.
+    """
+    with _llm_token_lock:
+        return {helper: dict(counts) for helper, counts in _llm_token_counts.items()}
+
+
+class LimitedLLM(Runnable):
+    """
+    Routes async calls through an `AdaptiveLimiter`, so concurrent lookups
+    share one bound on in-flight model requests. Sync calls pass straight through.
+    """
+
+    def __init__(self, llm, limiter: AdaptiveLimiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def invoke(self, input_data, config=None):
+        return self.llm.invoke(input_data, config)
+
+    async def ainvoke(self, input_data, config=None, **kwargs):
+        async with self.limiter.slot():
+            return await self.llm.ainvoke(input_data, config)
+
+
+# LLM response cache: GLOSSER_LLM_CACHE=0 bypasses it, GLOSSER_LLM_CACHE_TTL
+# sets the entry lifetime in seconds (default 30 days).
+LLM_CACHE_ENABLED = os.environ.get("GLOSSER_LLM_CACHE", "1").lower() not in ("0", "false", "no")
+_LLM_CACHE_TTL_SECONDS = float(os.environ.get("GLOSSER_LLM_CACHE_TTL", 30 * 24 * 3600))
+_LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Structured output: JSON helpers constrain the model to their schema (Ollama
+# `format`) or to a JSON object (Groq JSON mode). GLOSSER_STRUCTURED_OUTPUT=0
+# turns it off.
+STRUCTURED_OUTPUT = os.environ.get("GLOSSER_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no")
+# Local JSON helpers stream their response and stop at the end of the first
+# JSON object; GLOSSER_LLM_STREAM=0 waits for the full response instead.
+LLM_STREAMING = os.environ.get("GLOSSER_LLM_STREAM", "1").lower() not in ("0", "false", "no")
+# Output-token caps per helper (Ollama num_predict, Groq max_tokens). Batch
+# helpers are capped per term in the batch.
+_NUM_PREDICT = {
+    "find_full_form": 64,
+    "find_symbol_meaning": 128,
+    "extract_title_year_from_reference": 128,
+    "critique_abbr": 96,
+    "critique_sym": 96,
+}
+_NUM_PREDICT_PER_TERM = {
+    "find_full_form_batch": 40,
+    "find_symbol_meaning_batch": 96,
+}
+_llm_saved_seconds = 0.0
+_llm_stats_lock = threading.Lock()
+
+
+def _prompt_messages(input_data) -> List[dict]:
+    if hasattr(input_data, 'to_messages'):
+        messages = input_data.to_messages()
+    elif isinstance(input_data, list):
+        messages = input_data
+    elif hasattr(input_data, 'content'):
+        messages = [input_data]
+    else:
+        return [{"role": "user", "content": str(input_data)}]
+    roles = {"human": "user", "ai": "assistant"}
+    return [{"role": roles.get(getattr(m, "type", "user"), getattr(m, "type", "user")), "content": m.content} for m in messages]
+
+
+def _llm_identity(llm) -> dict:
+    """Backend, model and decoding parameters: everything besides the prompt that shapes a response."""
+    if isinstance(llm, LimitedLLM):
+        llm = llm.llm
+    if isinstance(llm, OllamaLLM):
+        return {"backend": "ollama", "model": llm.model, "options": llm.options, "format": llm.format,
+                "session_prefix": llm.session.prefix_hash if llm.session is not None else None}
+    return {
+        "backend": type(llm).__name__,
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_tokens", None),
+        "top_p": getattr(llm, "top_p", None),
+        "model_kwargs": getattr(llm, "model_kwargs", None) or None,
+    }
+
+
+class CachedLLM(Runnable):
+    """
+    Wraps an LLM runnable with the on-disk `llm_responses` cache.
+
+    Keys hash the backend, model, decoding parameters and prompt messages;
+    responses are returned as plain strings, like `OllamaLLM`. Each entry
+    records how long the model took, so hits can report the time saved.
+    Empty responses are never stored; with `expect_json`, neither are those
+    without a complete JSON object (cut off, repaired or unparseable), so the
+    next run asks the model again instead of replaying the failure.
+    """
+
+    def __init__(self, llm, expect_json: bool = False):
+        self.llm = llm
+        self.expect_json = expect_json
+        self.identity = _llm_identity(llm)
+        self.cache = get_cache("llm_responses", ttl_seconds=_LLM_CACHE_TTL_SECONDS, max_bytes=_LLM_CACHE_MAX_BYTES)
+
+    def _key(self, input_data) -> str:
+        payload = json.dumps({**self.identity, "messages": _prompt_messages(input_data)}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _hit(self, key: str) -> Optional[str]:
+        global _llm_saved_seconds
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        with _llm_stats_lock:
+            _llm_saved_seconds += cached.get("seconds", 0.0)
+        return cached["text"]
+
+    def _store(self, key: str, result, started: float) -> str:
+        text = result.content if hasattr(result, 'content') else str(result)
+        if self._storable(text):
+            self.cache.set(key, {"text": text, "seconds": round(time.perf_counter() - started, 3)})
+        return text
+
+    def _storable(self, text: str) -> bool:
+        if not text.strip():
+            return False
+        if not self.expect_json:
+            return True
+        parsed, repaired = extract_json_object(text)
+        return parsed is not None and not repaired
+
+    def invoke(self, input_data, config=None):
+        key = self._key(input_data)
+        cached = self._hit(key)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        return self._store(key, self.llm.invoke(input_data, config), t0)
+
+    async def ainvoke(self, input_data, config=None, **kwargs):
+        key = self._key(input_data)
+        cached = await asyncio.to_thread(self._hit, key)
+        if cached is not None:
+            return cached
+        t0 = time.perf_counter()
+        result = await self.llm.ainvoke(input_data, config)
+        return await asyncio.to_thread(self._store, key, result, t0)
+
+    def chat(self, prompt_text: str) -> str:
+        return self.invoke(prompt_text)
+
+    async def achat(self, prompt_text: str) -> str:
+        return await self.ainvoke(prompt_text)
+
+
+def llm_cache_stats() -> Dict[str, float]:
+    """Process-wide LLM cache counters: hits, misses and model seconds saved by hits."""
+    stats = get_cache("llm_responses", ttl_seconds=_LLM_CACHE_TTL_SECONDS, max_bytes=_LLM_CACHE_MAX_BYTES).stats()
+    with _llm_stats_lock:
+        stats["saved_seconds"] = round(_llm_saved_seconds, 3)
+    return stats
+
+_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+_CHUNKER = "layout-blocks-v1"
+_CHUNK_SIZE = 500
+# On-disk FAISS indexes live under <cache_dir>/vectorstores, capped in total size.
+_VECTORSTORE_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
 _cached_embeddings = None
 _cached_vectorstores = {}
+_vectorstore_lock = threading.Lock()
+# Retrieved chunks per vector store: {(query, k): [Document]}
+_retrieval_memo: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_retrieval_memo_lock = threading.Lock()
+
+# Context retriever for find_full_form / find_symbol_meaning_batch: "dense"
+# (MiniLM + FAISS), "bm25" (lexical, no model), "hybrid" (BM25 candidates
+# re-ranked by embedding distance) or "occurrence" (token windows around the
+# term's first occurrences, no model). Overridable per call.
+RETRIEVER_BACKEND = os.environ.get("GLOSSER_RETRIEVER", "dense")
+_HYBRID_FIRST_STAGE_K = 20
+_bm25_indexes: Dict[tuple, tuple] = {}
+_store_bm25_indexes: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_bm25_lock = threading.Lock()
+_token_indexes: Dict[tuple, TokenIndex] = {}
+
+# Per-document '(ABBR)' definition indexes, keyed by (path, content fingerprint).
+_ABBR_INDEX_MAX_DOCUMENTS = 16
+_abbr_indexes: "OrderedDict[tuple, Dict[str, str]]" = OrderedDict()
+_abbr_indexes_lock = threading.Lock()
+_MAX_FINGERPRINTS = 256
+_pdf_fingerprints: Dict[tuple, str] = {}
 
 
 def _clean_reference_text(text: str) -> str:
@@ -96,79 +514,481 @@ def _extract_title_year_from_reference_regex(reference_text: str) -> dict:
 
     return {"title": title, "year": year}
 
+# Title/year parses at or above this confidence skip the LLM call.
+REFERENCE_PARSE_CONFIDENCE_THRESHOLD = 0.85
+
+_REF_YEAR_PATTERN = re.compile(r"\b((?:19|20)\d{2})[a-z]?\b")
+_REF_LABEL_PATTERN = re.compile(r"^\s*(?:(?:References|Bibliography)\s+)?(?:\[[^\]]{1,12}\]|\d{1,3}[\.\)])?\s*")
+_REF_VENUE_PATTERN = re.compile(
+    r"\b(?:In:?\s|Proceedings|Proc\.|Conference|Journal|Transactions|arXiv|CoRR|abs/|pp\.|pages\s+\d|Vol\.|Workshop|Press|Springer)",
+)
+_REF_NON_TERMINAL_WORDS = {"al", "vs", "proc", "conf", "int", "eds", "ed", "vol", "pp", "no", "jr", "inc", "dept", "univ", "e.g", "i.e"}
+_REF_PARTICLES = {"van", "von", "de", "der", "den", "del", "da", "di", "la", "le", "dos", "du", "and", "et", "al", "al."}
+
+
+def _ref_sentences(text: str) -> List[str]:
+    """Split on sentence ends, ignoring the periods of initials and common abbreviations."""
+    parts, start = [], 0
+    for m in re.finditer(r"[.?!]\s+", text):
+        before = text[start:m.start()].split()
+        last = before[-1] if before else ""
+        word = last.rstrip(".").lower()
+        if text[m.start()] == "." and (
+            (len(last) <= 2 and last[:1].isupper())  # initials: "Y." / "D.C"
+            or re.fullmatch(r"(?:[A-Z]\.)+[A-Z]?", last)
+            or (word in _REF_NON_TERMINAL_WORDS and word != "al")
+        ):
+            continue
+        end = m.start() + (1 if text[m.start()] in "?!" else 0)
+        parts.append(text[start:end].strip())
+        start = m.end()
+    tail = text[start:].strip()
+    if tail:
+        parts.append(tail)
+    return [p for p in parts if p]
+
+
+def _looks_like_author_list(segment: str) -> bool:
+    segment = segment.strip().rstrip(".,:;")
+    if not segment:
+        return False
+    names = [n.strip() for n in re.split(r",|;|\band\b|&", segment) if n.strip()]
+    if not names:
+        return False
+    good = 0
+    for name in names:
+        tokens = name.replace(".", ". ").split()
+        if len(tokens) > 6:
+            return False  # a title or sentence, not a name
+        if not tokens:
+            continue
+        if all(t.lower() in _REF_PARTICLES or t[:1].isupper() for t in tokens):
+            good += 1
+    return good / len(names) >= 0.75
+
+
+def _parse_reference_candidates(text: str):
+    """Yield (style, authors, title, year_text_after_title, base score) parses of one entry."""
+    quoted = re.search(r"[“\"]([^”\"]{6,}?)[,.]?\s*[”\"]", text)
+    if quoted:
+        yield "quoted", text[:quoted.start()], quoted.group(1), text[quoted.end():], 0.95
+
+    # ACL/ACM/AAAI/APA: Authors. 2019. Title. Venue.   or   Authors (2019). Title.
+    m = re.match(r"^(.{3,}?)[.,]?\s+\(?((?:19|20)\d{2})[a-z]?\)?[.:]\s+(.+)$", text)
+    if m and _looks_like_author_list(m.group(1)):
+        rest = _ref_sentences(m.group(3))
+        if rest:
+            yield "author_year", m.group(1), rest[0], m.group(2), 0.92
+
+    # LNCS/Springer: Authors: Title. In: Venue (2012)
+    m = re.match(r"^([^:]{3,}?):\s+(.+)$", text)
+    if m and "," in m.group(1) and re.search(r"(?:\b[A-Z]\.|et al\.)$", m.group(1)) and _looks_like_author_list(m.group(1)):
+        rest = _ref_sentences(m.group(2))
+        if rest:
+            yield "colon", m.group(1), rest[0], " ".join(rest[1:]), 0.9
+
+    # IEEE/NeurIPS/ICLR/arXiv: Authors. Title. Venue, 2017.
+    sentences = _ref_sentences(text)
+    if len(sentences) >= 2 and _looks_like_author_list(sentences[0]):
+        title, tail = sentences[1], " ".join(sentences[2:])
+        # Venue-less entries: "Authors. Title, 2015."
+        bare = re.match(r"^(.*?),\s*((?:19|20)\d{2})[a-z]?\.?$", title)
+        if bare and not tail:
+            title, tail = bare.group(1), bare.group(2)
+        base = 0.9 if _REF_VENUE_PATTERN.search(tail) else 0.85
+        yield "authors_title_venue", sentences[0], title, tail, base
+
+
+def _score_reference_parse(authors: str, title: str, year: Optional[str], base: float, text: str,
+                           target_author: Optional[str], target_year: Optional[str]) -> float:
+    score = base
+    words = title.split()
+    if not 2 <= len(words) <= 40:
+        score -= 0.4
+    if _REF_VENUE_PATTERN.search(title) or re.search(r"(?<![\w-])(?:19|20)\d{2}(?![\w-])", title):
+        score -= 0.3
+    if title and text.rstrip(" .").endswith(title):
+        # Nothing after the title: the entry was probably cut short.
+        score -= 0.3
+    if len(words) > 2 and _looks_like_author_list(title) and sum(w[:1].isupper() for w in words) == len(words):
+        score -= 0.4
+    if title.endswith("-") or title[:1].islower():
+        score -= 0.3
+    if not authors.strip() or authors.strip()[:1].islower():
+        score -= 0.15
+    if not year:
+        score -= 0.3
+    if len(text) > 400:
+        score -= 0.2
+    if target_year and year and year != target_year:
+        score -= 0.5
+    if target_author:
+        folded = unicodedata.normalize("NFKD", authors).encode("ascii", "ignore").decode().lower()
+        if target_author.lower() not in re.sub(r"[^a-z ]", "", folded).split():
+            score -= 0.3
+    return round(max(score, 0.0), 3)
+
+
+def _normalize_reference_text(reference_text: str) -> str:
+    text = re.sub(r"\s+", " ", reference_text).strip()
+    text = _REF_LABEL_PATTERN.sub("", text)
+    # Rejoin words hyphenated across line breaks: "lan- guage" -> "language"
+    text = re.sub(r"(\w)- ([a-z])", r"\1\2", text)
+    return text.translate(_LIGATURE_MAP)
+
+
+def _reference_fingerprint(reference_text: str, target_author: Optional[str] = None, target_year: Optional[str] = None) -> str:
+    """Cache key for a bibliography entry, stable across papers (labels, breaks, case, accents)."""
+    text = unicodedata.normalize("NFKD", _normalize_reference_text(reference_text))
+    text = re.sub(r"[^a-z0-9]+", " ", text.encode("ascii", "ignore").decode().lower()).strip()
+    hints = f"{(target_author or '').lower()}|{target_year or ''}"
+    return hashlib.sha256(f"{hints}|{text}".encode("utf-8")).hexdigest()
+
+
+def parse_reference_styled(reference_text: str, target_author: Optional[str] = None, target_year: Optional[str] = None) -> dict:
+    """
+    Style-aware title/year parser for common bibliography layouts.
+
+    Tries IEEE/PPO quoted titles, ACL/ACM/AAAI/APA "Authors. Year. Title.",
+    LNCS "Authors: Title. In: ..." and NeurIPS/ICLR/arXiv "Authors. Title.
+    Venue, Year." parses, scores each, and returns the best as
+    {"title", "year", "style", "confidence"} with confidence in [0, 1].
+    """
+    text = _normalize_reference_text(reference_text)
+    best = {"title": None, "year": None, "style": None, "confidence": 0.0}
+    for style, authors, title, after, base in _parse_reference_candidates(text):
+        title = title.strip(" \t\"'“”‘’.,;:")
+        year_match = _REF_YEAR_PATTERN.search(after) if style != "author_year" else None
+        year = after if style == "author_year" else (year_match.group(1) if year_match else None)
+        if not year:
+            years = _REF_YEAR_PATTERN.findall(text)
+            year = years[-1] if years else None
+        confidence = _score_reference_parse(authors, title, year, base, text, target_author, target_year)
+        if confidence > best["confidence"]:
+            best = {"title": title or None, "year": year, "style": style, "confidence": confidence}
+    return best
+
+
 def get_embeddings():
     global _cached_embeddings
     if _cached_embeddings is None:
         _cached_embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
+            model_name=_EMBEDDING_MODEL,
             model_kwargs={'device': 'cpu'}
         )
     return _cached_embeddings
 
-def get_llm(use_local_llm: bool, groq_api_key: Optional[str] = None):
+def get_llm(use_local_llm: bool, groq_api_key: Optional[str] = None, use_cache: Optional[bool] = None,
+            limiter: Optional[AdaptiveLimiter] = None, schema=None, helper: Optional[str] = None,
+            num_predict: Optional[int] = None, session: Optional[DocumentSession] = None,
+            stream: Optional[bool] = None):
+    """
+    LLM runnable for the selected backend, behind the response cache unless
+    bypassed. With a `limiter`, async model calls (cache misses only) wait
+    for one of its slots. A `schema` (a JSON schema, or JSON_OBJECT) asks for
+    structured output when STRUCTURED_OUTPUT is on and, locally, a streamed
+    response cut at the end of the object. `helper` names the caller for its
+    output-token cap (overridden by `num_predict`) and token counts. A
+    `session` puts its document prefix in front of local prompts; its calls
+    are not stopped early, since Ollama only reports the evaluated prompt
+    tokens the session accounts on the final chunk of a response.
+    `use_cache` and `stream` default to LLM_CACHE_ENABLED and LLM_STREAMING;
+    with a `schema`, only responses holding a complete JSON object are cached.
+    """
+    structured = schema is not None and STRUCTURED_OUTPUT
+    if num_predict is None:
+        num_predict = _NUM_PREDICT.get(helper)
     if use_local_llm:
-        return OllamaLLM()
-    if not groq_api_key:
+        llm = OllamaLLM(
+            format=schema if structured else None,
+            options={"num_predict": num_predict} if num_predict else None,
+            stream_json=schema is not None and session is None and (LLM_STREAMING if stream is None else stream),
+            helper=helper,
+            session=session,
+        )
+    elif not groq_api_key:
         return None
-    return ChatGroq(
-        model="moonshotai/kimi-k2-instruct-0905",
-        temperature=0,
-        api_key=groq_api_key,
-    )
+    else:
+        llm = ChatGroq(
+            model="moonshotai/kimi-k2-instruct-0905",
+            temperature=0,
+            api_key=groq_api_key,
+            max_tokens=num_predict,
+            model_kwargs={"response_format": {"type": "json_object"}} if structured else {},
+        )
+    if use_cache is None:
+        use_cache = LLM_CACHE_ENABLED
+    if limiter is not None:
+        llm = LimitedLLM(llm, limiter)
+    return CachedLLM(llm, expect_json=schema is not None) if use_cache else llm
+
+def _layout_documents(pdf_path: str) -> List[Document]:
+    """
+    Retrieval chunks from the parser's page blocks. Reuses the layout of a
+    document being annotated when one is registered for `pdf_path`.
+    """
+    import pymupdf
+    with MUPDF_LOCK:
+        layout = layout_for_path(pdf_path)
+        if layout is not None:
+            chunks = text_chunks(layout, max_chars=_CHUNK_SIZE)
+        else:
+            doc = pymupdf.open(pdf_path)
+            try:
+                chunks = text_chunks(DocumentLayout(doc), max_chars=_CHUNK_SIZE)
+            finally:
+                doc.close()
+    return [
+        Document(
+            page_content=chunk["text"],
+            metadata={"source": pdf_path, "page": chunk["page"], "column": chunk["column"], "bbox": list(chunk["bbox"])},
+        )
+        for chunk in chunks
+    ]
+
+
+def _vectorstore_manifest(pdf_path: str) -> dict:
+    """Everything the vectors depend on; its hash is the on-disk cache key."""
+    return {
+        "pdf_sha256": pdf_fingerprint(pdf_path),
+        "embedding_model": _EMBEDDING_MODEL,
+        "chunker": _CHUNKER,
+        "chunk_size": _CHUNK_SIZE,
+    }
+
 
 def get_vectorstore(pdf_path, groq_api_key):
     """
     Load or create a FAISS vector store for the given PDF.
-    Caches the vector store in memory for repeated lookups.
+
+    Chunks are built from the page layout blocks (see `layout.text_chunks`).
+    Indexes are cached in memory and on disk, keyed by the PDF contents,
+    embedding model and chunking parameters, so a cache hit skips loading and
+    splitting the PDF and a replaced file is never served stale vectors.
     """
-    if pdf_path in _cached_vectorstores:
-        return _cached_vectorstores[pdf_path]
+    manifest = _vectorstore_manifest(pdf_path)
+    memory_key = (os.path.abspath(pdf_path), manifest["pdf_sha256"])
+    if memory_key in _cached_vectorstores:
+        return _cached_vectorstores[memory_key]
+
+    # Concurrent resolvers for the same PDF build (and save) the index once.
+    with _vectorstore_lock:
+        if memory_key in _cached_vectorstores:
+            return _cached_vectorstores[memory_key]
+
+        cache_key = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+        embeddings = get_embeddings()
+        vectorstore = None
+
+        entry = load_entry("vectorstores", cache_key, expect=manifest)
+        if entry is not None:
+            try:
+                vectorstore = FAISS.load_local(
+                    str(entry),
+                    embeddings,
+                    allow_dangerous_deserialization=True
+                )
+            except Exception:
+                # Unreadable entry: drop it and rebuild below
+                shutil.rmtree(entry, ignore_errors=True)
+                vectorstore = None
+
+        if vectorstore is None:
+            chunks = _layout_documents(pdf_path)
+            if not chunks:
+                return None
 
-    loader = PyMuPDFLoader(pdf_path)
-    docs = loader.load()
-    if not docs:
-        return None
+            vectorstore = FAISS.from_documents(chunks, embeddings)
+            store_entry(
+                "vectorstores",
+                cache_key,
+                lambda path: vectorstore.save_local(str(path)),
+                {**manifest, "source": os.path.abspath(pdf_path), "chunks": len(chunks)},
+                max_bytes=_VECTORSTORE_CACHE_MAX_BYTES,
+            )
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=100,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
-    chunks = splitter.split_documents(docs)
-    if not chunks:
+        _cached_vectorstores[memory_key] = vectorstore
+        return vectorstore
+
+
+def _abbr_query(abbr: str) -> str:
+    return f"What is the full form or definition of {abbr}?"
+
+
+def _symbol_query(symbol: str) -> str:
+    return f"What does the symbol {symbol} represent or mean?"
+
+
+def retrieve_many(vectorstore, queries: List[str], k: int) -> List[list]:
+    """
+    Top-k chunks for every query, like ``as_retriever(k).invoke(q)`` per query.
+
+    Queries not seen before for this store are embedded in one batched forward
+    pass and looked up with a single ``index.search`` over the stacked query
+    matrix; results are memoized per store.
+    """
+    with _retrieval_memo_lock:
+        memo = _retrieval_memo.setdefault(vectorstore, {})
+        missing = list(dict.fromkeys(q for q in queries if (q, k) not in memo))
+
+    if missing:
+        # MiniLM encodes queries and documents identically, so one
+        # embed_documents call stands in for per-query embed_query calls.
+        vectors = np.asarray(vectorstore.embeddings.embed_documents(missing), dtype=np.float32)
+        if vectorstore._normalize_L2:
+            faiss.normalize_L2(vectors)
+        _, indices = vectorstore.index.search(vectors, k)
+        found = {}
+        for query, row in zip(missing, indices):
+            found[(query, k)] = [
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                for i in row if i != -1
+            ]
+        with _retrieval_memo_lock:
+            memo.update(found)
+
+    return [memo[(q, k)] for q in queries]
+
+
+def _document_bm25(pdf_path: str) -> tuple:
+    """(BM25Index, chunks) over the layout chunks of a PDF, built once per content."""
+    key = (os.path.abspath(pdf_path), pdf_fingerprint(pdf_path))
+    with _bm25_lock:
+        if key not in _bm25_indexes:
+            docs = _layout_documents(pdf_path)
+            _bm25_indexes[key] = (BM25Index([d.page_content for d in docs]), docs)
+        return _bm25_indexes[key]
+
+
+def _document_token_index(pdf_path: str) -> TokenIndex:
+    """Token offset index of a PDF, from its registered layout when there is one."""
+    layout = layout_for_path(pdf_path)
+    if layout is not None:
+        with MUPDF_LOCK:
+            return get_token_index(layout)
+    import pymupdf
+    key = (os.path.abspath(pdf_path), pdf_fingerprint(pdf_path))
+    with _bm25_lock:
+        if key not in _token_indexes:
+            with MUPDF_LOCK:
+                doc = pymupdf.open(pdf_path)
+                try:
+                    _token_indexes[key] = TokenIndex(DocumentLayout(doc))
+                finally:
+                    doc.close()
+        return _token_indexes[key]
+
+
+def _vectorstore_bm25(vectorstore) -> tuple:
+    """(BM25Index, chunks) aligned with the FAISS ids of `vectorstore`."""
+    with _bm25_lock:
+        if vectorstore not in _store_bm25_indexes:
+            docs = [
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+                for i in range(vectorstore.index.ntotal)
+            ]
+            _store_bm25_indexes[vectorstore] = (BM25Index([d.page_content for d in docs]), docs)
+        return _store_bm25_indexes[vectorstore]
+
+
+def _hybrid_search(vectorstore, terms: List[str], queries: List[str], k: int) -> List[list]:
+    index, docs = _vectorstore_bm25(vectorstore)
+    first_stage = index.search_many(terms, _HYBRID_FIRST_STAGE_K)
+    lexical = [i for i, hits in enumerate(first_stage) if hits]
+    # Terms with no lexical match fall back to a plain dense search
+    dense_only = [i for i, hits in enumerate(first_stage) if not hits]
+    results: List[list] = [[] for _ in terms]
+    for i, found in zip(dense_only, retrieve_many(vectorstore, [queries[i] for i in dense_only], k)):
+        results[i] = found
+    if lexical:
+        vectors = np.asarray(vectorstore.embeddings.embed_documents([queries[i] for i in lexical]), dtype=np.float32)
+        if vectorstore._normalize_L2:
+            faiss.normalize_L2(vectors)
+        for i, query_vector in zip(lexical, vectors):
+            candidates = [doc_id for doc_id, _ in first_stage[i]]
+            doc_vectors = np.vstack([vectorstore.index.reconstruct(doc_id) for doc_id in candidates])
+            results[i] = [docs[doc_id] for doc_id in hybrid_rerank(candidates, query_vector, doc_vectors, k)]
+    return results
+
+
+def retrieve_term_contexts(terms: List[str], pdf_path: str, query_fn, k: int, backend: Optional[str] = None,
+                           groq_api_key: Optional[str] = None) -> Optional[List[list]]:
+    """
+    Top-k chunks for each term with the selected retriever backend (see
+    `RETRIEVER_BACKEND`). Dense search embeds `query_fn(term)`; BM25 matches the
+    term itself; "occurrence" returns windows around its first k occurrences.
+    Returns None when no vector store could be built.
+    """
+    backend = resolve_backend(backend, RETRIEVER_BACKEND)
+    if backend == "occurrence":
+        index = _document_token_index(pdf_path)
+        return [
+            [
+                Document(page_content=w["text"], metadata={"source": pdf_path, "page": w["page"], "start": w["start"], "end": w["end"]})
+                for w in occurrence_windows(index, term, max_occurrences=k)
+            ]
+            for term in terms
+        ]
+    if backend == "bm25":
+        index, docs = _document_bm25(pdf_path)
+        return [[docs[doc_id] for doc_id, _ in hits] for hits in index.search_many(terms, k)]
+
+    vectorstore = get_vectorstore(pdf_path, groq_api_key)
+    if not vectorstore:
         return None
+    queries = [query_fn(term) for term in terms]
+    if backend == "dense":
+        return retrieve_many(vectorstore, queries, k)
+    return _hybrid_search(vectorstore, terms, queries, k)
 
-    vectorstore_path = f"{pdf_path}.faiss"
-    embeddings = get_embeddings()
-    
-    vectorstore = None
+
+def prefetch_full_form_contexts(abbrs: List[str], pdf_path: str, groq_api_key: Optional[str] = None) -> None:
+    """
+    Retrieve RAG context for every abbreviation `find_full_form` will need to
+    send to the LLM, in one batched search, so the per-term calls hit the memo.
+    """
+    regex_map = get_abbr_definitions(pdf_path)
+    pending = [abbr for abbr in abbrs if abbr not in regex_map]
+    if not pending or resolve_backend(None, RETRIEVER_BACKEND) != "dense":
+        return
     try:
-        if os.path.exists(vectorstore_path):
-            vectorstore = FAISS.load_local(
-                vectorstore_path, 
-                embeddings,
-                allow_dangerous_deserialization=True
-            )
-        else:
-            vectorstore = FAISS.from_documents(chunks, embeddings)
-            vectorstore.save_local(vectorstore_path)
+        vectorstore = get_vectorstore(pdf_path, groq_api_key)
+        if vectorstore:
+            retrieve_many(vectorstore, [_abbr_query(abbr) for abbr in pending], k=3)
     except Exception:
-        # Recreate if loading fails
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-        vectorstore.save_local(vectorstore_path)
+        traceback.print_exc()
 
-    if vectorstore:
-        _cached_vectorstores[pdf_path] = vectorstore
-    return vectorstore
 
-def extract_title_year_from_reference(reference_text: str, groq_api_key: Optional[str] = None, target_author: Optional[str] = None, target_year: Optional[str] = None, use_local_llm: bool = False) -> Optional[dict]:
+def extract_title_year_from_reference(reference_text: str, groq_api_key: Optional[str] = None, target_author: Optional[str] = None, target_year: Optional[str] = None, use_local_llm: bool = False, confidence_threshold: Optional[float] = None,
+                                      use_cache: Optional[bool] = None, stream: Optional[bool] = None) -> Optional[dict]:
     """
-    Extract title and year from a reference citation text using LLM.
+    Extract title and year from a reference citation text.
+
+    The style-aware parser runs first; the LLM is only called when its
+    confidence is below ``confidence_threshold``
+    (default ``REFERENCE_PARSE_CONFIDENCE_THRESHOLD``). `use_cache` and
+    `stream` are passed to `get_llm`.
     """
     try:
         api_key = groq_api_key
-        # Regex is too inaccurate for titles (often picks authors or journals).
+        if confidence_threshold is None:
+            confidence_threshold = REFERENCE_PARSE_CONFIDENCE_THRESHOLD
+
+        parsed = parse_reference_styled(reference_text, target_author, target_year)
+        if parsed["title"] and parsed["year"] and parsed["confidence"] >= confidence_threshold:
+            return {"title": parsed["title"], "year": parsed["year"]}
+
+        # The same entries recur across papers; reuse earlier LLM extractions.
+        cache = get_cache("bibliography")
+        cache_key = _reference_fingerprint(reference_text, target_author, target_year)
+        cached = cache.get(cache_key)
+        if cached:
+            return cached
+
+        # Low-confidence parse: keep it as the fallback, the plain regex is worse at titles.
         fallback = _extract_title_year_from_reference_regex(reference_text)
+        if parsed["title"]:
+            fallback = {"title": parsed["title"], "year": parsed["year"] or fallback.get("year")}
         
         hint = ""
         if target_author and target_year:
@@ -192,21 +1012,16 @@ Response Format:
 
         prompt = ChatPromptTemplate.from_template(template)
 
-        llm = get_llm(use_local_llm, api_key)
+        llm = get_llm(use_local_llm, api_key, use_cache=use_cache, schema=REFERENCE_SCHEMA,
+                      helper="extract_title_year_from_reference", stream=stream)
         
         if not llm:
             return fallback if fallback.get("title") or fallback.get("year") else None
 
         response = (prompt | llm | StrOutputParser()).invoke({"reference_text": reference_text})
-        response = response.strip()
-
-        if response.startswith("```json"): response = response[7:]
-        elif response.startswith("```"): response = response[3:]
-        if response.endswith("```"): response = response[:-3]
 
-        import json
-        try:
-            res_json = json.loads(response.strip())
+        res_json = parse_json("extract_title_year_from_reference", response)
+        if res_json is not None:
             title = res_json.get("title")
             year = str(res_json.get("year"))
 
@@ -221,9 +1036,9 @@ Response Format:
                 year = y_match.group(1) if y_match else fallback.get("year")
 
             if title or year:
-                return {"title": title, "year": year}
-        except (json.JSONDecodeError, TypeError):
-            pass
+                result = {"title": title, "year": year}
+                cache.set(cache_key, result)
+                return result
 
         return fallback if fallback.get("title") or fallback.get("year") else None
 
@@ -233,109 +1048,215 @@ Response Format:
         return fallback if fallback.get("title") or fallback.get("year") else None
 
 
+def _complete(llm, prompt_text: str) -> str:
+    # Invoke LLM directly (use chat() for OllamaLLM, invoke() for Groq)
+    if hasattr(llm, 'chat'):
+        return llm.chat(prompt_text)
+    from langchain_core.messages import HumanMessage
+    result = llm.invoke(HumanMessage(content=prompt_text))
+    return result.content if hasattr(result, 'content') else str(result)
+
+
+async def _acomplete(llm, prompt_text: str) -> str:
+    if hasattr(llm, 'achat'):
+        return await llm.achat(prompt_text)
+    from langchain_core.messages import HumanMessage
+    result = await llm.ainvoke(HumanMessage(content=prompt_text))
+    return result.content if hasattr(result, 'content') else str(result)
+
+
+def _full_form_batch_prompt(batch_contexts: List[tuple]) -> str:
+    batch_str = ""
+    for abbr, ctx in batch_contexts:
+        batch_str += f"\n\nAbbreviation: {abbr}\nContext: {ctx[:400]}"
+
+    # Build prompt directly (avoids LangChain escaping issues with inline JSON)
+    return (
+        'Extract the full form for each abbreviation using the context provided.\n\n'
+        'Return ONLY valid JSON like this example:\n'
+        '{"CNN": {"full_form": "Convolutional Neural Network", "source": "extracted"}, '
+        '"RNN": {"full_form": "Recurrent Neural Network", "source": "inferred"}}\n\n'
+        'Rules: source="extracted" if found in context, "inferred" if guessed, '
+        'empty string for unknown.\n\n'
+        f'{batch_str}\n\nJSON:'
+    )
+
+
+def _batch_members(helper: str, response: str) -> dict:
+    """
+    Complete members of a batch response's JSON object; raises if it holds no
+    object. When a cut-off object had to be repaired, its last member is left
+    out too: it may have lost the fields after the cut.
+    """
+    parsed, repaired = parse_json_object(helper, response)
+    if parsed is None:
+        raise ValueError("batch response is not a JSON object")
+    if repaired and parsed:
+        parsed.pop(list(parsed)[-1])
+    return parsed
+
+
+def _parse_full_form_batch(response: str, batch_contexts: List[tuple]) -> Dict[str, dict]:
+    """
+    Results for the abbreviations the batch response answered; the batch
+    runners retry the ones left out. Raises if it holds no JSON object.
+    """
+    parsed = _batch_members("find_full_form_batch", response)
+    results = {}
+    for abbr, ctx in batch_contexts:
+        entry = parsed.get(abbr)
+        if isinstance(entry, dict):
+            # Like find_full_form, LLM answers are always "inferred" whatever the model reports
+            results[abbr] = {"ans": entry.get("full_form", "NOT_FOUND"), "using_llm": True, "context": ctx}
+    return results
+
+
+def _regex_full_forms(abbrs: List[str], pdf_path: str) -> Dict[str, dict]:
+    # Same fast path as find_full_form: explicit '(ABBR)' definitions skip the LLM.
+    regex_map = get_abbr_definitions(pdf_path)
+    return {
+        abbr: {"ans": regex_map[abbr], "using_llm": False, "context": ""}
+        for abbr in abbrs if abbr in regex_map
+    }
+
+
 def find_full_form_batch(
     abbrs: List[str],
     pdf_path: str,
     groq_api_key: Optional[str] = None,
     use_local_llm: bool = False,
-    batch_size: int = 10
+    batch_size: int = 10,
+    retriever: Optional[str] = None,
+    controller: Optional[BatchController] = None,
+    use_cache: Optional[bool] = None,
+    stream: Optional[bool] = None,
 ) -> Dict[str, dict]:
     """
     Find full forms for multiple abbreviations in batched LLM calls.
 
-    VIS Performance Optimization: Reduces LLM calls from O(n) to O(n/batch_size).
-    For typical papers with 50 abbreviations:
-    - Sequential: 50 calls × 2s = 100 seconds
-    - Batched (10): 5 calls × 3s = 15 seconds
-    - Speedup: 6.7×
+    Abbreviations with an explicit '(ABBR)' definition skip the model. The
+    rest are sent several per call, with the batch size set by `controller`
+    (see `BatchController`): it grows after fast, well-formed responses and
+    shrinks after slow calls, parse failures or oversized prompts. A batch
+    whose response does not parse is split in half and retried; only an
+    abbreviation that fails on its own falls back to `find_full_form`.
 
     Args:
         abbrs: List of abbreviations to expand
         pdf_path: Path to PDF for RAG context
         groq_api_key: Groq API key (optional)
         use_local_llm: Whether to use local LLM
-        batch_size: Number of abbreviations per LLM call
+        batch_size: Number of abbreviations per LLM call (initial and largest size)
+        retriever: Context retriever backend (default: RETRIEVER_BACKEND)
+        controller: Adaptive batch sizing; replaces the fixed `batch_size`
+        use_cache, stream: Passed to `get_llm`
 
     Returns:
         Dictionary mapping abbreviation to result dict
     """
     try:
-        vectorstore = get_vectorstore(pdf_path, groq_api_key)
-        if not vectorstore:
-            return {abbr: {"ans": "Error: Could not initialize vector store.", "using_llm": False} for abbr in abbrs}
+        results = _regex_full_forms(abbrs, pdf_path)
+        abbrs = [abbr for abbr in abbrs if abbr not in results]
+        if not abbrs:
+            return results
+
+        # One batched retrieval for every term; k reduced for batching
+        retrieved = retrieve_term_contexts(abbrs, pdf_path, _abbr_query, k=2, backend=retriever, groq_api_key=groq_api_key)
+        if retrieved is None:
+            results.update({abbr: {"ans": "Error: Could not initialize vector store.", "using_llm": False} for abbr in abbrs})
+            return results
+
+        if controller is None:
+            controller = BatchController(initial=batch_size, max_size=batch_size)
+        session = session_for_path(pdf_path)
+
+        def _llm(size: int):
+            # The output cap follows the size of the batch actually sent
+            return get_llm(use_local_llm, groq_api_key, use_cache=use_cache, schema=JSON_OBJECT, helper="find_full_form_batch",
+                           num_predict=_NUM_PREDICT_PER_TERM["find_full_form_batch"] * size, session=session, stream=stream)
+
+        if _llm(1) is None:
+            results.update({abbr: {"ans": "Error: LLM not available.", "using_llm": False} for abbr in abbrs})
+            return results
+
+        contexts = {abbr: "\n".join(d.page_content for d in docs) for abbr, docs in zip(abbrs, retrieved)}
+
+        def _call(batch: List[str]) -> Dict[str, dict]:
+            batch_contexts = [(abbr, contexts[abbr]) for abbr in batch]
+            prompt_text = _full_form_batch_prompt(batch_contexts)
+            controller.observe_prompt(approx_tokens(prompt_text), len(batch))
+            return _parse_full_form_batch(_complete(_llm(len(batch)), prompt_text), batch_contexts)
+
+        results.update(run_batches_sync(
+            abbrs, _call,
+            lambda abbr: find_full_form(abbr, pdf_path, groq_api_key, use_local_llm, retriever=retriever,
+                                        use_cache=use_cache, stream=stream),
+            controller,
+        ))
+        return results
 
-        llm = get_llm(use_local_llm, groq_api_key)
-        if not llm:
-            return {abbr: {"ans": "Error: LLM not available.", "using_llm": False} for abbr in abbrs}
-
-        results = {}
-
-        # Process in batches
-        for i in range(0, len(abbrs), batch_size):
-            batch = abbrs[i:i + batch_size]
-
-            # Retrieve context for all abbreviations in batch
-            batch_contexts = []
-            for abbr in batch:
-                retriever = vectorstore.as_retriever(search_kwargs={"k": 2})  # Reduced k for batching
-                docs = retriever.invoke(f"What is the full form or definition of {abbr}?")
-                context = "\n".join(d.page_content for d in docs)
-                batch_contexts.append((abbr, context))
-
-            # Format batch data
-            batch_str = ""
-            for abbr, ctx in batch_contexts:
-                batch_str += f"\n\nAbbreviation: {abbr}\nContext: {ctx[:400]}"
-
-            # Build prompt directly (avoids LangChain escaping issues with inline JSON)
-            prompt_text = (
-                'Extract the full form for each abbreviation using the context provided.\n\n'
-                'Return ONLY valid JSON like this example:\n'
-                '{"CNN": {"full_form": "Convolutional Neural Network", "source": "extracted"}, '
-                '"RNN": {"full_form": "Recurrent Neural Network", "source": "inferred"}}\n\n'
-                'Rules: source="extracted" if found in context, "inferred" if guessed, '
-                'empty string for unknown.\n\n'
-                f'{batch_str}\n\nJSON:'
-            )
+    except Exception as e:
+        traceback.print_exc()
+        return {abbr: {"ans": f"An error occurred: {e}", "using_llm": False, "context": ""} for abbr in abbrs}
 
-            # Invoke LLM directly (use chat() for OllamaLLM, invoke() for Groq)
-            if hasattr(llm, 'chat'):
-                response = llm.chat(prompt_text)
-            else:
-                from langchain_core.messages import HumanMessage
-                result = llm.invoke(HumanMessage(content=prompt_text))
-                response = result.content if hasattr(result, 'content') else str(result)
 
-            try:
-                clean = response.strip()
-                if clean.startswith("```json"):
-                    clean = clean[7:]
-                elif clean.startswith("```"):
-                    clean = clean[3:]
-                if clean.endswith("```"):
-                    clean = clean[:-3]
-
-                parsed = json.loads(clean.strip())
-
-                # Extract results for each abbreviation in batch
-                for abbr in batch:
-                    if abbr in parsed:
-                        ans = parsed[abbr].get("full_form", "NOT_FOUND")
-                        source = parsed[abbr].get("source", "inferred")
-                        results[abbr] = {
-                            "ans": ans,
-                            "using_llm": source != "extracted",
-                            "context": next((ctx for a, ctx in batch_contexts if a == abbr), "")
-                        }
-                    else:
-                        results[abbr] = {"ans": "NOT_FOUND", "using_llm": True, "context": ""}
-
-            except Exception as e:
-                # Fallback to individual processing if batch fails
-                print(f"Batch processing failed, falling back to individual: {e}")
-                for abbr in batch:
-                    results[abbr] = find_full_form(abbr, pdf_path, groq_api_key, use_local_llm)
+async def afind_full_form_batch(
+    abbrs: List[str],
+    pdf_path: str,
+    groq_api_key: Optional[str] = None,
+    use_local_llm: bool = False,
+    retriever: Optional[str] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    controller: Optional[BatchController] = None,
+    on_done=None,
+    use_cache: Optional[bool] = None,
+    stream: Optional[bool] = None,
+) -> Dict[str, dict]:
+    """
+    Async `find_full_form_batch`. Batches are sized by `controller` and sent
+    concurrently, each model call holding one `limiter` slot.
+    """
+    try:
+        results = await asyncio.to_thread(_regex_full_forms, abbrs, pdf_path)
+        abbrs = [abbr for abbr in abbrs if abbr not in results]
+        if not abbrs:
+            return results
 
+        retrieved = await asyncio.to_thread(
+            retrieve_term_contexts, abbrs, pdf_path, _abbr_query, 2, retriever, groq_api_key,
+        )
+        if retrieved is None:
+            results.update({abbr: {"ans": "Error: Could not initialize vector store.", "using_llm": False} for abbr in abbrs})
+            return results
+
+        controller = controller or BatchController(initial=10, max_size=20)
+        session = session_for_path(pdf_path)
+
+        def _llm(size: int):
+            return get_llm(use_local_llm, groq_api_key, use_cache=use_cache, limiter=limiter, schema=JSON_OBJECT,
+                           helper="find_full_form_batch",
+                           num_predict=_NUM_PREDICT_PER_TERM["find_full_form_batch"] * size, session=session, stream=stream)
+
+        if _llm(1) is None:
+            results.update({abbr: {"ans": "Error: LLM not available.", "using_llm": False} for abbr in abbrs})
+            return results
+
+        contexts = {abbr: "\n".join(d.page_content for d in docs) for abbr, docs in zip(abbrs, retrieved)}
+
+        async def _call(batch: List[str]) -> Dict[str, dict]:
+            batch_contexts = [(abbr, contexts[abbr]) for abbr in batch]
+            prompt_text = _full_form_batch_prompt(batch_contexts)
+            controller.observe_prompt(approx_tokens(prompt_text), len(batch))
+            return _parse_full_form_batch(await _acomplete(_llm(len(batch)), prompt_text), batch_contexts)
+
+        results.update(await run_batches(
+            abbrs, _call,
+            lambda abbr: afind_full_form(abbr, pdf_path, groq_api_key, use_local_llm, retriever=retriever, limiter=limiter,
+                                         use_cache=use_cache, stream=stream),
+            controller,
+            workers=limiter.max_limit if limiter else 1,
+            on_done=on_done,
+        ))
         return results
 
     except Exception as e:
@@ -421,9 +1342,10 @@ def extract_abbr_definitions_from_pdf(pdf_path: str) -> Dict[str, str]:
     import pymupdf
     definitions_map = {}
     try:
-        doc = pymupdf.open(pdf_path)
-        full_text = " ".join(page.get_text() for page in doc)
-        doc.close()
+        with MUPDF_LOCK:
+            doc = pymupdf.open(pdf_path)
+            full_text = " ".join(page.get_text() for page in doc)
+            doc.close()
 
         # Normalize Unicode ligatures → ASCII (critical for typeset PDFs)
         full_text = full_text.translate(_LIGATURE_MAP)
@@ -456,30 +1378,52 @@ def extract_abbr_definitions_from_pdf(pdf_path: str) -> Dict[str, str]:
     return definitions_map
 
 
-def find_full_form(abbr: str, pdf_path: str, groq_api_key: Optional[str] = None, use_local_llm: bool = False) -> dict:
+def pdf_fingerprint(pdf_path: str) -> str:
+    """
+    sha256 of the file contents. Hashes are remembered per (path, size, mtime),
+    so repeated calls for an unchanged file only cost a stat().
+    """
+    st = os.stat(pdf_path)
+    stat_key = (os.path.abspath(pdf_path), st.st_size, st.st_mtime_ns)
+    fingerprint = _pdf_fingerprints.get(stat_key)
+    if fingerprint is None:
+        digest = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+        if len(_pdf_fingerprints) >= _MAX_FINGERPRINTS:
+            _pdf_fingerprints.clear()
+        _pdf_fingerprints[stat_key] = fingerprint
+    return fingerprint
+
+
+def get_abbr_definitions(pdf_path: str) -> Dict[str, str]:
+    """
+    Memoized `extract_abbr_definitions_from_pdf`: the document is scanned once
+    and the index reused until the file changes. The most recently used
+    `_ABBR_INDEX_MAX_DOCUMENTS` indexes are kept. Treat the result as read-only.
+    """
     try:
-        # --- Fast path: regex extraction from raw PDF text (highest accuracy) ---
-        regex_map = extract_abbr_definitions_from_pdf(pdf_path)
-        if abbr in regex_map:
-            return {
-                "ans": regex_map[abbr],
-                "using_llm": False,
-                "context": "",
-            }
-
-        vectorstore = get_vectorstore(pdf_path, groq_api_key)
-        if not vectorstore:
-            return {"ans": "Error: Could not initialize vector store.", "using_llm": False}
+        key = (os.path.abspath(pdf_path), pdf_fingerprint(pdf_path))
+    except OSError:
+        return {}
+
+    with _abbr_indexes_lock:
+        if key in _abbr_indexes:
+            _abbr_indexes.move_to_end(key)
+            return _abbr_indexes[key]
+
+    definitions_map = extract_abbr_definitions_from_pdf(pdf_path)
+    with _abbr_indexes_lock:
+        _abbr_indexes[key] = definitions_map
+        _abbr_indexes.move_to_end(key)
+        while len(_abbr_indexes) > _ABBR_INDEX_MAX_DOCUMENTS:
+            _abbr_indexes.popitem(last=False)
+    return definitions_map
 
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-        docs = retriever.invoke(f"What is the full form or definition of {abbr}?")
-        context = "\n\n".join(d.page_content for d in docs)
 
-        llm = get_llm(use_local_llm, groq_api_key)
-        if not llm:
-            return {"ans": "Error: LLM not available.", "using_llm": False}
-
-        template = """
+_FULL_FORM_INSTRUCTIONS = """
         You are an information extraction system.
 
         Task: Find the FULL FORM of a given abbreviation.
@@ -508,34 +1452,72 @@ def find_full_form(abbr: str, pdf_path: str, groq_api_key: Optional[str] = None,
             "source": "extracted"
         }}
 
-        Context:
+"""
+
+_FULL_FORM_QUERY = """        Context:
         {context}
 
         Abbreviation: {abbreviation}
         """
 
-        prompt = ChatPromptTemplate.from_template(template)
+_FULL_FORM_TEMPLATE = _FULL_FORM_INSTRUCTIONS + _FULL_FORM_QUERY
+
+
+def _term_prompt(instructions: str, query: str, session: Optional[DocumentSession]) -> ChatPromptTemplate:
+    """
+    Prompt for a single-term lookup. In a document session the instructions
+    join the shared system prefix, so each call only adds `query`.
+    """
+    if session is None:
+        return ChatPromptTemplate.from_template(instructions + query)
+    return ChatPromptTemplate.from_messages([
+        ("system", textwrap.dedent(instructions).strip()),
+        ("human", textwrap.dedent(query).strip()),
+    ])
+
+
+def _parse_full_form(response: str) -> str:
+    parsed = parse_json("find_full_form", response)
+    if parsed is None:
+        return response.strip()
+    return parsed.get("full_form", "NOT_FOUND")
+
+
+def find_full_form(abbr: str, pdf_path: str, groq_api_key: Optional[str] = None, use_local_llm: bool = False, retriever: Optional[str] = None,
+                   use_cache: Optional[bool] = None, stream: Optional[bool] = None) -> dict:
+    try:
+        # --- Fast path: regex extraction from raw PDF text (highest accuracy) ---
+        regex_map = get_abbr_definitions(pdf_path)
+        if abbr in regex_map:
+            return {
+                "ans": regex_map[abbr],
+                "using_llm": False,
+                "context": "",
+            }
+
+        retrieved = retrieve_term_contexts([abbr], pdf_path, _abbr_query, k=3, backend=retriever, groq_api_key=groq_api_key)
+        if retrieved is None:
+            return {"ans": "Error: Could not initialize vector store.", "using_llm": False}
+
+        docs = retrieved[0]
+        context = "\n\n".join(d.page_content for d in docs)
+
+        session = session_for_path(pdf_path) if use_local_llm else None
+        llm = get_llm(use_local_llm, groq_api_key, use_cache=use_cache, schema=FULL_FORM_SCHEMA, helper="find_full_form",
+                      session=session, stream=stream)
+        if not llm:
+            return {"ans": "Error: LLM not available.", "using_llm": False}
+
+        prompt = _term_prompt(_FULL_FORM_INSTRUCTIONS, _FULL_FORM_QUERY, session)
         response = (prompt | llm | StrOutputParser()).invoke({
-            "context": context,
+            # The session prefix carries the document; the prompt keeps the sentences about the term
+            "context": term_sentences(context, abbr) if session is not None else context,
             "abbreviation": abbr
         })
 
-        try:
-            clean = response.strip()
-            if clean.startswith("```json"):
-                clean = clean[7:]
-            elif clean.startswith("```"):
-                clean = clean[3:]
-            if clean.endswith("```"):
-                clean = clean[:-3]
-            parsed = json.loads(clean.strip())
-            ans = parsed.get("full_form", "NOT_FOUND")
-        except Exception:
-            ans = response.strip()
-
         # LLM fallback is always "inferred" — never trust self-reported source from the model
         return {
-            "ans": ans,
+            "ans": _parse_full_form(response),
             "using_llm": True,
             "context": context,
         }
@@ -545,17 +1527,124 @@ def find_full_form(abbr: str, pdf_path: str, groq_api_key: Optional[str] = None,
         return {"ans": f"An error occurred: {e}", "using_llm": False, "context": ""}
 
 
+async def afind_full_form(abbr: str, pdf_path: str, groq_api_key: Optional[str] = None, use_local_llm: bool = False,
+                          retriever: Optional[str] = None, limiter: Optional[AdaptiveLimiter] = None,
+                          use_cache: Optional[bool] = None, stream: Optional[bool] = None) -> dict:
+    """
+    Async `find_full_form`: the regex index and retrieval run on a worker
+    thread, the model call is awaited (through `limiter` when given).
+    """
+    try:
+        regex_map = await asyncio.to_thread(get_abbr_definitions, pdf_path)
+        if abbr in regex_map:
+            return {
+                "ans": regex_map[abbr],
+                "using_llm": False,
+                "context": "",
+            }
+
+        retrieved = await asyncio.to_thread(
+            retrieve_term_contexts, [abbr], pdf_path, _abbr_query, 3, retriever, groq_api_key,
+        )
+        if retrieved is None:
+            return {"ans": "Error: Could not initialize vector store.", "using_llm": False}
+
+        context = "\n\n".join(d.page_content for d in retrieved[0])
+
+        session = session_for_path(pdf_path) if use_local_llm else None
+        llm = get_llm(use_local_llm, groq_api_key, use_cache=use_cache, limiter=limiter, schema=FULL_FORM_SCHEMA,
+                      helper="find_full_form", session=session, stream=stream)
+        if not llm:
+            return {"ans": "Error: LLM not available.", "using_llm": False}
+
+        prompt = _term_prompt(_FULL_FORM_INSTRUCTIONS, _FULL_FORM_QUERY, session)
+        response = await (prompt | llm | StrOutputParser()).ainvoke({
+            "context": term_sentences(context, abbr) if session is not None else context,
+            "abbreviation": abbr
+        })
+        return {
+            "ans": _parse_full_form(response),
+            "using_llm": True,
+            "context": context,
+        }
+
+    except Exception as e:
+        traceback.print_exc()
+        return {"ans": f"An error occurred: {e}", "using_llm": False, "context": ""}
+
+
+def _symbol_batch_prompt(batch_with_context: List[tuple]) -> str:
+    batch_str = ""
+    for symbol, ctx in batch_with_context:
+        # Escape backslashes in symbol names so they don't break JSON in the response
+        safe_symbol = symbol.replace('\\', '\\\\')
+        batch_str += f"\n\nSymbol: {safe_symbol}\nContext: {(ctx[:400] if ctx else 'No context')}"
+
+    # Build prompt directly (avoids LangChain escaping issues with inline JSON)
+    return (
+        'Extract the meaning of each mathematical symbol from the paper context.\n\n'
+        'Return ONLY valid JSON. Use simple alphanumeric keys (replace backslashes with nothing).\n'
+        'Example: {"alpha": {"meaning": "learning rate", "description": "controls step size", "source": "extracted"}}\n\n'
+        'Rules: meaning=1-4 words, source="extracted" if defined in context, "inferred" if guessed, '
+        '"NOT_FOUND" if unknown.\n\n'
+        f'{batch_str}\n\nJSON:'
+    )
+
+
+def _parse_symbol_batch(response: str, symbols: List[str]) -> Dict[str, dict]:
+    """
+    Results for the symbols the batch response answered; the batch runners
+    retry the ones left out. Raises if it holds no JSON object.
+    """
+    parsed = _batch_members("find_symbol_meaning_batch", response)
+    results = {}
+    for symbol in symbols:
+        # Try both original key and backslash-stripped key
+        safe_key = symbol.replace('\\', '')
+        data = parsed.get(symbol) or parsed.get(safe_key)
+        if isinstance(data, dict):
+            results[symbol] = {
+                "meaning": data.get("meaning", "NOT_FOUND"),
+                "description": data.get("description", "NOT_FOUND"),
+                "source": data.get("source", "inferred")
+            }
+    return results
+
+
+def _symbol_batch_contexts(symbols_with_context: List[tuple], retrieved: Optional[List[list]]) -> Dict[str, str]:
+    """Prompt context per symbol: retrieved passages (when any) ahead of the local context."""
+    if retrieved is None:
+        return dict(symbols_with_context)
+    contexts = {}
+    for (symbol, local_context), docs in zip(symbols_with_context, retrieved):
+        rag_context = "\n".join(d.page_content for d in docs[:2])
+        combined = ""
+        if rag_context:
+            combined += f"Relevant passages: {rag_context[:300]}...\n"
+        if local_context:
+            combined += f"Local context: {local_context}"
+        contexts[symbol] = combined
+    return contexts
+
+
 def find_symbol_meaning_batch(
     symbols_with_context: List[tuple],
     pdf_path: str = "",
     groq_api_key: Optional[str] = None,
     use_local_llm: bool = False,
-    batch_size: int = 8
+    batch_size: int = 8,
+    retriever: Optional[str] = None,
+    controller: Optional[BatchController] = None,
+    session_path: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    stream: Optional[bool] = None,
 ) -> Dict[str, dict]:
     """
     Find meanings for multiple symbols in batched LLM calls.
 
-    VIS Performance Optimization: Similar to abbreviation batching.
+    Batches are sized adaptively by `controller`, as in `find_full_form_batch`.
+    A batch whose response does not parse is split in half and retried; only
+    a symbol that fails on its own falls back to `find_symbol_meaning`.
 
     Args:
         symbols_with_context: List of (symbol, context) tuples
@@ -563,96 +1652,50 @@ def find_symbol_meaning_batch(
         groq_api_key: Groq API key (optional)
         use_local_llm: Whether to use local LLM
         batch_size: Number of symbols per LLM call (smaller than abbr due to context length)
+        retriever: Context retriever backend (default: RETRIEVER_BACKEND)
+        controller: Adaptive batch sizing; replaces the fixed `batch_size`
+        session_path: Document whose session prefix to use when `pdf_path`
+            is left empty (local context only)
+        use_cache, stream: Passed to `get_llm`
 
     Returns:
         Dictionary mapping symbol to result dict
     """
     try:
-        llm = get_llm(use_local_llm, groq_api_key)
-        if not llm:
+        if controller is None:
+            controller = BatchController(initial=batch_size, max_size=batch_size)
+        session = session_for_path(session_path or pdf_path)
+
+        def _llm(size: int):
+            # The output cap follows the size of the batch actually sent
+            return get_llm(use_local_llm, groq_api_key, use_cache=use_cache, schema=JSON_OBJECT,
+                           helper="find_symbol_meaning_batch",
+                           num_predict=_NUM_PREDICT_PER_TERM["find_symbol_meaning_batch"] * size, session=session,
+                           stream=stream)
+
+        if _llm(1) is None:
             return {sym: {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
                     for sym, _ in symbols_with_context}
 
-        results = {}
-
-        # Process in batches
-        for i in range(0, len(symbols_with_context), batch_size):
-            batch = symbols_with_context[i:i + batch_size]
-
-            # Build RAG context for batch if PDF provided
-            batch_with_rag = []
-            if pdf_path:
-                vectorstore = get_vectorstore(pdf_path, groq_api_key)
-                if vectorstore:
-                    for symbol, local_context in batch:
-                        retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
-                        docs = retriever.invoke(f"What does the symbol {symbol} represent or mean?")
-                        rag_context = "\n".join(d.page_content for d in docs[:2])
-                        combined = ""
-                        if rag_context:
-                            combined += f"Relevant passages: {rag_context[:300]}...\n"
-                        if local_context:
-                            combined += f"Local context: {local_context}"
-                        batch_with_rag.append((symbol, combined))
-                else:
-                    batch_with_rag = batch
-            
-            batch_str = ""
-            for symbol, ctx in batch_with_rag:
-                # Escape backslashes in symbol names so they don't break JSON in the response
-                safe_symbol = symbol.replace('\\', '\\\\')
-                batch_str += f"\n\nSymbol: {safe_symbol}\nContext: {(ctx[:400] if ctx else 'No context')}"
-
-            # Build prompt directly (avoids LangChain escaping issues with inline JSON)
-            prompt_text = (
-                'Extract the meaning of each mathematical symbol from the paper context.\n\n'
-                'Return ONLY valid JSON. Use simple alphanumeric keys (replace backslashes with nothing).\n'
-                'Example: {"alpha": {"meaning": "learning rate", "description": "controls step size", "source": "extracted"}}\n\n'
-                'Rules: meaning=1-4 words, source="extracted" if defined in context, "inferred" if guessed, '
-                '"NOT_FOUND" if unknown.\n\n'
-                f'{batch_str}\n\nJSON:'
-            )
-
-            if hasattr(llm, 'chat'):
-                response = llm.chat(prompt_text)
-            else:
-                from langchain_core.messages import HumanMessage
-                result = llm.invoke(HumanMessage(content=prompt_text))
-                response = result.content if hasattr(result, 'content') else str(result)
-            response = response.strip()
-
-            if response.startswith("```json"):
-                response = response[7:]
-            elif response.startswith("```"):
-                response = response[3:]
-            if response.endswith("```"):
-                response = response[:-3]
-
-            try:
-                parsed = json.loads(response.strip())
-
-                for symbol, _ in batch:
-                    # Try both original key and backslash-stripped key
-                    safe_key = symbol.replace('\\', '')
-                    data = parsed.get(symbol) or parsed.get(safe_key)
-                    if data:
-                        results[symbol] = {
-                            "meaning": data.get("meaning", "NOT_FOUND"),
-                            "description": data.get("description", "NOT_FOUND"),
-                            "source": data.get("source", "inferred")
-                        }
-                    else:
-                        results[symbol] = {
-                            "meaning": "NOT_FOUND",
-                            "description": "NOT_FOUND",
-                            "source": "not_found"
-                        }
-            except Exception as e:
-                print(f"Batch symbol processing failed, falling back: {e}")
-                for symbol, context in batch:
-                    results[symbol] = find_symbol_meaning(symbol, context, pdf_path, groq_api_key, use_local_llm)
-
-        return results
+        retrieved = None
+        if pdf_path:
+            # One batched retrieval for every symbol
+            retrieved = retrieve_term_contexts([sym for sym, _ in symbols_with_context], pdf_path, _symbol_query,
+                                               k=2, backend=retriever, groq_api_key=groq_api_key)
+        contexts = _symbol_batch_contexts(symbols_with_context, retrieved)
+        local_contexts = dict(symbols_with_context)
+
+        def _call(batch: List[str]) -> Dict[str, dict]:
+            prompt_text = _symbol_batch_prompt([(symbol, contexts[symbol]) for symbol in batch])
+            controller.observe_prompt(approx_tokens(prompt_text), len(batch))
+            return _parse_symbol_batch(_complete(_llm(len(batch)), prompt_text), batch)
+
+        return run_batches_sync(
+            list(contexts), _call,
+            lambda symbol: find_symbol_meaning(symbol, local_contexts[symbol], pdf_path or session_path or "",
+                                               groq_api_key, use_local_llm, use_cache=use_cache, stream=stream),
+            controller,
+        )
 
     except Exception:
         traceback.print_exc()
@@ -660,16 +1703,67 @@ def find_symbol_meaning_batch(
                 for sym, _ in symbols_with_context}
 
 
-def find_symbol_meaning(symbol: str, context: str, pdf_path: str = "", groq_api_key: Optional[str] = None, use_local_llm: bool = False) -> dict:
+async def afind_symbol_meaning_batch(
+    symbols_with_context: List[tuple],
+    pdf_path: str = "",
+    groq_api_key: Optional[str] = None,
+    use_local_llm: bool = False,
+    retriever: Optional[str] = None,
+    limiter: Optional[AdaptiveLimiter] = None,
+    controller: Optional[BatchController] = None,
+    on_done=None,
+    session_path: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    stream: Optional[bool] = None,
+) -> Dict[str, dict]:
+    """
+    Async `find_symbol_meaning_batch`. Batches are sized by `controller` and
+    sent concurrently, each model call holding one `limiter` slot.
+    """
     try:
-        combined_context = ""
-        if context:
-            combined_context += "Local context where the symbol appears:\n" + context
+        controller = controller or BatchController(initial=8, max_size=16)
+        session = session_for_path(session_path or pdf_path)
 
-        if not combined_context.strip():
-            return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+        def _llm(size: int):
+            return get_llm(use_local_llm, groq_api_key, use_cache=use_cache, limiter=limiter, schema=JSON_OBJECT,
+                           helper="find_symbol_meaning_batch",
+                           num_predict=_NUM_PREDICT_PER_TERM["find_symbol_meaning_batch"] * size, session=session,
+                           stream=stream)
+
+        if _llm(1) is None:
+            return {sym: {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+                    for sym, _ in symbols_with_context}
+
+        retrieved = None
+        if pdf_path:
+            retrieved = await asyncio.to_thread(
+                retrieve_term_contexts, [sym for sym, _ in symbols_with_context], pdf_path, _symbol_query,
+                2, retriever, groq_api_key,
+            )
+        contexts = _symbol_batch_contexts(symbols_with_context, retrieved)
+        local_contexts = dict(symbols_with_context)
+
+        async def _call(batch: List[str]) -> Dict[str, dict]:
+            prompt_text = _symbol_batch_prompt([(symbol, contexts[symbol]) for symbol in batch])
+            controller.observe_prompt(approx_tokens(prompt_text), len(batch))
+            return _parse_symbol_batch(await _acomplete(_llm(len(batch)), prompt_text), batch)
+
+        return await run_batches(
+            list(contexts), _call,
+            lambda symbol: afind_symbol_meaning(symbol, local_contexts[symbol], pdf_path or session_path or "", groq_api_key,
+                                                use_local_llm, limiter=limiter, use_cache=use_cache, stream=stream),
+            controller,
+            workers=limiter.max_limit if limiter else 1,
+            on_done=on_done,
+        )
+
+    except Exception:
+        traceback.print_exc()
+        return {sym: {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+                for sym, _ in symbols_with_context}
 
-        template = """You are extracting mathematical symbol definitions from a research paper.
+
+_SYMBOL_MEANING_INSTRUCTIONS = """You are extracting mathematical symbol definitions from a research paper.
 
 Return ONLY a valid JSON object. No extra text.
 
@@ -690,41 +1784,83 @@ STRICT RULES:
 - If you reasonably infer it → source = "inferred"
 - If you cannot determine the meaning → set meaning to "NOT_FOUND"
 
-Context:
+"""
+
+_SYMBOL_MEANING_QUERY = """Context:
 {context}
 
 Symbol: {symbol}
 """
 
-        llm = get_llm(use_local_llm, groq_api_key)
+_SYMBOL_MEANING_TEMPLATE = _SYMBOL_MEANING_INSTRUCTIONS + _SYMBOL_MEANING_QUERY
+
+
+def _parse_symbol_meaning(response: str) -> dict:
+    res = parse_json("find_symbol_meaning", response)
+    if res is None:
+        return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+    return {
+        "meaning": res.get("meaning", "NOT_FOUND"),
+        "description": res.get("description", "NOT_FOUND"),
+        "source": res.get("source", "inferred")
+    }
+
+
+def find_symbol_meaning(symbol: str, context: str, pdf_path: str = "", groq_api_key: Optional[str] = None, use_local_llm: bool = False,
+                        use_cache: Optional[bool] = None, stream: Optional[bool] = None) -> dict:
+    try:
+        combined_context = ""
+        if context:
+            combined_context += "Local context where the symbol appears:\n" + context
+
+        if not combined_context.strip():
+            return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+
+        session = session_for_path(pdf_path) if use_local_llm else None
+        llm = get_llm(use_local_llm, groq_api_key, use_cache=use_cache, schema=SYMBOL_MEANING_SCHEMA,
+                      helper="find_symbol_meaning", session=session, stream=stream)
         if not llm:
             return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
 
-        prompt = ChatPromptTemplate.from_template(template)
+        prompt = _term_prompt(_SYMBOL_MEANING_INSTRUCTIONS, _SYMBOL_MEANING_QUERY, session)
+        if session is not None:
+            # The session prefix carries the document; the prompt keeps the sentences about the symbol
+            combined_context = "Local context where the symbol appears:\n" + term_sentences(context, symbol)
 
         response = (prompt | llm | StrOutputParser()).invoke({
             "symbol": symbol,
             "context": combined_context
-        }).strip()
-
-        if response.startswith("```json"):
-            response = response[7:]
-        elif response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-
-        try:
-            res = json.loads(response)
-            return {
-                "meaning": res.get("meaning", "NOT_FOUND"),
-                "description": res.get("description", "NOT_FOUND"),
-                "source": res.get("source", "inferred")
-            }
-        except:
+        })
+        return _parse_symbol_meaning(response)
+
+    except Exception:
+        traceback.print_exc()
+        return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+
+
+async def afind_symbol_meaning(symbol: str, context: str, pdf_path: str = "", groq_api_key: Optional[str] = None,
+                               use_local_llm: bool = False, limiter: Optional[AdaptiveLimiter] = None,
+                               use_cache: Optional[bool] = None, stream: Optional[bool] = None) -> dict:
+    """Async `find_symbol_meaning`; the model call goes through `limiter` when given."""
+    try:
+        if not context:
+            return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
+
+        session = session_for_path(pdf_path) if use_local_llm else None
+        llm = get_llm(use_local_llm, groq_api_key, use_cache=use_cache, limiter=limiter, schema=SYMBOL_MEANING_SCHEMA,
+                      helper="find_symbol_meaning", session=session, stream=stream)
+        if not llm:
             return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
 
+        prompt = _term_prompt(_SYMBOL_MEANING_INSTRUCTIONS, _SYMBOL_MEANING_QUERY, session)
+        if session is not None:
+            context = term_sentences(context, symbol)
+        response = await (prompt | llm | StrOutputParser()).ainvoke({
+            "symbol": symbol,
+            "context": "Local context where the symbol appears:\n" + context
+        })
+        return _parse_symbol_meaning(response)
+
     except Exception:
         traceback.print_exc()
         return {"meaning": "NOT_FOUND", "description": "NOT_FOUND", "source": "not_found"}
@@ -737,7 +1873,7 @@ def critique_abbr(abbr: str, expansion: str, context: str, groq_api_key: Optiona
     Returns "HIGH", "MEDIUM", or "LOW".
     """
     try:
-        llm = get_llm(use_local_llm, groq_api_key)
+        llm = get_llm(use_local_llm, groq_api_key, schema=CRITIQUE_SCHEMA, helper="critique_abbr")
         if not llm:
             return "MEDIUM"
 
@@ -761,17 +1897,10 @@ Return ONLY a JSON object with keys "confidence" (HIGH, MEDIUM, or LOW) and "rea
             "abbr": abbr,
             "expansion": expansion,
             "context": context,
-        }).strip()
-
-        if response.startswith("```json"):
-            response = response[7:]
-        elif response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
+        })
 
-        parsed = json.loads(response.strip())
-        confidence = parsed.get("confidence", "MEDIUM").upper()
+        parsed = parse_json("critique_abbr", response) or {}
+        confidence = str(parsed.get("confidence", "MEDIUM")).upper()
         return confidence if confidence in ("HIGH", "MEDIUM", "LOW") else "MEDIUM"
     except Exception:
         return "MEDIUM"
@@ -784,7 +1913,7 @@ def critique_sym(symbol: str, meaning: str, context: str, groq_api_key: Optional
     Returns "HIGH", "MEDIUM", or "LOW".
     """
     try:
-        llm = get_llm(use_local_llm, groq_api_key)
+        llm = get_llm(use_local_llm, groq_api_key, schema=CRITIQUE_SCHEMA, helper="critique_sym")
         if not llm:
             return "MEDIUM"
 
@@ -808,17 +1937,10 @@ Return ONLY a JSON object with keys "confidence" (HIGH, MEDIUM, or LOW) and "rea
             "symbol": symbol,
             "meaning": meaning,
             "context": context,
-        }).strip()
-
-        if response.startswith("```json"):
-            response = response[7:]
-        elif response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
+        })
 
-        parsed = json.loads(response.strip())
-        confidence = parsed.get("confidence", "MEDIUM").upper()
+        parsed = parse_json("critique_sym", response) or {}
+        confidence = str(parsed.get("confidence", "MEDIUM")).upper()
         return confidence if confidence in ("HIGH", "MEDIUM", "LOW") else "MEDIUM"
     except Exception:
         return "MEDIUM"
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+import weakref
+import pymupdf
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Image block keys kept in the layout; the embedded image payload is dropped.
+_IMAGE_BLOCK_KEYS = ("number", "type", "bbox")
+
+# MuPDF is not thread-safe: hold this around any document access that may run
+# concurrently with another thread (pipelined annotation, resolver workers).
+MUPDF_LOCK = threading.RLock()
+
+# Layouts of documents being annotated, by absolute path, so services that
+# only receive a pdf_path can reuse the extraction instead of re-parsing.
+_layouts_by_path: "weakref.WeakValueDictionary[str, DocumentLayout]" = weakref.WeakValueDictionary()
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _dict_blocks(page: pymupdf.Page) -> List[dict]:
+    """
+    ``page.get_text("dict")`` blocks with the default flags, so block indices
+    and text segmentation are those the detectors always used. Image blocks
+    stay in place (as bbox-only stubs with no lines) to keep the indices.
+    """
+    blocks = []
+    for b in page.get_text("dict")["blocks"]:
+        if b.get("type", 0) != 0:
+            b = {key: b[key] for key in _IMAGE_BLOCK_KEYS if key in b}
+            b["lines"] = []
+        blocks.append(b)
+    return blocks
+
+
+class PageLayout:
+    """Text layout of a single page, extracted once."""
+
+    __slots__ = ("number", "width", "height", "blocks", "_text_blocks", "_text")
+
+    def __init__(self, number: int, width: float, height: float, blocks: List[dict]):
+        self.number = number
+        self.width = width
+        self.height = height
+        self.blocks = blocks
+        self._text_blocks: Optional[List[tuple]] = None
+        self._text: Optional[str] = None
+
+
+class DocumentLayout:
+    """
+    Per-document cache of extracted page layout.
+
+    Each page is run through the text extractor at most once; the detectors in
+    ``parser`` and the helpers in ``pdf_transform`` read blocks/lines/spans from
+    here instead of calling ``page.get_text`` themselves. Derived per-document
+    results (references range, candidate scans, ...) are memoized via ``memo``.
+    """
+
+    def __init__(self, doc: pymupdf.Document):
+        self.doc = doc
+        self._pages: Dict[int, PageLayout] = {}
+        self._memo: Dict[Any, Any] = {}
+
+    def __len__(self) -> int:
+        return self.doc.page_count
+
+    def page(self, page_idx: int) -> PageLayout:
+        cached = self._pages.get(page_idx)
+        if cached is None:
+            page = self.doc[page_idx]
+            cached = PageLayout(page_idx, page.rect.width, page.rect.height, _dict_blocks(page))
+            self._pages[page_idx] = cached
+        return cached
+
+    def adopt(self, pages: List[PageLayout]) -> None:
+        """Install pages extracted elsewhere (e.g. by a worker process) into the cache."""
+        for page in pages:
+            self._pages.setdefault(page.number, page)
+
+    def blocks(self, page_idx: int) -> List[dict]:
+        """Dict blocks in extraction order; image blocks have ``type`` 1 and no lines."""
+        return self.page(page_idx).blocks
+
+    def text_blocks(self, page_idx: int) -> List[tuple]:
+        """
+        ``page.get_text("blocks")``, extracted on first use. Its flags omit
+        images, which changes how text is grouped into blocks, so these are
+        not derived from the dict blocks.
+        """
+        page = self.page(page_idx)
+        if page._text_blocks is None:
+            page._text_blocks = self.doc[page_idx].get_text("blocks")
+        return page._text_blocks
+
+    def text(self, page_idx: int) -> str:
+        """Plain page text: the text blocks joined (``page.get_text()`` up to line breaks in NUL glyph runs)."""
+        page = self.page(page_idx)
+        if page._text is None:
+            page._text = "".join(b[4] for b in self.text_blocks(page_idx) if b[6] == 0)
+        return page._text
+
+    def page_size(self, page_idx: int) -> Tuple[float, float]:
+        p = self.page(page_idx)
+        return p.width, p.height
+
+    def memo(self, key: Any, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, computing it with ``factory`` on first use."""
+        if key not in self._memo:
+            self._memo[key] = factory()
+        return self._memo[key]
+
+    def memoized(self, key: Any) -> bool:
+        """Whether ``memo`` already holds a value for ``key``."""
+        return key in self._memo
+
+
+def get_layout(doc: pymupdf.Document, layout: Optional[DocumentLayout] = None) -> DocumentLayout:
+    """Return ``layout`` if given, otherwise a fresh layout for ``doc``."""
+    if layout is not None:
+        return layout
+    return DocumentLayout(doc)
+
+
+def register_layout(path: str, layout: DocumentLayout) -> None:
+    """Make ``layout`` available to ``layout_for_path`` while it is alive."""
+    _layouts_by_path[os.path.abspath(path)] = layout
+
+
+def layout_for_path(path: str) -> Optional[DocumentLayout]:
+    return _layouts_by_path.get(os.path.abspath(path))
+
+
+def _block_text(text: str) -> str:
+    # Rejoin hyphenated line breaks, then unwrap the remaining lines.
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    return " ".join(text.split())
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split an oversized paragraph at sentence (or, failing that, word) boundaries."""
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        words = [sentence] if len(sentence) <= max_chars else sentence.split(" ")
+        for part in words:
+            if current and len(current) + 1 + len(part) > max_chars:
+                pieces.append(current)
+                current = part
+            else:
+                current = f"{current} {part}" if current else part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def text_chunks(layout: DocumentLayout, max_chars: int = 500) -> List[dict]:
+    """
+    Paragraph-aligned retrieval chunks built from the extracted text blocks.
+
+    Consecutive blocks in the same page column are merged while they fit in
+    ``max_chars``; longer blocks are split at sentence boundaries. Chunks do not
+    overlap. Each chunk is ``{"text", "page", "column", "bbox"}``, with the bbox
+    covering every block it was built from.
+    """
+    chunks: List[dict] = []
+    current: Optional[dict] = None
+
+    def _flush():
+        nonlocal current
+        if current is not None:
+            chunks.append(current)
+            current = None
+
+    for page_idx in range(len(layout)):
+        page = layout.page(page_idx)
+        for x0, y0, x1, y1, raw, *_ in layout.text_blocks(page_idx):
+            text = _block_text(raw)
+            if not text:
+                continue
+            column = 1 if (x0 + x1) / 2 < page.width / 2 else 2
+            if (current is not None and current["page"] == page_idx and current["column"] == column
+                    and len(current["text"]) + 1 + len(text) <= max_chars):
+                current["text"] += " " + text
+                bx0, by0, bx1, by1 = current["bbox"]
+                current["bbox"] = (min(bx0, x0), min(by0, y0), max(bx1, x1), max(by1, y1))
+                continue
+            _flush()
+            pieces = [text] if len(text) <= max_chars else _split_long(text, max_chars)
+            for piece in pieces[:-1]:
+                chunks.append({"text": piece, "page": page_idx, "column": column, "bbox": (x0, y0, x1, y1)})
+            current = {"text": pieces[-1], "page": page_idx, "column": column, "bbox": (x0, y0, x1, y1)}
+        _flush()
+    return chunks
@@ -1,16 +1,44 @@
 import pymupdf
 import re
+import os
+import hashlib
+import threading
+import unicodedata
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from typing import List, Optional, Dict, Tuple
 from . import definitions
+from .layout import MUPDF_LOCK, DocumentLayout, get_layout
+from .cache import get_cache
 
 from PIL import Image
 import io
 
-try:
-    from pix2tex.cli import LatexOCR
-    latex_ocr_model = LatexOCR()
-except Exception:
-    latex_ocr_model = None
+# LatexOCR is loaded on first use, not at import: importing the CLI or running
+# without symbol detection should not pay for the pix2tex model.
+_latex_ocr_model = None
+_latex_ocr_unavailable = False
+_latex_ocr_lock = threading.Lock()
+
+
+def get_latex_ocr_model():
+    """Process-wide LatexOCR instance, created on first call; None if pix2tex is unavailable."""
+    global _latex_ocr_model, _latex_ocr_unavailable
+    if _latex_ocr_model is None and not _latex_ocr_unavailable:
+        with _latex_ocr_lock:
+            if _latex_ocr_model is None and not _latex_ocr_unavailable:
+                try:
+                    from pix2tex.cli import LatexOCR
+                    _latex_ocr_model = LatexOCR()
+                except Exception:
+                    _latex_ocr_unavailable = True
+    return _latex_ocr_model
+
+
+def warm_up_latex_ocr() -> bool:
+    """Load the OCR model ahead of time (for long-running processes). Returns True if available."""
+    return get_latex_ocr_model() is not None
 
 
 _NUMERIC_CITATION_PATTERN = re.compile(r'\[\s*(\d{1,3})\s*\]')
@@ -25,13 +53,35 @@ _AUTHOR_YEAR_PART_PATTERN = re.compile(
 _YEAR_PATTERN = re.compile(r'\b((?:19|20)\d{2})[a-z]?\b')
 _REFERENCE_ENTRY_START_PATTERN = re.compile(r"[A-Z][A-Za-z'\-]+,\s+[A-Z]")
 _AUTHOR_PARTICLES = {"de", "del", "der", "van", "von", "da", "di", "la", "le"}
+_REFERENCES_HEADING_PATTERN = re.compile(r'^(?:(?:\d+|[IVX]+)\.?\s+)?(?:references|bibliography)$', re.IGNORECASE)
+# "Appendix ..." / "Supplementary material", a lettered section heading such as
+# "B Ablations" / "A. Object Detection Baselines" / "A.2 Proof of Theorem 3.1",
+# or the letter alone on its line. The title has no commas and no initials, so
+# author lines ("A. Vaswani, N. Shazeer") do not match.
+_BACK_MATTER_HEADING_PATTERN = re.compile(
+    r"^(?:[A-Z](?:\.\d+)*\.?\s+)?(?i:appendix|appendices|supplementary material|supplemental material)\b"
+    r"|^[A-H](?:\.\d+)*\.?(?:\s+[A-Z][\w\-’']+(?:\.\d+)*(?:\s+[\w\-:()/&’']+(?:\.\d+)*)*)?$"
+)
+# An appendix heading on the references' first page must sit at least this far
+# (in points, about three lines) below the References heading.
+_BACK_MATTER_MIN_GAP = 36.0
+
+_NAME_TOKEN_PATTERN = re.compile(r"[^\W\d_](?:[^\W\d_]|['\-’])*")
+_FOLD_SPECIAL = str.maketrans({"ø": "o", "Ø": "O", "ß": "ss", "ł": "l", "Ł": "L", "æ": "ae", "Æ": "AE", "đ": "d", "ı": "i"})
+
+def _fold_diacritics(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.translate(_FOLD_SPECIAL))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def _name_key(token: str) -> str:
+    return re.sub(r"[^a-z]", "", _fold_diacritics(token).lower())
 
 def _canonical_year(year_text: str) -> Optional[str]:
     match = _YEAR_PATTERN.search(year_text.lower())
     return match.group(1) if match else None
 
 def _extract_author_key_from_segment(segment: str) -> Optional[str]:
-    text = segment.strip()
+    text = _fold_diacritics(segment).strip()
     if not text: return None
     text = re.sub(r'^\W+', '', text)
     text = re.sub(r'^(?:see|e\.g\.|cf\.|for example|for instance)\s+', '', text, flags=re.IGNORECASE)
@@ -57,16 +107,120 @@ def _extract_author_year_pairs_from_parenthetical(inner_text: str) -> List[Tuple
                 pairs.append((author_key, year))
     return pairs
 
-def _find_references_start_page(doc: pymupdf.Document) -> Optional[int]:
+def _page_body_font_size(layout: DocumentLayout, page_idx: int) -> float:
+    sizes: Dict[float, int] = {}
+    for block in layout.blocks(page_idx):
+        for line in block["lines"]:
+            for span in line["spans"]:
+                size = round(span["size"], 1)
+                sizes[size] = sizes.get(size, 0) + len(span["text"])
+    return max(sizes, key=sizes.get) if sizes else 0.0
+
+
+def _heading_lines(layout: DocumentLayout, page_idx: int, pattern: re.Pattern) -> List[Tuple[int, float]]:
+    """(block index, y0) of whole lines on the page matching `pattern` and set in a heading font."""
+    body_size = None
+    found = []
+    for block_idx, block in enumerate(layout.blocks(page_idx)):
+        for line in block["lines"]:
+            spans = line["spans"]
+            text = "".join(s["text"] for s in spans).strip()
+            if not text or len(text) > 80 or not pattern.match(text):
+                continue
+            if body_size is None:
+                body_size = _page_body_font_size(layout, page_idx)
+            is_bold = any(s["flags"] & pymupdf.TEXT_FONT_BOLD for s in spans if s["text"].strip())
+            size = max(s["size"] for s in spans)
+            if is_bold or size >= body_size + 0.5:
+                found.append((block_idx, line["bbox"][1]))
+    return found
+
+
+def _references_start_from_toc(doc: pymupdf.Document) -> Optional[Tuple[int, Optional[int]]]:
+    """(start page, page of the next same-or-higher level outline entry) from the PDF outline."""
+    try:
+        toc = doc.get_toc()
+    except Exception:
+        return None
+    for i in range(len(toc) - 1, -1, -1):
+        level, title, page = toc[i][:3]
+        if page < 1 or not _REFERENCES_HEADING_PATTERN.match(title.strip()):
+            continue
+        next_page = None
+        for next_level, _, next_entry_page in (entry[:3] for entry in toc[i + 1:]):
+            if next_level <= level and next_entry_page >= page:
+                next_page = next_entry_page - 1
+                break
+        return page - 1, next_page
+    return None
+
+
+def _references_end_page(layout: DocumentLayout, start: int, heading_y: float, next_section_page: Optional[int]) -> int:
+    """Last page of the references section, stopping before a following appendix."""
+    last_page = len(layout) - 1
+    if next_section_page is not None:
+        candidates = [next_section_page]
+    else:
+        candidates = range(start, last_page + 1)
+    for page_idx in candidates:
+        if page_idx < start or page_idx > last_page:
+            continue
+        _, page_height = layout.page_size(page_idx)
+        for _, y0 in _heading_lines(layout, page_idx, _BACK_MATTER_HEADING_PATTERN):
+            if page_idx == start and y0 <= heading_y + _BACK_MATTER_MIN_GAP:
+                continue
+            # An appendix opening a fresh page ends the references on the page before.
+            return page_idx - 1 if y0 < page_height * 0.2 and page_idx > start else page_idx
+        if next_section_page is not None:
+            return max(start, page_idx - 1)
+    return last_page
+
+
+def _locate_references_range(doc: pymupdf.Document, layout: DocumentLayout) -> Optional[Tuple[int, int]]:
+    toc_hit = _references_start_from_toc(doc)
+    if toc_hit is not None:
+        start, next_section_page = toc_hit
+        headings = _heading_lines(layout, start, _REFERENCES_HEADING_PATTERN)
+        heading_y = headings[-1][1] if headings else 0.0
+        return start, _references_end_page(layout, start, heading_y, next_section_page)
+
     for page_idx in range(len(doc) - 1, -1, -1):
-        page_text = doc[page_idx].get_text()
+        headings = _heading_lines(layout, page_idx, _REFERENCES_HEADING_PATTERN)
+        if headings:
+            return page_idx, _references_end_page(layout, page_idx, headings[-1][1], None)
+
+    # No outline entry or heading-styled line: fall back to a plain text scan.
+    for page_idx in range(len(doc) - 1, -1, -1):
+        page_text = layout.text(page_idx)
         match = re.search(r'\b(references|bibliography)\b', page_text, re.IGNORECASE)
         if match:
-            return page_idx
+            return page_idx, len(doc) - 1
     return None
 
+
+def find_references_range(doc: pymupdf.Document, layout: Optional[DocumentLayout] = None) -> Optional[Tuple[int, int]]:
+    """
+    Locate the references section as an inclusive (start, end) page range.
+
+    Checks the PDF outline first, then heading-styled "References"/"Bibliography"
+    lines, and only then falls back to a backwards text scan. The end page stops
+    before a following appendix so appendix pages are scanned like body pages.
+    The result is memoized on the document layout.
+    """
+    layout = get_layout(doc, layout)
+    return layout.memo("references_range", lambda: _locate_references_range(doc, layout))
+
+
+def _in_references_range(page_idx: int, ref_range: Optional[Tuple[int, int]]) -> bool:
+    return ref_range is not None and ref_range[0] <= page_idx <= ref_range[1]
+
+
+def _find_references_start_page(doc: pymupdf.Document, layout: Optional[DocumentLayout] = None) -> Optional[int]:
+    ref_range = find_references_range(doc, layout)
+    return ref_range[0] if ref_range else None
+
 def _extract_author_year_from_entry(entry_text: str) -> Optional[Tuple[str, str]]:
-    text = re.sub(r"\s+", " ", entry_text).strip()
+    text = re.sub(r"\s+", " ", _fold_diacritics(entry_text)).strip()
     if not text: return None
     text = re.sub(r'^\s*(?:\[\d+\]|\d+[\.]|\d+[\)])\s*', '', text)
     year_match = _YEAR_PATTERN.search(text)
@@ -77,11 +231,13 @@ def _extract_author_year_from_entry(entry_text: str) -> Optional[Tuple[str, str]
     key = re.sub(r"[^a-z]", "", author_match.group(1).lower()) if author_match else _extract_author_key_from_segment(prefix)
     return (key, year) if key and year else None
 
-def _extract_author_year_entries(doc: pymupdf.Document, references_page: int) -> List[str]:
+def _extract_author_year_entries(doc: pymupdf.Document, references_page: int, layout: Optional[DocumentLayout] = None, end_page: Optional[int] = None) -> List[str]:
+    layout = get_layout(doc, layout)
     entries = []
+    end_page = doc.page_count - 1 if end_page is None else end_page
     
-    for page_num in range(references_page, doc.page_count):
-        blocks = doc[page_num].get_text("blocks")
+    for page_num in range(references_page, end_page + 1):
+        blocks = layout.text_blocks(page_num)
         for b in blocks:
             if b[6] != 0: continue
             text = b[4].strip()
@@ -102,36 +258,261 @@ def _extract_author_year_entries(doc: pymupdf.Document, references_page: int) ->
                 
     return entries
 
-def build_references_db(doc: pymupdf.Document, groq_api_key: Optional[str] = None, use_local_llm: bool = False, progress_callback: Optional[callable] = None) -> Dict[str, Dict]:
+class _AuthorYearIndex:
+    """
+    Surname/year inverted index over the references section.
+
+    Maps folded surname tokens (diacritics stripped, hyphens dropped, particle
+    prefixes such as "van der" also joined onto the surname) and years to the
+    reference blocks and full-text offsets where they occur, so each
+    author-year citation resolves with dictionary lookups instead of a regex
+    scan over the whole bibliography.
+    """
+
+    def __init__(self, ref_blocks: List[str], full_ref_text: str):
+        self.ref_blocks = ref_blocks
+        self.full_ref_text = full_ref_text
+        # token -> {block index: first offset}, year -> {block index: last offset}
+        self.block_tokens: Dict[str, Dict[int, int]] = {}
+        self.block_years: Dict[str, Dict[int, int]] = {}
+        for block_idx, block_text in enumerate(ref_blocks):
+            for key, pos in self._name_tokens(block_text):
+                self.block_tokens.setdefault(key, {}).setdefault(block_idx, pos)
+            for match in _YEAR_PATTERN.finditer(block_text):
+                self.block_years.setdefault(match.group(1), {})[block_idx] = match.start()
+        # token -> sorted full-text offsets, year -> sorted (start, end) offsets
+        self.text_tokens: Dict[str, List[int]] = {}
+        self.text_years: Dict[str, List[Tuple[int, int]]] = {}
+        for key, pos in self._name_tokens(full_ref_text):
+            self.text_tokens.setdefault(key, []).append(pos)
+        for match in _YEAR_PATTERN.finditer(full_ref_text):
+            self.text_years.setdefault(match.group(1), []).append((match.start(), match.start() + 4))
+
+    @staticmethod
+    def _name_tokens(text: str):
+        particles: List[Tuple[str, int]] = []
+        for match in _NAME_TOKEN_PATTERN.finditer(text):
+            raw = match.group(0)
+            key = _name_key(raw)
+            if not key:
+                continue
+            yield key, match.start()
+            for part in re.split(r"['\-’]", raw):
+                part_key = _name_key(part)
+                if part_key and part_key != key:
+                    yield part_key, match.start()
+            if key in _AUTHOR_PARTICLES:
+                particles.append((key, match.start()))
+                continue
+            if particles:
+                yield "".join(p for p, _ in particles) + key, particles[0][1]
+                particles = []
+
+    def find(self, author_key: str, year: str) -> Optional[str]:
+        """Reference text for (author_key, year): the first block naming the author before the year, else a window of the full text around the closest surname/year pair."""
+        blocks_with_author = self.block_tokens.get(author_key, {})
+        blocks_with_year = self.block_years.get(year, {})
+        for block_idx in sorted(blocks_with_author.keys() & blocks_with_year.keys()):
+            if blocks_with_author[block_idx] < blocks_with_year[block_idx]:
+                return self.ref_blocks[block_idx]
+
+        author_positions = self.text_tokens.get(author_key)
+        year_positions = self.text_years.get(year)
+        if not author_positions or not year_positions:
+            return None
+        # The surname occurrence followed most closely by the year is the likeliest entry.
+        best = None
+        for pos in author_positions:
+            i = bisect_right(year_positions, (pos, len(self.full_ref_text)))
+            if i < len(year_positions) and (best is None or year_positions[i][0] - pos < best[1] - best[0]):
+                best = (pos, year_positions[i][0], year_positions[i][1])
+        if best is None:
+            return None
+        start, _, year_end = best
+        start_idx = max(0, start - 300)
+        end_idx = min(len(self.full_ref_text), year_end + 300)
+        return self.full_ref_text[start_idx:end_idx].replace('\n', ' ')
+
+
+def _page_links(layout: DocumentLayout, page_idx: int) -> List[dict]:
+    """``page.get_links()``, read once per page."""
+    return layout.memo(("links", page_idx), lambda: layout.doc[page_idx].get_links())
+
+
+def _reference_lines(layout: DocumentLayout, ref_range: Tuple[int, int]) -> List[Tuple[int, float, float, float, str]]:
+    """(page, x0, y0, y1, text) of every line in the references range, in reading order."""
+    lines = []
+    for p in range(ref_range[0], ref_range[1] + 1):
+        height = layout.page_size(p)[1]
+        for b in layout.blocks(p):
+            for line in b["lines"]:
+                text = "".join(s["text"] for s in line["spans"]).strip()
+                x0, y0, _, y1 = line["bbox"]
+                # Skip running headers and page numbers.
+                if text and height * 0.075 < y0 < height * 0.92:
+                    lines.append((p, x0, y0, y1, text))
+    return lines
+
+
+def _link_destination_lines(lines: List[tuple], page_idx: int, x: float, y: float) -> List[int]:
+    """
+    Indices of the lines a link destination may point at (the first line of an entry).
+
+    Destinations without an x coordinate cannot tell the columns apart, so every
+    entry start at that height is returned and the caller disambiguates.
+    """
+    candidates = []
+    for i, (p, x0, y0, _, _) in enumerate(lines):
+        if p != page_idx or not (y - 4 <= y0 <= y + 14):
+            continue
+        if x > 0 and abs(x0 - x) > 30:
+            continue
+        # Entries use a hanging indent; prefer lines the next line is indented from.
+        nxt = lines[i + 1] if i + 1 < len(lines) else None
+        hanging = nxt is not None and nxt[0] == p and nxt[1] > x0 + 2
+        score = abs(y0 - y) + (0 if hanging else 20) + (abs(x0 - x) if x > 0 else 0)
+        candidates.append((score, hanging, i))
+    if not candidates:
+        return []
+    candidates.sort()
+    if x <= 0:
+        hanging = [i for _, h, i in candidates if h]
+        if len(hanging) > 1:
+            return hanging
+    return [candidates[0][2]]
+
+
+def _linked_entries(doc: pymupdf.Document, layout: DocumentLayout, ref_range: Tuple[int, int]) -> Tuple[Dict[Tuple[int, int], List[str]], Dict[int, List[Tuple[pymupdf.Rect, Tuple[int, int]]]]]:
+    """
+    Bibliography entries reached through hyperref link annotations.
+
+    Returns ({destination: [entry_text, ...]}, {body_page: [(link_rect, destination)]});
+    a destination has several candidate entries only when its column is unknown.
+    Entry text runs from the destination line up to the next destination or the
+    next line starting at the same indent, so no regex segmentation is needed.
+    """
+    def build():
+        page_links: Dict[int, List[Tuple[pymupdf.Rect, Tuple[int, int]]]] = {}
+        dest_points = {}
+        for page_idx in range(doc.page_count):
+            if _in_references_range(page_idx, ref_range):
+                continue
+            for link in _page_links(layout, page_idx):
+                if link.get("kind") not in (pymupdf.LINK_GOTO, pymupdf.LINK_NAMED):
+                    continue
+                target, to = link.get("page", -1), link.get("to")
+                if to is None or not _in_references_range(target, ref_range):
+                    continue
+                # Destination points are in PDF space (origin bottom-left).
+                y = layout.page_size(target)[1] - to.y
+                dest = (target, round(y))
+                dest_points.setdefault(dest, (target, to.x, y))
+                page_links.setdefault(page_idx, []).append((pymupdf.Rect(link["from"]), dest))
+        if not dest_points:
+            return {}, {}
+
+        lines = _reference_lines(layout, ref_range)
+        starts = {dest: _link_destination_lines(lines, target, x, y) for dest, (target, x, y) in dest_points.items()}
+        start_indices = {idx for indices in starts.values() for idx in indices}
+
+        entry_texts = {}
+        for idx in sorted(start_indices):
+            first = lines[idx]
+            parts, prev = [first[4]], first
+            for j in range(idx + 1, min(idx + 16, len(lines))):
+                line = lines[j]
+                new_entry = (
+                    j in start_indices
+                    or abs(line[1] - first[1]) < 1.5
+                    or (line[0] == prev[0] and line[2] - prev[3] > 15 and abs(line[1] - prev[1]) < 50)
+                )
+                if new_entry:
+                    break
+                parts.append(line[4])
+                prev = line
+            entry_texts[idx] = " ".join(parts)
+        entries = {dest: [entry_texts[i] for i in indices] for dest, indices in starts.items() if indices}
+        return entries, page_links
+
+    return layout.memo(("linked_entries", ref_range), build)
+
+
+def _entry_matches_citation(entry: str, author_key: str, year: str) -> bool:
+    if year[:4] not in entry:
+        return False
+    # Author names lead the entry; match whole name tokens, not substrings.
+    return any(key == author_key for key, _ in _AuthorYearIndex._name_tokens(entry[:150]))
+
+
+def _linked_reference_texts(doc: pymupdf.Document, layout: DocumentLayout, citation_refs: List[dict], ref_range: Tuple[int, int]) -> Dict[str, dict]:
+    """Map citation ids to entry texts through link annotations; empty when the PDF has none."""
+    entries, page_links = _linked_entries(doc, layout, ref_range)
+    if not entries:
+        return {}
+
+    linked = {}
+    for entry in {text for texts in entries.values() for text in texts}:
+        num_match = re.match(r"^(?:\[(\d+)\]|(\d+)\.\s)", entry)
+        if num_match:
+            number = int(num_match.group(1) or num_match.group(2))
+            linked.setdefault(f"num_{number}", {"id": f"num_{number}", "text": entry})
+
+    for ref in citation_refs:
+        ref_id = _citation_ref_id(ref)
+        if not ref_id or ref_id in linked or ref.get("format_type") == "NUMERIC_BRACKET":
+            continue
+        bbox = pymupdf.Rect(ref["bbox"])
+        for rect, dest in page_links.get(ref["page"], []):
+            if not rect.intersects(bbox):
+                continue
+            entry = next((e for e in entries.get(dest, []) if _entry_matches_citation(e, ref["author_key"], ref["year"])), None)
+            if entry:
+                linked[ref_id] = {"id": ref_id, "text": entry, "target_author": ref["author_key"], "target_year": ref["year"]}
+                break
+    return linked
+
+
+def _collect_reference_texts(doc: pymupdf.Document, layout: DocumentLayout, citation_refs: List[dict]) -> Tuple[Dict[str, Dict], List[dict]]:
+    """Split the references section into per-key entry texts, without any LLM calls."""
     db = {"numeric": {}, "author_year": {}}
-    ref_start_page = _find_references_start_page(doc)
-    if ref_start_page is None: return db
+    ref_range = find_references_range(doc, layout)
+    if ref_range is None: return db, []
+    ref_start_page, ref_end_page = ref_range
 
     full_ref_text = ""
     ref_blocks = []
-    for p in range(ref_start_page, doc.page_count):
-        full_ref_text += doc[p].get_text() + "\n"
-        for b in doc[p].get_text("blocks"):
+    for p in range(ref_start_page, ref_end_page + 1):
+        full_ref_text += layout.text(p) + "\n"
+        for b in layout.text_blocks(p):
             if b[6] == 0:
                 text = b[4].strip()
                 if text and text.lower() not in ["references", "bibliography"]:
                     ref_blocks.append(text.replace("\n", " "))
 
-    all_entries = _extract_author_year_entries(doc, ref_start_page)
-    to_process_refs = []
+    # Hyperref link annotations give exact entry boundaries; segmentation and
+    # snippet search below only cover citations the links do not.
+    linked = _linked_reference_texts(doc, layout, citation_refs, ref_range)
+    to_process_refs = list(linked.values())
+
+    cited_ids = {_citation_ref_id(ref) for ref in citation_refs}
+    if not linked or any(i and i.startswith("num_") and i not in linked for i in cited_ids):
+        all_entries = _extract_author_year_entries(doc, ref_start_page, layout, ref_end_page)
+    else:
+        all_entries = []
 
     for i, entry in enumerate(all_entries):
         num_match = re.match(r"^\[(\d+)\]", entry)
         if num_match:
             idx = int(num_match.group(1))
-            to_process_refs.append({"id": f"num_{idx}", "text": entry})
+            if f"num_{idx}" not in linked:
+                to_process_refs.append({"id": f"num_{idx}", "text": entry})
         else:
             ay = _extract_author_year_from_entry(entry)
-            if ay:
+            if ay and f"ay_{ay[0]}_{ay[1]}" not in linked:
                 to_process_refs.append({"id": f"ay_{ay[0]}_{ay[1]}", "text": entry, "target_author": ay[0], "target_year": ay[1]})
 
-    citation_refs = find_references(doc)
     existing_ay_ids = {r["id"] for r in to_process_refs if r["id"].startswith("ay_")}
+    author_index = None
 
     for ref in citation_refs:
         if ref.get("format_type") == "NUMERIC_BRACKET": continue
@@ -142,20 +523,9 @@ def build_references_db(doc: pymupdf.Document, groq_api_key: Optional[str] = Non
 
         key = f"ay_{auth}_{yr}"
         if key not in existing_ay_ids:
-            snippet = None
-            search_regex = rf"{auth}.*?{yr}"
-
-            for block_text in ref_blocks:
-                if re.search(search_regex, block_text, re.IGNORECASE | re.DOTALL):
-                    snippet = block_text
-                    break
-
-            if not snippet:
-                match = re.search(search_regex, full_ref_text, re.IGNORECASE | re.DOTALL)
-                if match:
-                    start_idx = max(0, match.start() - 300)
-                    end_idx = min(len(full_ref_text), match.end() + 300)
-                    snippet = full_ref_text[start_idx:end_idx].replace('\n', ' ')
+            if author_index is None:
+                author_index = _AuthorYearIndex(ref_blocks, full_ref_text)
+            snippet = author_index.find(auth, yr)
 
             if snippet:
                 to_process_refs.append({"id": key, "text": snippet, "target_author": auth, "target_year": yr})
@@ -163,10 +533,113 @@ def build_references_db(doc: pymupdf.Document, groq_api_key: Optional[str] = Non
             else:
                 db["author_year"][f"{auth}_{yr}"] = {"title": None, "year": yr}
 
+    return db, to_process_refs
+
+
+def _citation_ref_id(ref: dict) -> Optional[str]:
+    if ref.get("format_type") == "NUMERIC_BRACKET":
+        return f"num_{ref.get('number')}"
+    if ref.get("author_key") and ref.get("year"):
+        return f"ay_{ref['author_key']}_{ref['year']}"
+    return None
+
+
+def _ref_id_location(ref_id: str) -> Tuple[str, object]:
+    if ref_id.startswith("num_"):
+        return "numeric", int(ref_id[4:])
+    return "author_year", ref_id[3:]
+
+
+class _LazySection:
+    def __init__(self, owner: "LazyReferencesDB", section: str):
+        self._owner = owner
+        self._section = section
+
+    def get(self, key, default=None):
+        res = self._owner.lookup(self._section, key)
+        return default if res is None else res
+
+
+class LazyReferencesDB:
+    """
+    References DB that resolves entries on first lookup.
+
+    Only entries for keys cited in the body are kept, and each is sent to
+    `extract_title_year_from_reference` the first time it is looked up;
+    results are memoized. ``db.get("numeric").get(n)`` and
+    ``db.get("author_year").get("key_year")`` behave like the eager dict.
+    Lookups may come from several threads; each entry is resolved once.
+    """
+
+    def __init__(self, db: Dict[str, Dict], pending: List[dict], resolve: callable, total_entries: int = 0):
+        self._db = db
+        self._pending: Dict[str, List[dict]] = {}
+        for ref in pending:
+            self._pending.setdefault(ref["id"], []).append(ref)
+        self._resolve = resolve
+        self._resolved: Dict[str, Optional[dict]] = {}
+        self.total_entries = total_entries
+        self.resolve_calls = 0
+        self._lock = threading.Lock()
+        self._entry_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, section: str, default=None):
+        if section not in self._db:
+            return default
+        return _LazySection(self, section)
+
+    def lookup(self, section: str, key) -> Optional[dict]:
+        ref_id = f"num_{key}" if section == "numeric" else f"ay_{key}"
+        if ref_id not in self._pending:
+            return self._db[section].get(key)
+        with self._lock:
+            entry_lock = self._entry_locks.setdefault(ref_id, threading.Lock())
+        # Concurrent lookups of one key wait for a single resolution; other keys proceed
+        with entry_lock:
+            if ref_id not in self._resolved:
+                result = None
+                # Same precedence as the eager build: the last entry with a result wins.
+                for ref in self._pending[ref_id]:
+                    with self._lock:
+                        self.resolve_calls += 1
+                    res = self._resolve(ref)
+                    if res:
+                        result = res
+                self._resolved[ref_id] = result
+        result = self._resolved[ref_id]
+        return result if result is not None else self._db[section].get(key)
+
+
+def build_references_db(doc: pymupdf.Document, groq_api_key: Optional[str] = None, use_local_llm: bool = False, progress_callback: Optional[callable] = None, layout: Optional[DocumentLayout] = None, lazy: bool = False,
+                        use_cache: Optional[bool] = None, stream: Optional[bool] = None):
+    """
+    Build {"numeric": {n: {title, year}}, "author_year": {"key_year": {title, year}}}.
+
+    With `lazy=True` a LazyReferencesDB is returned instead: only entries whose
+    keys are cited in the body are kept, and they are resolved on lookup.
+    `use_cache` and `stream` are passed on to the LLM extraction. Only the
+    document reads hold MUPDF_LOCK, not the model calls.
+    """
+    with MUPDF_LOCK:
+        layout = get_layout(doc, layout)
+        citation_refs = find_references(doc, layout=layout)
+        db, to_process_refs = _collect_reference_texts(doc, layout, citation_refs)
+
+    def _resolve(ref: dict) -> Optional[dict]:
+        return definitions.extract_title_year_from_reference(ref["text"], groq_api_key, target_author=ref.get("target_author"), target_year=ref.get("target_year"), use_local_llm=use_local_llm,
+                                                             use_cache=use_cache, stream=stream)
+
+    if lazy:
+        cited_ids = {_citation_ref_id(ref) for ref in citation_refs}
+        pending = [ref for ref in to_process_refs if ref["id"] in cited_ids]
+        if progress_callback:
+            progress_callback(1, 1)
+        return LazyReferencesDB(db, pending, _resolve, total_entries=len(to_process_refs))
+
     if to_process_refs:
         results = {}
         for i, ref in enumerate(to_process_refs):
-            res = definitions.extract_title_year_from_reference(ref["text"], groq_api_key, target_author=ref.get("target_author"), target_year=ref.get("target_year"), use_local_llm=use_local_llm)
+            res = _resolve(ref)
             if res:
                 results[ref["id"]] = res
             if progress_callback:
@@ -175,445 +648,652 @@ def build_references_db(doc: pymupdf.Document, groq_api_key: Optional[str] = Non
         for ref in to_process_refs:
             ref_id = ref["id"]
             if ref_id in results:
-                if ref_id.startswith("num_"):
-                    idx = int(ref_id[4:])
-                    db["numeric"][idx] = results[ref_id]
-                elif ref_id.startswith("ay_"):
-                    key = ref_id[3:]
-                    db["author_year"][key] = results[ref_id]
+                section, key = _ref_id_location(ref_id)
+                db[section][key] = results[ref_id]
 
     return db
 
 
-def find_references(doc: pymupdf.Document, progress_callback: Optional[callable] = None) -> List[dict]:
+_ABBREVIATION_PATTERN = re.compile(r'\b[A-Z]{3,5}\b')
+_UNICODE_SYMBOL_PATTERN = re.compile(r'[\u0370-\u03FF\u2200-\u22FF\u2A00-\u2AFF\u2070-\u209F]+')
+_LATEX_SYMBOL_PATTERN = re.compile(r'\\[a-zA-Z]+|[a-zA-Z](?:_[a-zA-Z0-9]+|\^[a-zA-Z0-9]+)')
+
+_LATEX_NON_SYMBOLS = {
+    '\\text', '\\begin', '\\end', '\\frac', '\\left', '\\right',
+    '\\mathbf', '\\mathrm', '\\mathcal', '\\mathit', '\\mathtt',
+    '\\quad', '\\qquad',
+    '\\tiny', '\\scriptsize', '\\footnotesize', '\\small', '\\normalsize',
+    '\\large', '\\Large', '\\LARGE', '\\huge', '\\Huge',
+    '\\displaystyle', '\\textstyle', '\\scriptstyle', '\\scriptscriptstyle',
+    '\\bf', '\\rm', '\\it', '\\sf', '\\tt', '\\boldmath', '\\cal',
+    '\\mathbb', '\\mathsf', '\\mathfrak',
+    '\\bigg', '\\Bigg', '\\Big', '\\big',
+    '\\bigl', '\\bigr', '\\Bigl', '\\Bigr', '\\biggl', '\\biggr',
+    '\\operatorname', '\\mbox', '\\hbox',
+    '\\underbrace', '\\overbrace', '\\stackrel', '\\underset', '\\overset',
+    '\\bar', '\\hat', '\\tilde', '\\vec', '\\dot', '\\ddot',
+    '\\overline', '\\underline', '\\widehat', '\\widetilde',
+    '\\strut', '\\phantom',
+}
+
+_VALID_UPPERCASE_LATEX = {
+    '\\Gamma', '\\Delta', '\\Theta', '\\Lambda', '\\Xi', '\\Pi',
+    '\\Sigma', '\\Upsilon', '\\Phi', '\\Psi', '\\Omega',
+    '\\Alpha', '\\Beta', '\\Epsilon', '\\Zeta', '\\Eta',
+    '\\Iota', '\\Kappa', '\\Mu', '\\Nu', '\\Rho', '\\Tau', '\\Chi',
+}
+
+_COMMON_SYMBOLS = {
+    '=', '+', '-', '*', '/', '%', '^', '&', '|', '~', '!', '>', '<', '≥', '≤', '≈', '≠', '±', '×', '÷',
+    '(', ')', '[', ']', '{', '}', ',', '.', ';', ':', '?', '!', '°',
+    '∞', '∝', '∂', '∑', '√', '∝', '∞',
+    '∘', '∙', '∧', '∨', '∩', '∪', '∫', '∴', '∵', '∼', '≡', '≪', '≫', '⊖', '⊗', '⊘', '⊙', '⊥', '⊢', '⊣', '⊤',
+    '¬', '∏', '∑', '−', '∕', '∗', '∙', '√', '∝', '∞',
+    '∠', '∨', '∪', '∫', '∬', '∭', '∮', '∯', '∰', '∱', '∲', '∳',
+    # LaTeX versions
+    '\\ge', '\\le', '\\neq', '\\approx', '\\pm', '\\mp', '\\times', '\\div',
+    '\\infty', '\\propto', '\\partial', '\\nabla', '\\in', '\\notin', '\\ni',
+    '\\prod', '\\sum', '\\sqrt', '\\int', '\\oint', '\\forall', '\\exists',
+    '\\emptyset', '\\Delta', '\\nabla', '\\to', '\\leftarrow', '\\rightarrow',
+    '\\leftrightarrow', '\\uparrow', '\\downarrow', '\\langle', '\\rangle',
+    '\\cdot', '\\cdots', '\\vdots', '\\ddots', '\\quad', '\\qquad', '\\text',
+}
+
+
+def _symbol_context(text: str, index: int, word_margin: int = 100) -> str:
+    if index < 0:
+        return text[:1200]
+
+    before = text[:index]
+    after = text[index:]
+
+    words_before = before.split()
+    words_after = after.split()
+
+    selected_before = " ".join(words_before[-word_margin:])
+    selected_after = " ".join(words_after[:word_margin])
+
+    return (selected_before + " " + selected_after).strip()
+
+
+def _is_equation_block(block_text: str) -> bool:
+    words = [w for w in block_text.split() if w.isalpha()]
+
+    # Avoid likely bibliography, author blocks, or pure citation/list blocks
+    has_year = bool(re.search(r'\b(?:19|20)\d{2}\b', block_text))
+    is_author_list = (
+        re.search(r'\bet\s+al\.?', block_text, re.I)
+        or block_text.count(",") > 4
+        or has_year
+    )
+
+    # Pure citation/list blocks like "[1] Text..." or "1. Text..."
+    is_list_item = bool(re.match(r'^\s*(?:\[\d+\]|\d+[\.\)])\s+', block_text))
+
+    if not is_author_list and not is_list_item and len(words) < 12:
+        # Require unambiguous math signals: = or sub/superscripts
+        has_math_op = any(c in block_text for c in "=<>/±∑∏√")
+        has_sub_super = any(c in block_text for c in "_^")
+        has_brackets = any(c in block_text for c in "[]{}|")
+
+        # Equation must have at least two math-like signals or be very sparse
+        if (has_math_op and (has_sub_super or has_brackets)) or block_text.count('=') >= 1:
+            return True
+        elif len(words) < 5 and any(c.isdigit() for c in block_text) and (has_math_op or has_sub_super):
+            return True
+    return False
+
+
+# Math fonts: TeX (CMMI/CMSY/CMEX/AMS/EU*), STIX/XITS/Latin Modern Math, MathJax, Cambria Math.
+_MATH_FONT_PATTERN = re.compile(r"^(?:CMMI|CMSY|CMEX|CMBSY|MSBM|MSAM|EUFM|EUSM|EUEX|RSFS|STIX|XITS|LMMath|MathJax)|Math", re.IGNORECASE)
+_GREEK_LATEX = {
+    "α": "\\alpha", "β": "\\beta", "γ": "\\gamma", "δ": "\\delta", "ϵ": "\\epsilon", "ε": "\\varepsilon",
+    "ζ": "\\zeta", "η": "\\eta", "θ": "\\theta", "ϑ": "\\vartheta", "ι": "\\iota", "κ": "\\kappa",
+    "λ": "\\lambda", "μ": "\\mu", "ν": "\\nu", "ξ": "\\xi", "π": "\\pi", "ϖ": "\\varpi", "ρ": "\\rho",
+    "ϱ": "\\varrho", "σ": "\\sigma", "ς": "\\varsigma", "τ": "\\tau", "υ": "\\upsilon", "ϕ": "\\phi",
+    "φ": "\\varphi", "χ": "\\chi", "ψ": "\\psi", "ω": "\\omega", "ℓ": "\\ell",
+    "Γ": "\\Gamma", "Δ": "\\Delta", "Θ": "\\Theta", "Λ": "\\Lambda", "Ξ": "\\Xi", "Π": "\\Pi",
+    "Σ": "\\Sigma", "Υ": "\\Upsilon", "Φ": "\\Phi", "Ψ": "\\Psi", "Ω": "\\Omega",
+}
+
+
+def _font_math_latex(block: dict) -> Optional[str]:
     """
-        Find in-text citations in a two-column research paper.
-        Supports:
-            1) Numeric bracket style: [n]
-            2) Author-year parenthetical: (Author, 2020)
-            3) Author-year narrative: Author et al. (2020)
+    Rebuild LaTeX-like symbol identities of a block from its math-font spans.
+
+    Letters and Greek in math fonts become tokens; smaller spans shifted off the
+    base line (or flagged superscript) attach to the preceding token as `x_t` /
+    `W^Q`. Returns None when the text layer cannot describe the math and OCR is
+    needed: any Type3 glyphs, or sub/superscripts with no math-font text in the
+    block. Otherwise the text layer is trusted: a block without math fonts
+    gives "" (no symbols, no OCR), and scripts that follow no math-font token
+    in a block that has some are dropped.
     """
-    refs = []
-    num_pages = len(doc)
-
-    for page_idx, page in enumerate(doc):
-        if progress_callback:
-            progress_callback(page_idx, num_pages)
-        blocks = page.get_text("dict")["blocks"]
-        page_width = page.rect.width
-
-        for block_idx, block in enumerate(blocks):
-            if "lines" not in block:
+    tokens: List[List[str]] = []  # [base, marker, script, closed]
+    has_math = False
+    has_type3 = False
+    orphan_script = False
+    for line in block["lines"]:
+        base = None  # (size, baseline y, index of the token scripts attach to)
+        for span in line["spans"]:
+            text = span["text"]
+            if not text.strip():
+                continue
+            font = span["font"].split("+")[-1]
+            is_math = bool(_MATH_FONT_PATTERN.search(font))
+            has_math = has_math or is_math
+            has_type3 = has_type3 or font.startswith("Type3")
+            size, baseline = span["size"], span["origin"][1]
+            superscript = bool(span["flags"] & pymupdf.TEXT_FONT_SUPERSCRIPT)
+
+            if base is not None and size < base[0] * 0.85 and (abs(baseline - base[1]) > 0.5 or superscript):
+                token = tokens[base[2]] if base[2] is not None else None
+                orphan_script = orphan_script or token is None
+                if token is not None and not token[3]:
+                    if not token[1]:
+                        if abs(baseline - base[1]) > 0.5:
+                            token[1] = "^" if baseline < base[1] else "_"
+                        else:
+                            token[1] = "^" if superscript else "_"
+                    for ch in text.strip():
+                        if not ch.isascii() or not ch.isalnum():
+                            token[3] = "closed"
+                            break
+                        token[2] += ch
                 continue
 
-            block_center = (block["bbox"][0] + block["bbox"][2]) / 2
-            column = 1 if block_center < page_width / 2 else 2
+            last = None
+            for ch in text:
+                if is_math and (ch in _GREEK_LATEX or (ch.isascii() and ch.isalpha())):
+                    tokens.append([_GREEK_LATEX.get(ch, ch), "", "", ""])
+                    last = len(tokens) - 1
+                else:
+                    last = None
+            base = (size, baseline, last)
 
-            for line_idx, line in enumerate(block["lines"]):
-                # Build full line text by concatenating spans (keeps same reading order)
-                spans = line.get("spans", [])
-                if not spans:
-                    continue
-                span_texts = [s.get("text", "") for s in spans]
-                full_line_text = "".join(span_texts)
+    if has_type3 or (orphan_script and not has_math):
+        return None
+    return " ".join(t[0] + (t[1] + t[2] if t[2] else "") for t in tokens)
 
-                # build cumulative char ranges for each span to map match positions -> span
-                cum = []
-                pos = 0
-                for s in spans:
-                    t = s.get("text", "")
-                    start = pos
-                    end = pos + len(t)
-                    cum.append((start, end, s))
-                    pos = end
-
-                # find numeric bracket citations: [n]
-                for cluster_match in _NUMERIC_CITATION_CLUSTER_PATTERN.finditer(full_line_text):
-                    mstart = cluster_match.start()
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
-                    for num_str in re.split(r'\s*,\s*', cluster_match.group(1)):
-                        refs.append({
-                            "text": f"[{num_str.strip()}]",
-                            "number": int(num_str.strip()),
-                            "format_type": "NUMERIC_BRACKET",
-                            "page": page_idx,
-                            "column": column,
-                            "block": block_idx,
-                            "line": line_idx,
-                            "bbox": use_span.get("bbox"),
-                        })
 
-                for match in _NUMERIC_CITATION_PATTERN.finditer(full_line_text):
-                    mstart = match.start()
-                    # find the span that contains the start of the match (fallback to first span)
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
+def _filter_latex_symbols(latex_text: str) -> List[str]:
+    kept = []
+    for sys_match in dict.fromkeys(_LATEX_SYMBOL_PATTERN.findall(latex_text)):
+        if len(sys_match) == 1 and sys_match.isalpha():
+            continue
+        if sys_match in _LATEX_NON_SYMBOLS or sys_match in _COMMON_SYMBOLS:
+            continue
 
+        cmd_name = sys_match[1:] if sys_match.startswith('\\') else sys_match
+        if len(cmd_name) > 15:
+            continue
+        if any(c in sys_match for c in ')]}>'):
+            continue
+        if sys_match.startswith('\\') and cmd_name[:1].isupper() and sys_match not in _VALID_UPPERCASE_LATEX:
+            continue
+        kept.append(sys_match)
+    return kept
+
+
+def _scan_line_citations(full_line_text: str, spans: List[dict], starts: List[int], location: dict, refs: List[dict]) -> None:
+    """Append citation candidates of one line to `refs`, in the same order as the per-pattern scan."""
+    has_bracket = "[" in full_line_text
+    has_paren = "(" in full_line_text
+    if not has_bracket and not has_paren:
+        return
+    has_et_al = "et al." in full_line_text
+
+    def span_bbox(mstart: int):
+        # the span that contains the start of the match (fallback to first span)
+        idx = bisect_right(starts, mstart) - 1
+        return spans[idx if idx >= 0 else 0].get("bbox")
+
+    if has_bracket:
+        # find numeric bracket citations: [n]
+        for cluster_match in _NUMERIC_CITATION_CLUSTER_PATTERN.finditer(full_line_text):
+            bbox = span_bbox(cluster_match.start())
+            for num_str in re.split(r'\s*,\s*', cluster_match.group(1)):
+                refs.append({
+                    "text": f"[{num_str.strip()}]",
+                    "number": int(num_str.strip()),
+                    "format_type": "NUMERIC_BRACKET",
+                    **location,
+                    "bbox": bbox,
+                })
+
+        for match in _NUMERIC_CITATION_PATTERN.finditer(full_line_text):
+            refs.append({
+                "text": match.group(0),
+                "number": int(match.group(1)),
+                "format_type": "NUMERIC_BRACKET",
+                **location,
+                "bbox": span_bbox(match.start()),
+            })
+
+    if has_paren:
+        for match in _AUTHOR_YEAR_PARENTHESES_GROUP_PATTERN.finditer(full_line_text):
+            bbox = span_bbox(match.start())
+            for author_key, year in _extract_author_year_pairs_from_parenthetical(match.group(1)):
+                refs.append({
+                    "text": match.group(0),
+                    "author_key": author_key,
+                    "year": year,
+                    "format_type": "AUTHOR_YEAR_PARENTHESES",
+                    **location,
+                    "bbox": bbox,
+                })
+
+        # find author-year narrative citations: Author et al. (2020)
+        if has_et_al:
+            for match in _AUTHOR_YEAR_ET_AL_PATTERN.finditer(full_line_text):
+                author_key = _extract_author_key_from_segment(match.group(1))
+                year = _canonical_year(match.group(2))
+                if author_key and year:
                     refs.append({
                         "text": match.group(0),
-                        "number": int(match.group(1)),
-                        "format_type": "NUMERIC_BRACKET",
-                        "page": page_idx,
-                        "column": column,
-                        "block": block_idx,
-                        "line": line_idx,
-                        "bbox": use_span.get("bbox"),
+                        "author_key": author_key,
+                        "year": year,
+                        "format_type": "AUTHOR_YEAR_ET_AL",
+                        **location,
+                        "bbox": span_bbox(match.start()),
                     })
 
-                for match in _AUTHOR_YEAR_PARENTHESES_GROUP_PATTERN.finditer(full_line_text):
-                    mstart = match.start()
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
+    if has_bracket:
+        # find author-year square-bracket group citations: [Author et al., 2020] or [A, 2019; B, 2020]
+        for match in _AUTHOR_YEAR_BRACKET_GROUP_PATTERN.finditer(full_line_text):
+            bbox = span_bbox(match.start())
+            for author_key, year in _extract_author_year_pairs_from_parenthetical(match.group(1)):
+                refs.append({
+                    "text": match.group(0),
+                    "author_key": author_key,
+                    "year": year,
+                    "format_type": "AUTHOR_YEAR_BRACKET",
+                    **location,
+                    "bbox": bbox,
+                })
+
+        # find author-year narrative citations with square brackets: Author et al. [2020]
+        if has_et_al:
+            for match in _AUTHOR_YEAR_ET_AL_BRACKET_PATTERN.finditer(full_line_text):
+                author_key = _extract_author_key_from_segment(match.group(1))
+                year = _canonical_year(match.group(2))
+                if author_key and year:
+                    refs.append({
+                        "text": match.group(0),
+                        "author_key": author_key,
+                        "year": year,
+                        "format_type": "AUTHOR_YEAR_ET_AL_BRACKET",
+                        **location,
+                        "bbox": span_bbox(match.start()),
+                    })
 
-                    pairs = _extract_author_year_pairs_from_parenthetical(match.group(1))
-                    for author_key, year in pairs:
-                        refs.append({
-                            "text": match.group(0),
-                            "author_key": author_key,
-                            "year": year,
-                            "format_type": "AUTHOR_YEAR_PARENTHESES",
-                            "page": page_idx,
-                            "column": column,
-                            "block": block_idx,
-                            "line": line_idx,
-                            "bbox": use_span.get("bbox"),
-                        })
 
-                # find author-year narrative citations: Author et al. (2020)
-                for match in _AUTHOR_YEAR_ET_AL_PATTERN.finditer(full_line_text):
-                    mstart = match.start()
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
+def _scan_page(layout: DocumentLayout, page_idx: int, ref_range: Optional[Tuple[int, int]]) -> Dict[str, List[dict]]:
+    """Single pass over one page's lines emitting citation, abbreviation and symbol candidates."""
+    refs: List[dict] = []
+    abbs: List[dict] = []
+    symbols: List[dict] = []
+    equations: List[dict] = []
 
-                    author_key = _extract_author_key_from_segment(match.group(1))
-                    year = _canonical_year(match.group(2))
-                    if author_key and year:
-                        refs.append({
-                            "text": match.group(0),
-                            "author_key": author_key,
-                            "year": year,
-                            "format_type": "AUTHOR_YEAR_ET_AL",
-                            "page": page_idx,
-                            "column": column,
-                            "block": block_idx,
-                            "line": line_idx,
-                            "bbox": use_span.get("bbox"),
-                        })
+    in_references = _in_references_range(page_idx, ref_range)
+    page_width, page_height = layout.page_size(page_idx)
 
-                # find author-year square-bracket group citations: [Author et al., 2020] or [A, 2019; B, 2020]
-                for match in _AUTHOR_YEAR_BRACKET_GROUP_PATTERN.finditer(full_line_text):
-                    mstart = match.start()
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
+    for block_idx, block in enumerate(layout.blocks(page_idx)):
+        if not block["lines"]:
+            continue
+        bbox = block["bbox"]
+        block_center = (bbox[0] + bbox[2]) / 2
+        column = 1 if block_center < page_width / 2 else 2
+        block_text = "".join(span["text"] for line in block["lines"] for span in line["spans"])
+        scan_abbreviations = not in_references and not (bbox[1] < 30 or bbox[3] > page_height - 30)
+
+        if _is_equation_block(block_text):
+            equations.append({
+                "page": page_idx,
+                "column": column,
+                "block": block_idx,
+                "bbox": bbox,
+                "block_text": block_text,
+                "font_latex": _font_math_latex(block),
+            })
+
+        current_offset = 0
+        for line_idx, line in enumerate(block["lines"]):
+            spans = line["spans"]
+            if not spans:
+                continue
+            location = {"page": page_idx, "column": column, "block": block_idx, "line": line_idx}
 
-                    pairs = _extract_author_year_pairs_from_parenthetical(match.group(1))
-                    for author_key, year in pairs:
-                        refs.append({
+            if not in_references:
+                # cumulative start offset of each span, to map match positions -> span
+                starts = []
+                pos = 0
+                for s in spans:
+                    starts.append(pos)
+                    pos += len(s.get("text", ""))
+                full_line_text = "".join(s.get("text", "") for s in spans)
+                _scan_line_citations(full_line_text, spans, starts, location, refs)
+
+            for span in spans:
+                text = span["text"]
+                if scan_abbreviations:
+                    for match in _ABBREVIATION_PATTERN.finditer(text):
+                        abbs.append({
                             "text": match.group(0),
-                            "author_key": author_key,
-                            "year": year,
-                            "format_type": "AUTHOR_YEAR_BRACKET",
-                            "page": page_idx,
-                            "column": column,
-                            "block": block_idx,
-                            "line": line_idx,
-                            "bbox": use_span.get("bbox"),
+                            **location,
+                            "bbox": span["bbox"],
+                            "context": block_text,
                         })
 
-                # find author-year narrative citations with square brackets: Author et al. [2020]
-                for match in _AUTHOR_YEAR_ET_AL_BRACKET_PATTERN.finditer(full_line_text):
-                    mstart = match.start()
-                    use_span = None
-                    for (s_start, s_end, s_obj) in cum:
-                        if s_start <= mstart < s_end:
-                            use_span = s_obj
-                            break
-                    if use_span is None and cum:
-                        use_span = cum[0][2]
-
-                    author_key = _extract_author_key_from_segment(match.group(1))
-                    year = _canonical_year(match.group(2))
-                    if author_key and year:
-                        refs.append({
-                            "text": match.group(0),
-                            "author_key": author_key,
-                            "year": year,
-                            "format_type": "AUTHOR_YEAR_ET_AL_BRACKET",
-                            "page": page_idx,
-                            "column": column,
-                            "block": block_idx,
-                            "line": line_idx,
-                            "bbox": use_span.get("bbox"),
+                for match in _UNICODE_SYMBOL_PATTERN.finditer(text):
+                    sym_text = match.group(0).strip()
+                    if sym_text and sym_text not in _COMMON_SYMBOLS:
+                        symbols.append({
+                            "text": sym_text,
+                            **location,
+                            "bbox": span["bbox"],
+                            "context": _symbol_context(block_text, current_offset + match.start()),
+                            "source": "unicode"
                         })
+                current_offset += len(text)
 
-    sorted_refs = sorted(refs, key=lambda x: (x["page"], x["column"], x["block"], x["line"]))
+    return {"references": refs, "abbreviations": abbs, "symbols": symbols, "equations": equations}
+
+
+def _empty_candidates() -> Dict[str, List[dict]]:
+    return {"references": [], "abbreviations": [], "symbols": [], "equations": []}
+
+
+# Set in each scan worker process by _init_scan_worker: the document (opened
+# once per process) and its layout, reused for every range the worker scans.
+_worker_layout: Optional[DocumentLayout] = None
+
+
+def _init_scan_worker(shm_name: str, size: int) -> None:
+    """Worker initializer: open the PDF from shared memory, once per process."""
+    global _worker_layout
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # `size` is the PDF's length; the segment itself may be rounded up to whole pages
+        doc = pymupdf.open(stream=bytes(shm.buf[:size]), filetype="pdf")
+    finally:
+        shm.close()
+    _worker_layout = DocumentLayout(doc)
+
+
+def _scan_page_range(start: int, end: int, ref_range: Optional[Tuple[int, int]]):
+    """Worker: scan pages [start, end) of the document opened by _init_scan_worker."""
+    layout = _worker_layout
+    merged = _empty_candidates()
+    for page_idx in range(start, end):
+        for key, items in _scan_page(layout, page_idx, ref_range).items():
+            merged[key].extend(items)
+    return start, [layout.page(i) for i in range(start, end)], merged
+
+
+def _pdf_bytes(doc: pymupdf.Document) -> bytes:
+    if doc.name and os.path.isfile(doc.name) and not doc.is_dirty:
+        with open(doc.name, "rb") as f:
+            return f.read()
+    return doc.tobytes()
 
-    if not sorted_refs:
-        return []
 
-    # Remove citations that appear in the References section and after it.
-    references_page = _find_references_start_page(doc)
+def _scan_parallel(doc: pymupdf.Document, layout: DocumentLayout, ref_range: Optional[Tuple[int, int]], workers: int, progress_callback: Optional[callable]) -> Dict[str, List[dict]]:
+    num_pages = len(doc)
+    data = _pdf_bytes(doc)
+    size = len(data)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        shm.buf[:size] = data
+        del data
+        # A few shards per worker keeps the pool busy when page costs are uneven.
+        shard = max(1, -(-num_pages // (workers * 4)))
+        ranges = [(s, min(s + shard, num_pages)) for s in range(0, num_pages, shard)]
+        results = {}
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                                 initargs=(shm.name, size)) as pool:
+            futures = [pool.submit(_scan_page_range, s, e, ref_range) for s, e in ranges]
+            for future in as_completed(futures):
+                start, pages, candidates = future.result()
+                layout.adopt(pages)
+                results[start] = candidates
+                done += len(pages)
+                if progress_callback:
+                    progress_callback(done, num_pages)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    merged = _empty_candidates()
+    for start in sorted(results):
+        for key, items in results[start].items():
+            merged[key].extend(items)
+    return merged
+
+
+def scan_candidates(doc: pymupdf.Document, progress_callback: Optional[callable] = None, layout: Optional[DocumentLayout] = None, workers: int = 1) -> Dict[str, List[dict]]:
+    """
+    Traverse every line of the document once and collect all detector candidates.
+
+    Returns a dict with "references" (in-text citations outside the references
+    section, unsorted), "abbreviations", "symbols" (Unicode hits) and
+    "equations" (blocks to hand to LatexOCR), each in page/block/line order.
+    The result is memoized on the layout, so find_references,
+    find_abbreviations and find_symbols share one scan.
+
+    With `workers` > 1 the pages are split into disjoint ranges scanned by a
+    process pool; each worker opens the PDF once from a shared-memory copy of
+    its bytes and hands its extracted pages back to `layout`. Results are identical to
+    the serial scan.
+    """
+    layout = get_layout(doc, layout)
+
+    def _scan():
+        num_pages = len(doc)
+        ref_range = find_references_range(doc, layout)
+        if workers > 1 and num_pages >= 2 * workers:
+            return _scan_parallel(doc, layout, ref_range, workers, progress_callback)
+        merged = _empty_candidates()
+        for page_idx in range(num_pages):
+            if progress_callback:
+                progress_callback(page_idx, num_pages)
+            for key, items in _scan_page(layout, page_idx, ref_range).items():
+                merged[key].extend(items)
+        return merged
 
-    if references_page is not None:
-        sorted_refs = [ref for ref in sorted_refs if ref["page"] < references_page]
+    return layout.memo("candidates", _scan)
 
-    return sorted_refs
 
+def find_references(doc: pymupdf.Document, progress_callback: Optional[callable] = None, layout: Optional[DocumentLayout] = None) -> List[dict]:
+    """
+        Find in-text citations in a two-column research paper.
+        Supports:
+            1) Numeric bracket style: [n]
+            2) Author-year parenthetical: (Author, 2020)
+            3) Author-year narrative: Author et al. (2020)
+        Citations inside the References section itself are skipped.
+    """
+    refs = scan_candidates(doc, progress_callback, layout)["references"]
+    return sorted(refs, key=lambda x: (x["page"], x["column"], x["block"], x["line"]))
 
-def find_abbreviations(doc: pymupdf.Document, progress_callback: Optional[callable] = None) -> List[dict]:
+
+def find_abbreviations(doc: pymupdf.Document, progress_callback: Optional[callable] = None, layout: Optional[DocumentLayout] = None) -> List[dict]:
     """
     Finds all-uppercase abbreviations of at least 3 characters in the document.
 
     Args:
         doc: The PyMuPDF document object.
         progress_callback: Optional callback for progress reporting.
+        layout: Optional shared layout cache for the document.
 
     Returns:
         A list of dictionaries, where each dictionary represents a found
         abbreviation and contains its text and location details.
     """
-    # Regex to find whole words consisting of 3 to 5 uppercase letters.
-    # \b is a word boundary to ensure we don't match parts of other words.
-    pattern = r'\b[A-Z]{3,5}\b'
-    abbs = []
-    num_pages = len(doc)
-    ref_start_page = _find_references_start_page(doc)
+    # Whole words of 3 to 5 uppercase letters, outside page headers/footers
+    # and the references section.
+    return list(scan_candidates(doc, progress_callback, layout)["abbreviations"])
 
-    for page_idx, page in enumerate(doc):
-        if progress_callback:
-            progress_callback(page_idx, num_pages)
 
-        if ref_start_page is not None and page_idx >= ref_start_page:
-            continue
+_OCR_DPI = 200
 
-        blocks = page.get_text("dict")["blocks"]
-        page_width = page.rect.width
-        page_height = page.rect.height
 
-        for block_idx, block in enumerate(blocks):
-            if "lines" not in block:
-                continue
+def _latex_ocr_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("pix2tex")
+    except Exception:
+        return "unknown"
+
 
-            block_y0 = block["bbox"][1]
-            block_y1 = block["bbox"][3]
-            if block_y0 < 30 or block_y1 > page_height - 30:
+def _ocr_equations(doc: pymupdf.Document, equations: List[Tuple[dict, pymupdf.Rect]]) -> Dict[Tuple[int, int], str]:
+    """
+    OCR all equation crops of a document: {(page, block): latex}.
+
+    Crops are rendered up front and keyed by a hash of the pixmap samples,
+    DPI and pix2tex version. Identical crops are recognised once, cached results
+    come from the on-disk "latex_ocr" cache, and only the misses reach the model,
+    one crop per call (pix2tex resizes every image on its own and has no batched
+    entry point). The model is not loaded when everything hits.
+    """
+    if not equations:
+        return {}
+    cache = get_cache("latex_ocr")
+    version = _latex_ocr_version()
+
+    crops: Dict[str, pymupdf.Pixmap] = {}
+    keys_by_block: Dict[Tuple[int, int], str] = {}
+    for eq, rect in equations:
+        pix = doc[eq["page"]].get_pixmap(clip=rect, dpi=_OCR_DPI)
+        digest = hashlib.sha256(pix.samples)
+        digest.update(f"{pix.width}x{pix.height}x{pix.n}|{_OCR_DPI}|{version}".encode())
+        key = digest.hexdigest()
+        keys_by_block[(eq["page"], eq["block"])] = key
+        crops.setdefault(key, pix)
+
+    results: Dict[str, str] = {}
+    misses = []
+    for key in crops:
+        cached = cache.get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            misses.append(key)
+
+    latex_ocr_model = get_latex_ocr_model() if misses else None
+    if latex_ocr_model is not None:
+        for key in misses:
+            img = Image.open(io.BytesIO(crops[key].tobytes("png"))).convert("RGB")
+            try:
+                results[key] = latex_ocr_model(img)
+            except Exception:
                 continue
+            cache.set(key, results[key])
+
+    return {block: results[key] for block, key in keys_by_block.items() if key in results}
 
-            block_center = (block["bbox"][0] + block["bbox"][2]) / 2
-            column = 1 if block_center < page_width / 2 else 2
-            block_text = "".join(span["text"] for line in block["lines"] for span in line["spans"])
-
-            for line_idx, line in enumerate(block["lines"]):
-                for span in line["spans"]:
-                    text = span["text"]
-                    matches = list(re.finditer(pattern, text))
-
-                    for match in matches:
-                            abbs.append({
-                                "text": match.group(0),
-                                "page": page_idx,
-                                "column": column,
-                                "block": block_idx,
-                                "line": line_idx,
-                                "bbox": span["bbox"],
-                                "context": block_text,
-                            })
-
-    return abbs
-
-def find_symbols(doc: pymupdf.Document, progress_callback: Optional[callable] = None) -> List[dict]:
+
+def find_symbols(doc: pymupdf.Document, progress_callback: Optional[callable] = None, layout: Optional[DocumentLayout] = None) -> List[dict]:
     """
-    Finds mathematical symbols in the document using Unicode ranges and LatexOCR.
+    Finds mathematical symbols in the document using Unicode ranges, math fonts and LatexOCR.
+
+    Equation blocks are read from the text layer (see _font_math_latex); only
+    blocks it cannot describe, those with Type3 glyphs or with sub/superscripts
+    but no math-font text, are rendered and OCR'd.
     """
-    symbols = []
-    num_pages = len(doc)
+    candidates = scan_candidates(doc, progress_callback, layout)
+    return _merge_block_symbols(candidates["symbols"], _equation_symbols(doc, candidates["equations"]))
 
-    unicode_pattern = re.compile(r'[\u0370-\u03FF\u2200-\u22FF\u2A00-\u2AFF\u2070-\u209F]+')
-    latex_symbol_pattern = re.compile(r'\\[a-zA-Z]+|[a-zA-Z](?:_[a-zA-Z0-9]+|\^[a-zA-Z0-9]+)')
-
-    _LATEX_NON_SYMBOLS = {
-        '\\text', '\\begin', '\\end', '\\frac', '\\left', '\\right',
-        '\\mathbf', '\\mathrm', '\\mathcal', '\\mathit', '\\mathtt',
-        '\\quad', '\\qquad',
-        '\\tiny', '\\scriptsize', '\\footnotesize', '\\small', '\\normalsize',
-        '\\large', '\\Large', '\\LARGE', '\\huge', '\\Huge',
-        '\\displaystyle', '\\textstyle', '\\scriptstyle', '\\scriptscriptstyle',
-        '\\bf', '\\rm', '\\it', '\\sf', '\\tt', '\\boldmath', '\\cal',
-        '\\mathbb', '\\mathsf', '\\mathfrak',
-        '\\bigg', '\\Bigg', '\\Big', '\\big',
-        '\\bigl', '\\bigr', '\\Bigl', '\\Bigr', '\\biggl', '\\biggr',
-        '\\operatorname', '\\mbox', '\\hbox',
-        '\\underbrace', '\\overbrace', '\\stackrel', '\\underset', '\\overset',
-        '\\bar', '\\hat', '\\tilde', '\\vec', '\\dot', '\\ddot',
-        '\\overline', '\\underline', '\\widehat', '\\widetilde',
-        '\\strut', '\\phantom',
-    }
-
-    _VALID_UPPERCASE_LATEX = {
-        '\\Gamma', '\\Delta', '\\Theta', '\\Lambda', '\\Xi', '\\Pi',
-        '\\Sigma', '\\Upsilon', '\\Phi', '\\Psi', '\\Omega',
-        '\\Alpha', '\\Beta', '\\Epsilon', '\\Zeta', '\\Eta',
-        '\\Iota', '\\Kappa', '\\Mu', '\\Nu', '\\Rho', '\\Tau', '\\Chi',
-    }
-
-    _COMMON_SYMBOLS = {
-        '=', '+', '-', '*', '/', '%', '^', '&', '|', '~', '!', '>', '<', '≥', '≤', '≈', '≠', '±', '×', '÷',
-        '(', ')', '[', ']', '{', '}', ',', '.', ';', ':', '?', '!', '°',
-        '∞', '∝', '∂', '∑', '√', '∝', '∞',
-        '∘', '∙', '∧', '∨', '∩', '∪', '∫', '∴', '∵', '∼', '≡', '≪', '≫', '⊖', '⊗', '⊘', '⊙', '⊥', '⊢', '⊣', '⊤',
-        '¬', '∏', '∑', '−', '∕', '∗', '∙', '√', '∝', '∞',
-        '∠', '∨', '∪', '∫', '∬', '∭', '∮', '∯', '∰', '∱', '∲', '∳',
-        # LaTeX versions
-        '\\ge', '\\le', '\\neq', '\\approx', '\\pm', '\\mp', '\\times', '\\div',
-        '\\infty', '\\propto', '\\partial', '\\nabla', '\\in', '\\notin', '\\ni',
-        '\\prod', '\\sum', '\\sqrt', '\\int', '\\oint', '\\forall', '\\exists',
-        '\\emptyset', '\\Delta', '\\nabla', '\\to', '\\leftarrow', '\\rightarrow',
-        '\\leftrightarrow', '\\uparrow', '\\downarrow', '\\langle', '\\rangle',
-        '\\cdot', '\\cdots', '\\vdots', '\\ddots', '\\quad', '\\qquad', '\\text',
-    }
+
+def _equation_symbols(doc: pymupdf.Document, equations: List[dict]) -> Dict[Tuple[int, int], List[dict]]:
+    """Symbols of each equation block, {(page, block): [symbol]}, from its math-font text or LatexOCR."""
     import logging
     logging.getLogger('pix2tex').setLevel(logging.ERROR)
     logging.getLogger('PIL').setLevel(logging.ERROR)
 
-    for page_idx, page in enumerate(doc):
-        if progress_callback:
-            progress_callback(page_idx, num_pages)
-        
-        blocks = page.get_text("dict")["blocks"]
-        page_width = page.rect.width
-        
-        for block_idx, block in enumerate(blocks):
-            if "lines" not in block:
-                continue
-            
-            block_center = (block["bbox"][0] + block["bbox"][2]) / 2
-            column = 1 if block_center < page_width / 2 else 2
-            
-            block_text = "".join(span["text"] for line in block["lines"] for span in line["spans"])
-            
-            def _get_symbol_context(text: str, index: int, word_margin: int = 100) -> str:
-                if index < 0:
-                    return text[:1200]
-                
-                before = text[:index]
-                after = text[index:]
-                
-                words_before = before.split()
-                words_after = after.split()
-                
-                selected_before = " ".join(words_before[-word_margin:])
-                selected_after = " ".join(words_after[:word_margin])
-                
-                return (selected_before + " " + selected_after).strip()
+    latex_by_block: Dict[Tuple[int, int], Tuple[str, str]] = {}
+    to_ocr = []
+    for eq in equations:
+        if eq.get("font_latex") is not None:
+            latex_by_block[(eq["page"], eq["block"])] = (eq["font_latex"], "font")
+            continue
+        rect = pymupdf.Rect(eq["bbox"])
+        if rect.width > 10 and rect.height > 10:
+            to_ocr.append((eq, rect))
 
-            words = [w for w in block_text.split() if w.isalpha()]
-            is_equation = False
-            
-            # Avoid likely bibliography, author blocks, or pure citation/list blocks
-            has_year = bool(re.search(r'\b(?:19|20)\d{2}\b', block_text))
-            is_author_list = (
-                re.search(r'\bet\s+al\.?', block_text, re.I)
-                or block_text.count(",") > 4
-                or has_year
-            )
-            
-            # Pure citation/list blocks like "[1] Text..." or "1. Text..."
-            is_list_item = bool(re.match(r'^\s*(?:\[\d+\]|\d+[\.\)])\s+', block_text))
-
-            if not is_author_list and not is_list_item and len(words) < 12:
-                # Require unambiguous math signals: = or sub/superscripts
-                has_math_op = any(c in block_text for c in "=<>/±∑∏√")
-                has_sub_super = any(c in block_text for c in "_^")
-                has_brackets = any(c in block_text for c in "[]{}|") 
-                
-                # Equation must have at least two math-like signals or be very sparse
-                if (has_math_op and (has_sub_super or has_brackets)) or block_text.count('=') >= 1:
-                    is_equation = True
-                elif len(words) < 5 and any(c.isdigit() for c in block_text) and (has_math_op or has_sub_super):
-                    is_equation = True
-            
-            if is_equation and latex_ocr_model is not None:
-                rect = pymupdf.Rect(block["bbox"])
-                if rect.width > 10 and rect.height > 10:
-                    pix = page.get_pixmap(clip=rect, dpi=200)
-                    img_bytes = pix.tobytes("png")
-                    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                    
-                    try:
-                        latex_text = latex_ocr_model(img)
-                        found_latex_symbols = latex_symbol_pattern.findall(latex_text)
-                        for sys_match in set(found_latex_symbols):
-                            if len(sys_match) == 1 and sys_match.isalpha():
-                                continue
-                            if sys_match in _LATEX_NON_SYMBOLS or sys_match in _COMMON_SYMBOLS:
-                                continue
-                            
-                            cmd_name = sys_match[1:] if sys_match.startswith('\\') else sys_match
-                            if len(cmd_name) > 15:
-                                continue
-                            if any(c in sys_match for c in ')]}>'):
-                                continue
-                            if sys_match.startswith('\\') and cmd_name[:1].isupper() and sys_match not in _VALID_UPPERCASE_LATEX:
-                                continue
-                            
-                            symbols.append({
-                                "text": sys_match,
-                                "page": page_idx,
-                                "column": column,
-                                "block": block_idx,
-                                "bbox": block["bbox"],
-                                "context": _get_symbol_context(block_text, block_text.find(sys_match)),
-                                "source": "ocr"
-                            })
-                    except Exception as e:
-                        pass
-
-            current_offset = 0
-            for line_idx, line in enumerate(block["lines"]):
-                for span in line["spans"]:
-                    text = span["text"]
-                    matches = list(unicode_pattern.finditer(text))
-                    
-                    if matches:
-                        for match in matches:
-                            sym_text = match.group(0).strip()
-                            if sym_text and sym_text not in _COMMON_SYMBOLS:
-                                symbols.append({
-                                    "text": sym_text,
-                                    "page": page_idx,
-                                    "column": column,
-                                    "block": block_idx,
-                                    "line": line_idx,
-                                    "bbox": span["bbox"],
-                                    "context": _get_symbol_context(block_text, current_offset + match.start()),
-                                    "source": "unicode"
-                                })
-                    current_offset += len(text)
-
-    return symbols
\ No newline at end of file
+    for block, latex_text in _ocr_equations(doc, to_ocr).items():
+        latex_by_block[block] = (latex_text, "ocr")
+
+    ocr_symbols: Dict[Tuple[int, int], List[dict]] = {}
+    for eq in equations:
+        found = latex_by_block.get((eq["page"], eq["block"]))
+        if found is None:
+            continue
+        latex_text, source = found
+        ocr_symbols[(eq["page"], eq["block"])] = [{
+            "text": sys_match,
+            "page": eq["page"],
+            "column": eq["column"],
+            "block": eq["block"],
+            "bbox": eq["bbox"],
+            "context": _symbol_context(eq["block_text"], eq["block_text"].find(sys_match)),
+            "source": source
+        } for sys_match in _filter_latex_symbols(latex_text)]
+    return ocr_symbols
+
+
+def iter_page_candidates(doc: pymupdf.Document, layout: Optional[DocumentLayout] = None, symbols: bool = True):
+    """
+    Yield (page_idx, candidates) one page at a time, so callers can start on
+    a page's terms before the rest of the document is scanned.
+
+    Each page's candidates hold "references", "abbreviations" and, with
+    `symbols`, "symbols" as find_symbols returns them (equation blocks read
+    from math fonts or OCR'd page by page). Concatenated over the pages they
+    equal the whole-document results. The full scan is memoized like
+    scan_candidates once the last page is yielded; an existing memoized scan
+    is replayed instead of scanning again.
+    """
+    layout = get_layout(doc, layout)
+    if layout.memoized("candidates"):
+        by_page = {page_idx: _empty_candidates() for page_idx in range(len(doc))}
+        for key, items in scan_candidates(doc, layout=layout).items():
+            for item in items:
+                by_page[item["page"]][key].append(item)
+        pages = ((page_idx, by_page[page_idx]) for page_idx in range(len(doc)))
+    else:
+        ref_range = find_references_range(doc, layout)
+        pages = ((page_idx, _scan_page(layout, page_idx, ref_range)) for page_idx in range(len(doc)))
+
+    merged = _empty_candidates()
+    for page_idx, found in pages:
+        for key, items in found.items():
+            merged[key].extend(items)
+        page_symbols = []
+        if symbols:
+            page_symbols = _merge_block_symbols(found["symbols"], _equation_symbols(doc, found["equations"]))
+        yield page_idx, {
+            "references": found["references"],
+            "abbreviations": found["abbreviations"],
+            "symbols": page_symbols,
+        }
+    layout.memo("candidates", lambda: merged)
+
+
+def _merge_block_symbols(unicode_symbols: List[dict], ocr_symbols: Dict[Tuple[int, int], List[dict]]) -> List[dict]:
+    """Interleave OCR/font symbols ahead of the Unicode symbols of the same block."""
+    if not ocr_symbols:
+        return list(unicode_symbols)
+    pending = sorted(ocr_symbols)
+    merged = []
+    i = 0
+    for sym in unicode_symbols:
+        key = (sym["page"], sym["block"])
+        while i < len(pending) and pending[i] <= key:
+            merged.extend(ocr_symbols[pending[i]])
+            i += 1
+        merged.append(sym)
+    for rest in pending[i:]:
+        merged.extend(ocr_symbols[rest])
+    return merged
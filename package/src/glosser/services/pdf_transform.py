@@ -11,6 +11,7 @@ except ImportError:
     LatexNodes2Text = None
 
 from .visual_design import ConfidenceVisualizer, TypographyOptimizer, LayoutOptimizer
+from .layout import DocumentLayout
 
 _unicode_font_path = None
 _unicode_font_checked = False
@@ -67,8 +68,8 @@ def get_unicode_font_path():
 
     return None
 
-def get_page_content_bbox(page: pymupdf.Page, padding=0) -> pymupdf.Rect:
-    blocks = page.get_text("blocks")
+def get_page_content_bbox(page: pymupdf.Page, padding=0, layout: DocumentLayout = None) -> pymupdf.Rect:
+    blocks = layout.text_blocks(page.number) if layout is not None else page.get_text("blocks")
     if not blocks:
         return page.cropbox
 
@@ -82,11 +83,12 @@ def get_page_content_bbox(page: pymupdf.Page, padding=0) -> pymupdf.Rect:
     return pymupdf.Rect(x0 - padding, y0, x1 + padding, y1)
 
 
-def scale_content_horizontally(doc: pymupdf.Document, scaling_factor: float, progress_callback: callable = None) -> tuple[pymupdf.Document, list]:
+def scale_content_horizontally(doc: pymupdf.Document, scaling_factor: float, progress_callback: callable = None, layout: DocumentLayout = None) -> tuple[pymupdf.Document, list]:
     """
       - increase the page width by `scaling_factor`.
       - Place original content unscaled and centered horizontally on the wider page.
       - Return the new document and a list of the content bboxes adjusted to the new page coordinates.
+      - `layout` (optional) is the shared text layout of `doc`, reused for the content bboxes.
     """
     if scaling_factor <= 0:
         raise ValueError("scaling_factor must be positive.")
@@ -110,7 +112,7 @@ def scale_content_horizontally(doc: pymupdf.Document, scaling_factor: float, pro
 
         new_page.show_pdf_page(dest_rect, doc, source_page.number)
 
-        content_bbox = get_page_content_bbox(source_page)
+        content_bbox = get_page_content_bbox(source_page, layout=layout)
         shifted_bbox = pymupdf.Rect(
             content_bbox.x0 + x_offset,
             content_bbox.y0,
@@ -0,0 +1,95 @@
+import math
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+RETRIEVER_BACKENDS = ("dense", "bm25", "hybrid", "occurrence")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; abbreviations like ``TSGAN`` stay single tokens."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts, built with plain Python and NumPy.
+
+    The inverted index maps each term to parallel arrays of document ids and
+    term frequencies, so a query only touches the postings of its own terms.
+    Building it for a paper's few hundred chunks takes milliseconds and needs
+    no model.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        avg_length = float(lengths.mean()) if self.size else 0.0
+        # Per-document length normalisation, precomputed once
+        self._norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(self.size, k1, dtype=np.float32)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, counts in postings.items():
+            ids = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            df = len(counts)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self._postings[term] = (ids, tfs, idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, score) pairs with a positive score, best first."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search_many(self, queries: Sequence[str], k: int) -> List[List[Tuple[int, float]]]:
+        return [self.search(q, k) for q in queries]
+
+
+def hybrid_rerank(
+    candidates: List[int],
+    query_vector: np.ndarray,
+    doc_vectors: np.ndarray,
+    k: int,
+) -> List[int]:
+    """
+    Second stage of hybrid retrieval: order lexical candidates by L2 distance
+    between the query embedding and their (already indexed) chunk embeddings.
+    """
+    if not candidates:
+        return []
+    distances = ((doc_vectors - query_vector) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return [candidates[i] for i in order]
+
+
+def resolve_backend(backend: Optional[str], default: str = "dense") -> str:
+    backend = (backend or default).lower()
+    if backend not in RETRIEVER_BACKENDS:
+        raise ValueError(f"Unknown retriever backend '{backend}' (expected one of {', '.join(RETRIEVER_BACKENDS)})")
+    return backend
@@ -0,0 +1,332 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for model calls that backs off when latency climbs.
+
+    Up to `limit` calls run at once. Each call's latency feeds a fast and a
+    slow moving average; when the fast one exceeds `backoff_ratio` times the
+    slow one (the backend is queueing) or a call fails, the limit is halved.
+    After `limit` calls in a row without trouble it grows by one again, up to
+    `max_limit` (additive increase, multiplicative decrease). At most one
+    back-off happens per `limit` completions, so a burst of slow calls that
+    were already in flight is not counted several times.
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 4,
+        min_limit: int = 1,
+        initial: Optional[int] = None,
+        backoff_ratio: float = 2.0,
+        fast_alpha: float = 0.5,
+        slow_alpha: float = 0.05,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = max(self.min_limit, min(initial or self.max_limit, self.max_limit))
+        self.backoff_ratio = backoff_ratio
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.fast_latency: Optional[float] = None
+        self.slow_latency: Optional[float] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.backoffs = 0
+        self._streak = 0
+        self._since_backoff = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Created on first use so the limiter can be built outside a running loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self) -> float:
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    async def release(self, started: float, ok: bool = True) -> None:
+        latency = time.perf_counter() - started
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            self.calls += 1
+            self._record(latency, ok)
+            cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        started = await self.acquire()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            await self.release(started, ok)
+
+    def _record(self, latency: float, ok: bool) -> None:
+        if ok:
+            if self.fast_latency is None:
+                self.fast_latency = self.slow_latency = latency
+            else:
+                self.fast_latency += self.fast_alpha * (latency - self.fast_latency)
+                self.slow_latency += self.slow_alpha * (latency - self.slow_latency)
+        self._since_backoff += 1
+
+        congested = not ok or (
+            self.slow_latency and self.fast_latency > self.backoff_ratio * self.slow_latency
+        )
+        if congested:
+            self._streak = 0
+            if self._since_backoff >= self.limit and self.limit > self.min_limit:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.backoffs += 1
+                self._since_backoff = 0
+            return
+
+        self._streak += 1
+        if self._streak >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._streak = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "max_limit": self.max_limit,
+            "peak_in_flight": self.peak_in_flight,
+            "calls": self.calls,
+            "backoffs": self.backoffs,
+            "latency_seconds": round(self.fast_latency or 0.0, 3),
+        }
+
+
+async def gather_limited(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    on_done: Optional[Callable[[int, int], None]] = None,
+) -> List[R]:
+    """
+    Run `fn` over `items` concurrently and return the results in item order.
+
+    Concurrency is bounded by whatever limiter `fn` uses internally;
+    `on_done(done, total)` is called as each item completes.
+    """
+    items = list(items)
+    done = 0
+
+    async def _run(item: T) -> R:
+        nonlocal done
+        result = await fn(item)
+        done += 1
+        if on_done:
+            on_done(done, len(items))
+        return result
+
+    return list(await asyncio.gather(*(_run(item) for item in items)))
+
+
+def approx_tokens(text: str) -> int:
+    """Rough LLM token count: whitespace tokens are about 1.3 model tokens each."""
+    return int(len(text.split()) * 1.3)
+
+
+class BatchController:
+    """
+    Picks how many terms go into one batched LLM call.
+
+    The size starts at `initial` and grows by one after each call that parses
+    and finishes within `target_seconds`, as long as the recent parse-failure
+    rate is below `max_failure_rate`. A parse failure halves it, a slow call
+    scales it down towards the target, and the measured prompt tokens per term
+    cap it so a batch stays within `max_prompt_tokens`.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_size: int = 1,
+        max_size: int = 16,
+        target_seconds: float = 30.0,
+        max_prompt_tokens: int = 2048,
+        max_failure_rate: float = 0.25,
+        alpha: float = 0.3,
+    ):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = max(self.min_size, min(initial, self.max_size))
+        self.target_seconds = target_seconds
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_failure_rate = max_failure_rate
+        self.alpha = alpha
+        self.tokens_per_item: Optional[float] = None
+        self.seconds_per_call: Optional[float] = None
+        self.failure_rate = 0.0
+        self.sizes: List[int] = []
+        self.parse_failures = 0
+        self.bisections = 0
+        self.single_fallbacks = 0
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.alpha * (value - current)
+
+    def next_size(self) -> int:
+        size = self.size
+        if self.tokens_per_item:
+            size = min(size, int(self.max_prompt_tokens // self.tokens_per_item))
+        return max(self.min_size, min(size, self.max_size))
+
+    def observe_prompt(self, tokens: int, items: int) -> None:
+        if items:
+            self.tokens_per_item = self._ewma(self.tokens_per_item, tokens / items)
+
+    def record(self, items: int, seconds: float, ok: bool) -> None:
+        self.sizes.append(items)
+        self.failure_rate = self._ewma(self.failure_rate, 0.0 if ok else 1.0)
+        if not ok:
+            self.parse_failures += 1
+            self.size = max(self.min_size, min(self.size, items // 2))
+            return
+
+        self.seconds_per_call = self._ewma(self.seconds_per_call, seconds)
+        if seconds > self.target_seconds:
+            self.size = max(self.min_size, min(self.size, int(items * self.target_seconds / seconds)))
+        elif self.failure_rate < self.max_failure_rate and items >= self.size:
+            self.size = min(self.max_size, self.size + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": len(self.sizes),
+            "sizes": self.sizes,
+            "final_size": self.next_size(),
+            "parse_failures": self.parse_failures,
+            "bisections": self.bisections,
+            "single_fallbacks": self.single_fallbacks,
+            "tokens_per_item": round(self.tokens_per_item or 0.0, 1),
+            "seconds_per_call": round(self.seconds_per_call or 0.0, 3),
+        }
+
+
+class _BatchQueue:
+    """
+    Work list for the batch runners: fresh items are sliced off at the
+    controller's current size, and the halves of a failed batch (or of the
+    items missing from a partial result) are retried before any fresh item.
+    """
+
+    def __init__(self, items: Sequence[Hashable], controller: BatchController):
+        self.fresh = deque(items)
+        self.retry: deque = deque()
+        self.controller = controller
+        self.total = len(self.fresh)
+        self.done = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.fresh or self.retry)
+
+    def next_batch(self) -> list:
+        if self.retry:
+            return self.retry.popleft()
+        size = min(self.controller.next_size(), len(self.fresh))
+        return [self.fresh.popleft() for _ in range(size)]
+
+    def finish(self, batch: list, results: Optional[dict], seconds: float) -> Optional[Hashable]:
+        """
+        Record one call; returns the item to resolve singly when exactly one
+        item failed. Items missing from `results` (all of them when it is
+        None) count as failed: a call that left any out is a failure.
+        """
+        failed = [item for item in batch if not isinstance(results, dict) or item not in results]
+        self.controller.record(len(batch), seconds, not failed)
+        self.done += len(batch) - len(failed)
+        if not failed:
+            return None
+        if len(failed) == 1:
+            self.controller.single_fallbacks += 1
+            self.done += 1
+            return failed[0]
+        self.controller.bisections += 1
+        mid = len(failed) // 2
+        self.retry.appendleft(failed[mid:])
+        self.retry.appendleft(failed[:mid])
+        return None
+
+
+def run_batches_sync(
+    items: Sequence[Hashable],
+    call: Callable[[list], dict],
+    fallback: Callable[[Hashable], Any],
+    controller: BatchController,
+) -> dict:
+    """
+    Resolve `items` with batched `call`s sized by `controller`.
+
+    `call(batch)` returns {item: result} for the items it resolved, or raises
+    when the response cannot be parsed. The failed items of a batch (those
+    missing from its result) are split in half and retried, and an item that
+    still fails on its own goes to `fallback(item)`.
+    """
+    queue = _BatchQueue(items, controller)
+    results: dict = {}
+    while queue:
+        batch = queue.next_batch()
+        t0 = time.perf_counter()
+        try:
+            out = call(batch)
+        except Exception:
+            out = None
+        single = queue.finish(batch, out, time.perf_counter() - t0)
+        if isinstance(out, dict):
+            results.update((item, out[item]) for item in batch if item in out)
+        if single is not None:
+            results[single] = fallback(single)
+    return results
+
+
+async def run_batches(
+    items: Sequence[Hashable],
+    call: Callable[[list], Awaitable[dict]],
+    fallback: Callable[[Hashable], Awaitable[Any]],
+    controller: BatchController,
+    workers: int = 1,
+    on_done: Optional[Callable[[int, int], None]] = None,
+) -> dict:
+    """
+    Async `run_batches_sync`: `workers` batches are in flight at once, each
+    sized when it is sent. `on_done(done, total)` reports resolved items.
+    """
+    queue = _BatchQueue(items, controller)
+    results: dict = {}
+
+    async def _worker():
+        while queue:
+            batch = queue.next_batch()
+            t0 = time.perf_counter()
+            try:
+                out = await call(batch)
+            except Exception:
+                out = None
+            single = queue.finish(batch, out, time.perf_counter() - t0)
+            if isinstance(out, dict):
+                results.update((item, out[item]) for item in batch if item in out)
+            if single is not None:
+                results[single] = await fallback(single)
+            if on_done:
+                on_done(queue.done, queue.total)
+
+    await asyncio.gather(*(_worker() for _ in range(max(1, workers))))
+    return results
@@ -0,0 +1,188 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# JSON schemas passed to Ollama as `format`; the Groq path uses JSON mode,
+# which guarantees an object but not its keys.
+FULL_FORM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "full_form": {"type": "string"},
+        "source": {"type": "string", "enum": ["extracted", "inferred"]},
+    },
+    "required": ["full_form", "source"],
+}
+SYMBOL_MEANING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "meaning": {"type": "string"},
+        "description": {"type": "string"},
+        "source": {"type": "string", "enum": ["extracted", "inferred"]},
+    },
+    "required": ["meaning", "description", "source"],
+}
+CRITIQUE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "confidence": {"type": "string", "enum": ["HIGH", "MEDIUM", "LOW"]},
+        "reason": {"type": "string"},
+    },
+    "required": ["confidence", "reason"],
+}
+REFERENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "year": {"type": "string"},
+    },
+    "required": ["title", "year"],
+}
+# Batch responses are keyed by term, so only "some JSON object" can be enforced.
+JSON_OBJECT = "json"
+
+
+class JsonObjectScanner:
+    """
+    Finds the first top-level JSON object in text that arrives in pieces.
+
+    `feed` returns the object's text as soon as its closing brace is seen
+    (prose or code fences around it are skipped), otherwise None. Until then
+    `partial` holds what has been read of the object so far.
+    """
+
+    def __init__(self):
+        self._chars: List[str] = []
+        self.stack: List[str] = []
+        self.in_string = False
+        self._escape = False
+        self.result: Optional[str] = None
+
+    @property
+    def started(self) -> bool:
+        return bool(self._chars)
+
+    @property
+    def partial(self) -> str:
+        return "".join(self._chars)
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.result is not None:
+            return self.result
+        for ch in chunk:
+            if not self._chars:
+                if ch != "{":
+                    continue
+            self._chars.append(ch)
+            if self.in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.stack.append(ch)
+            elif ch in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.result = self.partial
+                    return self.result
+        return None
+
+
+def _close(text: str) -> Optional[str]:
+    """
+    `text` (the start of an object) with its open brackets closed, or None
+    when it ends inside a string or before a value: a cut-off member must
+    not pass for a complete one.
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    tail = text.rstrip()
+    if scanner.in_string or tail.endswith(":"):
+        return None
+    if tail.endswith(","):
+        tail = tail[:-1]
+    return tail + "".join("}" if c == "{" else "]" for c in reversed(scanner.stack))
+
+
+def _repair(partial: str) -> Optional[Any]:
+    # Close the cut-off object; while its last member is incomplete, drop it and retry
+    text = partial
+    while text:
+        closed = _close(text)
+        if closed is not None:
+            try:
+                return json.loads(closed)
+            except ValueError:
+                pass
+        cut = text.rfind(",")
+        if cut <= 0:
+            return None
+        text = text[:cut]
+    return None
+
+
+def extract_json_object(text: str) -> Tuple[Optional[dict], bool]:
+    """
+    First JSON object in a model response, and whether it had to be repaired.
+
+    Code fences and prose around the object are ignored. An object that was
+    cut off (a token cap, a stopped stream) is closed so the members already
+    complete survive; the member being written is dropped. Returns
+    (None, False) when nothing can be recovered.
+    """
+    scanner = JsonObjectScanner()
+    complete = scanner.feed(text)
+    if complete is not None:
+        try:
+            parsed = json.loads(complete)
+            if isinstance(parsed, dict):
+                return parsed, False
+        except ValueError:
+            pass
+    if scanner.started:
+        repaired = _repair(scanner.partial if complete is None else complete[:-1])
+        if isinstance(repaired, dict):
+            return repaired, True
+    return None, False
+
+
+_parse_counts: Dict[str, Dict[str, int]] = {}
+_parse_lock = threading.Lock()
+
+
+def parse_json_object(helper: str, text: str) -> Tuple[Optional[dict], bool]:
+    """`extract_json_object`, counting the outcome under `helper` (see `parse_stats`)."""
+    parsed, repaired = extract_json_object(text)
+    with _parse_lock:
+        counts = _parse_counts.setdefault(helper, {"calls": 0, "failures": 0, "repaired": 0})
+        counts["calls"] += 1
+        counts["failures"] += parsed is None
+        counts["repaired"] += repaired
+    return parsed, repaired
+
+
+def parse_json(helper: str, text: str) -> Optional[dict]:
+    """`parse_json_object` without the repaired flag."""
+    return parse_json_object(helper, text)[0]
+
+
+def parse_stats() -> Dict[str, Dict[str, int]]:
+    """Process-wide response parse counters per helper: calls, failures, repaired."""
+    with _parse_lock:
+        return {helper: dict(counts) for helper, counts in _parse_counts.items()}
+
+
+def parse_stats_delta(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]) -> Dict[str, dict]:
+    """Per-run parse counters from two `parse_stats()` snapshots, with each helper's failure rate."""
+    run = {}
+    for helper, counts in after.items():
+        delta = {k: v - before.get(helper, {}).get(k, 0) for k, v in counts.items()}
+        if delta["calls"]:
+            delta["failure_rate"] = round(delta["failures"] / delta["calls"], 3)
+            run[helper] = delta
+    return run
@@ -20,8 +20,6 @@ from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeEl
 from rich.text import Text
 from rich import print as rprint
 
-from .main import annotate
-
 console = Console()
 CONFIG_FILE = Path.home() / ".glosser_config"
 
@@ -41,8 +39,10 @@ def load_api_key() -> str | None:
 
 
 STEPS = [
+    "Scanning pages",
     "Scaling PDF pages",
     "Building references database",
+    "Resolving references",
     "Annotating references",
     "Scanning for abbreviations",
     "Looking up full forms",
@@ -67,6 +67,9 @@ def make_progress() -> Progress:
 
 
 async def async_main(args) -> None:
+    # Imported here so `glosser --help` does not load the pipeline and its models.
+    from .main import annotate
+
     console.print(
         Panel.fit(
             "[bold white]glosser[/bold white]  [dim]: research paper annotator[/dim]\n"
@@ -138,6 +141,16 @@ async def async_main(args) -> None:
                 GROQ_API_KEY=groq_api_key,
                 use_local_llm=use_local_llm,
                 progress_callback=on_progress,
+                parse_workers=args.workers,
+                symbol_context=args.symbol_context,
+                llm_cache=False if args.no_llm_cache else None,
+                pipeline=args.pipeline,
+                resolve_workers=args.resolve_workers,
+                llm_concurrency=args.llm_concurrency,
+                batch_lookups=args.batch_lookups,
+                llm_stream=False if args.no_llm_stream else None,
+                document_session=args.document_session,
+                lazy_references=args.lazy_references,
             )
             if current_step[0]:
                 progress.update(task_ids[current_step[0]], completed=100, visible=True)
@@ -170,6 +183,22 @@ def main() -> None:
     llm_group.add_argument("--api", dest="local", action="store_false", help="Use remote LLM with API key")
     
     parser.add_argument("--api-key", type=str, help="API key to use (if not using local)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for page scanning (default: 1)")
+    parser.add_argument("--symbol-context", choices=["block", "occurrences"], default="block",
+                        help="Symbol prompt context: first-occurrence block or windows around several occurrences")
+    parser.add_argument("--no-llm-cache", action="store_true", help="Bypass the on-disk LLM response cache")
+    parser.add_argument("--no-llm-stream", action="store_true",
+                        help="Let the local model finish each response instead of stopping after its JSON answer")
+    parser.add_argument("--pipeline", action="store_true", help="Overlap scanning, lookups and rendering")
+    parser.add_argument("--resolve-workers", type=int, default=4, help="Concurrent lookups in --pipeline mode (default: 4)")
+    parser.add_argument("--llm-concurrency", type=int, default=4,
+                        help="Max concurrent LLM calls; backs off while latency climbs (default: 4)")
+    parser.add_argument("--batch-lookups", action="store_true",
+                        help="Resolve several symbols/abbreviations per LLM call, with adaptive batch sizes")
+    parser.add_argument("--document-session", action="store_true",
+                        help="Start local prompts with a shared document prefix so Ollama can reuse its prompt cache")
+    parser.add_argument("--lazy-references", action="store_true",
+                        help="Resolve only the bibliography entries that are cited, when first needed")
     
     args = parser.parse_args()
 
@@ -18,6 +18,7 @@ os.chdir(str(ROOT))
 import pymupdf
 from package.src.glosser.services.definitions import (
     extract_abbr_definitions_from_pdf,
+    get_abbr_definitions,
     find_full_form,
 )
 
@@ -103,7 +104,7 @@ def eval_regex(paper_key: str, pdf_path: Path) -> dict:
     gt_all     = {**gt_inline, **gt_used}
 
     t0 = time.perf_counter()
-    extracted = extract_abbr_definitions_from_pdf(str(pdf_path))
+    extracted = get_abbr_definitions(str(pdf_path))
     lat = time.perf_counter() - t0
 
     # Detection against inline GT only
@@ -144,7 +145,7 @@ def eval_glossvis_full(paper_key: str, pdf_path: Path) -> dict:
     gt_inline = PAPERS[paper_key]["inline"]
     gt_used   = PAPERS[paper_key]["used_only"]
 
-    extracted = extract_abbr_definitions_from_pdf(str(pdf_path))
+    extracted = get_abbr_definitions(str(pdf_path))
 
     results = {}
     confs, corrs = [], []
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Retriever comparison: dense (MiniLM + FAISS) vs BM25 vs hybrid vs occurrence windows
+
+For every abbreviation in ground_truth_all.json, checks whether the top-k
+chunks a backend retrieves contain the gold full form (the context the LLM
+would need), and times index build and query latency per paper.
+
+Hybrid re-ranks BM25's top _HYBRID_FIRST_STAGE_K chunks by embedding distance,
+so the BM25 rows also record hit@_HYBRID_FIRST_STAGE_K: the most hybrid can
+reach, measurable without the embedding model. Backends that cannot run
+(dense and hybrid without sentence-transformers or the MiniLM weights) are
+listed under "unavailable" with the error.
+"""
+
+import sys, os, json, time, re, statistics, traceback
+from pathlib import Path
+from typing import Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(str(ROOT))
+
+from package.src.glosser.services import definitions
+from package.src.glosser.services.retrieval import RETRIEVER_BACKENDS
+
+GT_PATH = ROOT / "test_data" / "ground_truth_all.json"
+RAW_GT  = json.loads(GT_PATH.read_text())
+PAPERS  = {k: v for k, v in RAW_GT.items() if k != "meta"}
+
+PDF_PATHS = {
+    "TSGAN (AAAI-25)":         ROOT / "test_data" / "TSGAN_Aggression_Forecasting.pdf",
+    "Transformer (NeurIPS-17)":ROOT / "test_data" / "attention_transformer.pdf",
+    "BERT (NAACL-19)":         ROOT / "test_data" / "bert.pdf",
+    "ViT (ICLR-21)":           ROOT / "test_data" / "vit.pdf",
+    "ResNet (CVPR-16)":        ROOT / "test_data" / "resnet.pdf",
+    "U-Net (MICCAI-15)":       ROOT / "test_data" / "unet.pdf",
+    "PPO (arXiv-17)":          ROOT / "test_data" / "ppo.pdf",
+    "GCN (ICLR-17)":           ROOT / "test_data" / "gcn.pdf",
+    "DDPM (NeurIPS-20)":       ROOT / "test_data" / "ddpm.pdf",
+    "Faster RCNN (NeurIPS-15)":ROOT / "test_data" / "faster_rcnn.pdf",
+    "Swin (ICCV-21)":          ROOT / "test_data" / "swin.pdf",
+    "EfficientNet (ICML-19)":  ROOT / "test_data" / "efficientnet.pdf",
+}
+
+K = 3  # same depth as find_full_form
+
+def normalize(t: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", t.lower()).split())
+
+def first_hit_rank(docs: list, gold: str) -> int:
+    """1-based rank of the first chunk containing the gold full form, 0 if none."""
+    g = normalize(gold)
+    for rank, d in enumerate(docs, 1):
+        if g in normalize(d.page_content):
+            return rank
+    return 0
+
+def gold_in_document(pdf_path: Path, gold: Dict[str, str]) -> float:
+    """Share of terms whose full form appears in some chunk at all (retrieval ceiling)."""
+    _, docs = definitions._document_bm25(str(pdf_path))
+    text = " ".join(normalize(d.page_content) for d in docs)
+    return sum(1 for g in gold.values() if normalize(g) in text) / len(gold)
+
+def bm25_index_ms(pdf_path: Path, runs: int = 5) -> float:
+    """BM25 build time alone, over already-extracted chunks."""
+    from package.src.glosser.services.retrieval import BM25Index
+    _, docs = definitions._document_bm25(str(pdf_path))
+    texts = [d.page_content for d in docs]
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        BM25Index(texts)
+    return (time.perf_counter() - t0) * 1000 / runs
+
+def first_stage_hit(pdf_path: Path, gold: Dict[str, str]) -> float:
+    """Share of terms whose gold full form is in BM25's hybrid candidate set."""
+    index, docs = definitions._document_bm25(str(pdf_path))
+    hits = index.search_many(list(gold), definitions._HYBRID_FIRST_STAGE_K)
+    return sum(1 for a, found in zip(gold, hits) if first_hit_rank([docs[i] for i, _ in found], gold[a])) / len(gold)
+
+def eval_backend(backend: str, pdf_path: Path, gold: Dict[str, str]) -> dict:
+    abbrs = list(gold)
+    t0 = time.perf_counter()
+    # Build (or load) the index with a throwaway query so query timing excludes it
+    definitions.retrieve_term_contexts(abbrs[:1], str(pdf_path), definitions._abbr_query, K, backend=backend)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    retrieved = definitions.retrieve_term_contexts(abbrs, str(pdf_path), definitions._abbr_query, K, backend=backend)
+    query_ms = (time.perf_counter() - t0) * 1000
+    if retrieved is None:
+        raise RuntimeError("no vector store")
+
+    ranks = [first_hit_rank(docs, gold[a]) for a, docs in zip(abbrs, retrieved)]
+    return {
+        "hit_at_k": sum(1 for r in ranks if r) / len(ranks),
+        "mrr": sum(1 / r for r in ranks if r) / len(ranks),
+        "build_ms": build_ms,
+        "query_ms_per_term": query_ms / len(abbrs),
+        "n_terms": len(abbrs),
+        "misses": [a for a, r in zip(abbrs, ranks) if not r],
+    }
+
+def run_comparison() -> dict:
+    results = {"k": K, "first_stage_k": definitions._HYBRID_FIRST_STAGE_K, "papers": {}, "summary": {}, "unavailable": {}}
+    for key, path in PDF_PATHS.items():
+        if not path.exists():
+            continue
+        gold = {**PAPERS[key]["inline"], **PAPERS[key]["used_only"]}
+        results["papers"][key] = {}
+        for backend in RETRIEVER_BACKENDS:
+            if backend in results["unavailable"]:
+                continue
+            try:
+                r = eval_backend(backend, path, gold)
+            except Exception as e:
+                # e.g. sentence-transformers / torch (or the MiniLM weights) missing for dense+hybrid
+                results["unavailable"][backend] = f"{type(e).__name__}: {e}"
+                traceback.print_exc(limit=1)
+                continue
+            r["gold_in_document"] = gold_in_document(path, gold)
+            if backend == "bm25":
+                r["index_only_ms"] = bm25_index_ms(path)
+                r["first_stage_hit"] = first_stage_hit(path, gold)
+            results["papers"][key][backend] = r
+            print(f"  {key:28s} {backend:10s} hit@{K}={r['hit_at_k']:.3f}  MRR={r['mrr']:.3f}"
+                  f"  build={r['build_ms']:8.1f}ms  query={r['query_ms_per_term']:.2f}ms/term")
+
+    for backend in RETRIEVER_BACKENDS:
+        rows = [p[backend] for p in results["papers"].values() if backend in p]
+        if not rows:
+            continue
+        n = sum(r["n_terms"] for r in rows)
+        results["summary"][backend] = {
+            "hit_at_k": sum(r["hit_at_k"] * r["n_terms"] for r in rows) / n,
+            "mrr": sum(r["mrr"] * r["n_terms"] for r in rows) / n,
+            "gold_in_document": sum(r["gold_in_document"] * r["n_terms"] for r in rows) / n,
+            "build_ms_median": statistics.median(r["build_ms"] for r in rows),
+            "query_ms_per_term_median": statistics.median(r["query_ms_per_term"] for r in rows),
+            **({"first_stage_hit": sum(r["first_stage_hit"] * r["n_terms"] for r in rows) / n}
+               if backend == "bm25" else {}),
+            "papers": len(rows),
+            "terms": n,
+        }
+
+    out = ROOT / "test_data" / "retrieval_comparison.json"
+    with open(str(out), "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved → {out}")
+    return results
+
+
+if __name__ == "__main__":
+    res = run_comparison()
+    for backend, s in res["summary"].items():
+        print(f"{backend:10s} hit@{K}={s['hit_at_k']:.3f}  MRR={s['mrr']:.3f}  ceiling={s['gold_in_document']:.3f}  "
+              f"build={s['build_ms_median']:.1f}ms  query={s['query_ms_per_term_median']:.2f}ms/term")
+    for backend, err in res["unavailable"].items():
+        print(f"{backend:10s} unavailable: {err}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Document session comparison: prompt tokens the model evaluates per lookup,
+with and without the shared per-document prefix.
+
+Without a session each lookup sends one prompt: instructions, retrieved
+context, term. In a session the system message holds the document prefix
+and the lookup instructions, and the per-call tail only the term and the
+sentences that mention it (context.term_sentences).
+
+Runs annotate() on each paper twice (document_session off / on) against a
+stand-in for the local Ollama server. The stand-in models Ollama's prompt
+cache: it keeps the last prompt of each of NUM_PARALLEL slots, serves a
+request from the slot sharing the longest token prefix with it, and only
+counts the tokens after that shared prefix as evaluated (prompt_eval_count).
+prompt_tokens counts everything sent, evaluated or reused. Answers depend only
+on the term, so both runs must produce the same output.
+
+Tokens are whitespace tokens. Pass --live to call the real Ollama server
+instead and use the prompt_eval_count it reports.
+"""
+
+import sys, os, json, re, asyncio, tempfile, threading
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(str(ROOT))
+os.environ.setdefault("GLOSSER_RETRIEVER", "bm25")
+
+import ollama
+from package.src.glosser import main
+from package.src.glosser.services.context import DEFAULT_PREFIX_BUDGET, DEFAULT_TERM_CONTEXT_BUDGET
+
+PAPERS = {
+    "TSGAN (AAAI-25)":          ROOT / "test_data" / "TSGAN_Aggression_Forecasting.pdf",
+    "Transformer (NeurIPS-17)": ROOT / "test_data" / "attention_transformer.pdf",
+    "BERT (NAACL-19)":          ROOT / "test_data" / "bert.pdf",
+    "GCN (ICLR-17)":            ROOT / "test_data" / "gcn.pdf",
+    "PPO (arXiv-17)":           ROOT / "test_data" / "ppo.pdf",
+}
+NUM_PARALLEL = 4  # OLLAMA_NUM_PARALLEL: one prompt cache per slot
+LIVE = "--live" in sys.argv
+
+
+class PromptCacheStandIn:
+    """Fake ollama.chat / AsyncClient that accounts prompt tokens per slot."""
+
+    def __init__(self, slots: int):
+        self.slots = [[] for _ in range(slots)]
+        self.lock = threading.Lock()
+        self.calls = []  # (prompt_tokens, evaluated_tokens, keep_alive)
+
+    @staticmethod
+    def _answer(msg: str) -> str:
+        m = re.search(r"(Symbol|Abbreviation): (.*)\s*$", msg.strip())
+        if m is None:
+            return json.dumps({"title": "Some title", "year": "2019"})
+        if m.group(1) == "Symbol":
+            return json.dumps({"meaning": "m" + m.group(2), "description": "what it is", "source": "inferred"})
+        return json.dumps({"full_form": "Full " + m.group(2), "source": "inferred"})
+
+    def _evaluate(self, messages, keep_alive) -> int:
+        tokens = [t for m in messages for t in [f"<{m['role']}>"] + m["content"].split()]
+        with self.lock:
+            def shared(slot):
+                n = 0
+                for a, b in zip(slot, tokens):
+                    if a != b:
+                        break
+                    n += 1
+                return n
+            best = max(range(len(self.slots)), key=lambda i: shared(self.slots[i]))
+            evaluated = len(tokens) - shared(self.slots[best])
+            self.slots[best] = tokens
+            self.calls.append((len(tokens), evaluated, keep_alive))
+        return evaluated
+
+    def _response(self, messages, keep_alive):
+        evaluated = self._evaluate(messages, keep_alive)
+        text = self._answer(messages[-1]["content"])
+        return SimpleNamespace(message=SimpleNamespace(content=text), done=True,
+                               eval_count=len(text.split()), prompt_eval_count=evaluated)
+
+    def chat(self, model=None, messages=None, keep_alive=None, **kwargs):
+        return self._response(messages, keep_alive)
+
+    def client(self):
+        stand_in = self
+
+        class AsyncClient:
+            async def chat(self, model=None, messages=None, keep_alive=None, **kwargs):
+                return stand_in._response(messages, keep_alive)
+
+            async def close(self):
+                pass
+        return AsyncClient
+
+
+async def _annotate(pdf: Path, out: Path, session: bool):
+    return await main.annotate(
+        str(pdf), out_path=str(out), use_local_llm=True, find_references=False,
+        llm_cache=False, llm_stream=False, document_session=session,
+    )
+
+
+def run_paper(pdf: Path, session: bool, workdir: Path) -> dict:
+    stand_in = PromptCacheStandIn(NUM_PARALLEL)
+    if not LIVE:
+        ollama.chat = stand_in.chat
+        ollama.AsyncClient = stand_in.client()
+    out = workdir / f"{pdf.stem}_{'session' if session else 'plain'}.pdf"
+    _, processed, log = asyncio.run(_annotate(pdf, out, session))
+    tokens = log["llm_tokens"]
+    helpers = [h for h in ("find_symbol_meaning", "find_full_form") if h in tokens]
+    calls = sum(tokens[h]["calls"] for h in helpers)
+    evaluated = sum(tokens[h]["prompt_tokens"] for h in helpers)
+    row = {
+        "annotations": processed,
+        "calls": calls,
+        "prompt_eval_tokens": evaluated,
+        "prompt_eval_per_call": round(evaluated / calls, 1) if calls else 0.0,
+        "output": json.loads(out.with_suffix(".json").read_text()),
+    }
+    if session:
+        row["document_session"] = tokens.get("document_session")
+    if not LIVE and stand_in.calls:
+        prompt = sum(c[0] for c in stand_in.calls)
+        row["prompt_tokens"] = prompt
+        row["prompt_tokens_per_call"] = round(prompt / len(stand_in.calls), 1)
+        row["reused_share"] = round(1 - sum(c[1] for c in stand_in.calls) / prompt, 3)
+        row["keep_alive"] = sorted({str(c[2]) for c in stand_in.calls})
+    return row
+
+
+def main_():
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, pdf in PAPERS.items():
+            if not pdf.exists():
+                print(f"skip {name}: {pdf.name} missing")
+                continue
+            plain = run_paper(pdf, False, Path(tmp))
+            session = run_paper(pdf, True, Path(tmp))
+            same = plain.pop("output") == session.pop("output")
+            results[name] = {"plain": plain, "session": session, "same_output": same}
+            print(f"{name:26s} calls={plain['calls']:4d}  "
+                  f"prompt/call {plain.get('prompt_tokens_per_call', 0):6.1f} -> {session.get('prompt_tokens_per_call', 0):6.1f}  "
+                  f"evaluated/call {plain['prompt_eval_per_call']:6.1f} -> {session['prompt_eval_per_call']:6.1f}  "
+                  f"reused {session.get('reused_share', 0):.2f}  same_output={same}")
+
+    out = ROOT / "test_data" / "session_prefix_comparison.json"
+    out.write_text(json.dumps({
+        "meta": {
+            "backend": "ollama" if LIVE else "prompt-cache stand-in",
+            "num_parallel": NUM_PARALLEL,
+            "tokens": "reported by Ollama" if LIVE else "whitespace tokens",
+            "prefix_budget": DEFAULT_PREFIX_BUDGET,
+            "term_context_budget": DEFAULT_TERM_CONTEXT_BUDGET,
+        },
+        "papers": results,
+    }, indent=2))
+    print(f"wrote {out.relative_to(ROOT)}")
+
+
+if __name__ == "__main__":
+    main_()